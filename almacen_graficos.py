@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import plotly
+
+# Copia de plotly.js incluida en el paquete de Python: se sirve una sola vez como recurso estático
+RUTA_PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+
+PATRON_CLAVE = re.compile(r"[0-9a-f]{64}")
+
+# Versión del formato de las figuras: al cambiarla, las claves antiguas dejan de coincidir
+VERSION_FIGURA = b"2"
+
+PLANTILLA_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><script src="{url_plotly}"></script></head>
+<body style="margin:0"><div id="grafico" style="width:100%;height:100vh"></div>
+<script>
+fetch("{url_figura}").then(r => r.json()).then(f => Plotly.newPlot("grafico", f.data, f.layout, {{responsive: true}}));
+</script></body></html>
+"""
+
+
+class AlmacenGraficos:
+    """
+    Almacén de figuras en disco direccionado por contenido: cada figura se guarda como especificación
+    JSON de Plotly (con los arrays en binario) bajo el hash de los datos que representa.
+
+    Dos peticiones con la misma ventana de datos comparten el fichero, así que no hay carreras de
+    escritura ni trabajo repetido. Los ficheros se expulsan por antigüedad y por presupuesto de disco.
+    """
+
+    def __init__(self, directorio: str, max_edad: float, max_bytes: int, intervalo_purga: float = 60.0):
+        """
+        :param directorio: Carpeta de las figuras.
+        :param max_edad: Segundos desde el último uso tras los que se borra una figura.
+        :param max_bytes: Tamaño máximo que pueden ocupar todas las figuras.
+        :param intervalo_purga: Segundos mínimos entre dos purgas.
+        """
+        self.directorio = directorio
+        self.max_edad = max_edad
+        self.max_bytes = max_bytes
+        self.intervalo_purga = intervalo_purga
+        self._ultima_purga = 0.0
+        self._candado = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(*partes) -> str:
+        """
+        Calcula la clave de una figura a partir de los bytes de sus datos de entrada (bytes o
+        cualquier objeto con protocolo de buffer contiguo, como un array de NumPy, sin copiarlo).
+        """
+        h = hashlib.sha256(VERSION_FIGURA)
+        for parte in partes:
+            datos = memoryview(parte)
+            h.update(datos.nbytes.to_bytes(8, "little"))
+            h.update(datos)
+        return h.hexdigest()
+
+    def ruta(self, clave: str) -> str:
+        if not PATRON_CLAVE.fullmatch(clave):
+            raise ValueError(f"Clave de gráfico no válida: {clave!r}")
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def existe(self, clave: str) -> bool:
+        """
+        Indica si la figura ya está guardada y, si lo está, renueva su antigüedad.
+        """
+        if not PATRON_CLAVE.fullmatch(clave):
+            return False
+        try:
+            os.utime(self.ruta(clave))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def leer(self, clave: str) -> Optional[bytes]:
+        if not PATRON_CLAVE.fullmatch(clave):
+            return None
+        try:
+            with open(self.ruta(clave), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def guardar(self, clave: str, figura_json: str) -> None:
+        """
+        Guarda la especificación de la figura de forma atómica (fichero temporal y renombrado).
+        """
+        ruta = self.ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(figura_json)
+        os.replace(temporal, ruta)
+        self.purgar()
+
+    def purgar(self, forzar: bool = False) -> int:
+        """
+        Borra las figuras sin usar en `max_edad` segundos y, si aún se supera el presupuesto de disco,
+        las usadas hace más tiempo. Devuelve el número de ficheros borrados.
+        """
+        ahora = time.time()
+        with self._candado:
+            if not forzar and ahora - self._ultima_purga < self.intervalo_purga:
+                return 0
+            self._ultima_purga = ahora
+
+        ficheros = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith(".json"):
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                ficheros.append((info.st_mtime, info.st_size, entrada.path))
+        ficheros.sort()
+
+        total = sum(tamano for _, tamano, _ in ficheros)
+        borrados = 0
+        for modificado, tamano, ruta in ficheros:
+            if ahora - modificado <= self.max_edad and total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            borrados += 1
+        return borrados
+
+    def estadisticas(self) -> dict:
+        tamanos = [e.stat().st_size for e in os.scandir(self.directorio) if e.name.endswith(".json")]
+        return {"figuras": len(tamanos), "bytes": sum(tamanos)}
+
+
+def pagina_html(url_figura: str, url_plotly: str) -> str:
+    """
+    Página mínima que carga plotly.js desde `url_plotly` y dibuja la figura de `url_figura`.
+    """
+    return PLANTILLA_HTML.format(url_figura=url_figura, url_plotly=url_plotly)
+
+
+def crear_almacen_graficos() -> AlmacenGraficos:
+    """
+    Crea el almacén de figuras según las variables de entorno:
+    GRAFICOS_DIR, GRAFICOS_MAX_EDAD y GRAFICOS_MAX_BYTES.
+    """
+    return AlmacenGraficos(
+        os.getenv("GRAFICOS_DIR", "./temp/graficos"),
+        max_edad=float(os.getenv("GRAFICOS_MAX_EDAD", str(7 * 24 * 3600))),
+        max_bytes=int(os.getenv("GRAFICOS_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
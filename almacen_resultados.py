@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class AlmacenResultados:
+    """
+    Interfaz del almacén de reportes generados: diccionarios serializables en JSON indexados por ID,
+    con expulsión LRU, caducidad (TTL) y un presupuesto máximo de bytes.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        """
+        :param ttl: Segundos que un resultado sigue disponible desde que se guardó.
+        :param max_bytes: Tamaño máximo que pueden ocupar todos los resultados serializados.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def guardar(self, clave: str, valor: dict) -> None:
+        raise NotImplementedError
+
+    def estadisticas(self) -> dict:
+        raise NotImplementedError
+
+    def vaciar(self) -> None:
+        """
+        Borra todos los resultados guardados (los contadores se conservan).
+        """
+        raise NotImplementedError
+
+    def __contains__(self, clave: str) -> bool:
+        return self.obtener(clave) is not None
+
+
+class AlmacenMemoria(AlmacenResultados):
+    """
+    Almacén en memoria del proceso. Solo sirve con un único worker de uvicorn.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        super().__init__(ttl, max_bytes)
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (bytes, creado)
+        self._bytes = 0
+        self._contadores = {"aciertos": 0, "fallos": 0, "expulsiones": 0}
+        self._candado = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None or time.time() - entrada[1] > self.ttl:
+                if entrada is not None:
+                    self._quitar(clave)
+                self._contadores["fallos"] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._contadores["aciertos"] += 1
+        return json.loads(entrada[0])
+
+    def guardar(self, clave: str, valor: dict) -> None:
+        datos = json.dumps(valor).encode()
+        with self._candado:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (datos, time.time())
+            self._bytes += len(datos)
+            # Expulsar los menos usados recientemente hasta volver al presupuesto
+            while self._bytes > self.max_bytes and len(self._entradas) > 1:
+                self._quitar(next(iter(self._entradas)))
+                self._contadores["expulsiones"] += 1
+
+    def estadisticas(self) -> dict:
+        with self._candado:
+            return {**self._contadores, "entradas": len(self._entradas), "bytes": self._bytes}
+
+    def vaciar(self) -> None:
+        with self._candado:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def _quitar(self, clave: str) -> None:
+        datos, _ = self._entradas.pop(clave)
+        self._bytes -= len(datos)
+
+
+class AlmacenSQLite(AlmacenResultados):
+    """
+    Almacén compartido por todos los workers del mismo host: una base SQLite en modo WAL, que admite
+    lectores concurrentes con un escritor sin ningún servicio externo.
+
+    Las lecturas no escriben: los aciertos, los fallos y la hora de último acceso se acumulan en el
+    proceso y se vuelcan por lotes (al guardar, cada INTERVALO_VOLCADO segundos o al juntar
+    MAX_PENDIENTES accesos), así que el orden LRU entre procesos es aproximado.
+    """
+
+    INTERVALO_VOLCADO = 5.0
+    MAX_PENDIENTES = 256
+
+    def __init__(self, ruta: str, ttl: float, max_bytes: int):
+        super().__init__(ttl, max_bytes)
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._local = threading.local()
+        self._accesos: Dict[str, float] = {}  # clave -> último acceso aún sin volcar
+        self._pendientes = {"aciertos": 0, "fallos": 0}
+        self._ultimo_volcado = time.monotonic()
+        self._candado = threading.Lock()
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                "clave TEXT PRIMARY KEY, valor BLOB NOT NULL, tamano INTEGER NOT NULL, "
+                "creado REAL NOT NULL, accedido REAL NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_resultados_accedido ON resultados (accedido)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_resultados_creado ON resultados (creado)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            conexion.executemany(
+                "INSERT OR IGNORE INTO contadores VALUES (?, 0)",
+                [("aciertos",), ("fallos",), ("expulsiones",)],
+            )
+            # Total de bytes guardados, que se mantiene en cada escritura (se calcula una vez en bases antiguas)
+            conexion.execute(
+                "INSERT OR IGNORE INTO contadores SELECT 'bytes', COALESCE(SUM(tamano), 0) FROM resultados"
+            )
+
+    def _transaccion(self, inmediata: bool = True) -> "_Transaccion":
+        # sqlite3 no permite compartir una conexión entre hilos: una por hilo
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return _Transaccion(conexion, inmediata)
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        ahora = time.time()
+        with self._transaccion(inmediata=False) as conexion:
+            fila = conexion.execute(
+                "SELECT valor FROM resultados WHERE clave = ? AND creado >= ?", (clave, ahora - self.ttl)
+            ).fetchone()
+        with self._candado:
+            if fila is None:
+                self._pendientes["fallos"] += 1
+            else:
+                self._pendientes["aciertos"] += 1
+                self._accesos[clave] = ahora
+            volcar = (
+                len(self._accesos) >= self.MAX_PENDIENTES
+                or time.monotonic() - self._ultimo_volcado >= self.INTERVALO_VOLCADO
+            )
+        if volcar:
+            self._volcar()
+        return None if fila is None else json.loads(fila[0])
+
+    def guardar(self, clave: str, valor: dict) -> None:
+        datos = json.dumps(valor).encode()
+        ahora = time.time()
+        with self._transaccion() as conexion:
+            self._escribir_pendientes(conexion)
+            anterior = conexion.execute("SELECT tamano FROM resultados WHERE clave = ?", (clave,)).fetchone()
+            conexion.execute(
+                "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)", (clave, datos, len(datos), ahora, ahora)
+            )
+            caducados = conexion.execute(
+                "SELECT COALESCE(SUM(tamano), 0) FROM resultados WHERE creado < ?", (ahora - self.ttl,)
+            ).fetchone()[0]
+            if caducados:
+                conexion.execute("DELETE FROM resultados WHERE creado < ?", (ahora - self.ttl,))
+            total = conexion.execute("SELECT valor FROM contadores WHERE nombre = 'bytes'").fetchone()[0]
+            total += len(datos) - (anterior[0] if anterior else 0) - caducados
+            expulsadas = 0
+            while total > self.max_bytes:
+                victimas = conexion.execute(
+                    "SELECT clave, tamano FROM resultados WHERE clave != ? ORDER BY accedido LIMIT 32", (clave,)
+                ).fetchall()
+                if not victimas:
+                    break
+                for victima, tamano in victimas:
+                    conexion.execute("DELETE FROM resultados WHERE clave = ?", (victima,))
+                    total -= tamano
+                    expulsadas += 1
+                    if total <= self.max_bytes:
+                        break
+            conexion.execute("UPDATE contadores SET valor = ? WHERE nombre = 'bytes'", (total,))
+            if expulsadas:
+                conexion.execute(
+                    "UPDATE contadores SET valor = valor + ? WHERE nombre = 'expulsiones'", (expulsadas,)
+                )
+
+    def estadisticas(self) -> dict:
+        self._volcar()
+        with self._transaccion(inmediata=False) as conexion:
+            contadores = dict(conexion.execute("SELECT nombre, valor FROM contadores").fetchall())
+            entradas = conexion.execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+        return {**contadores, "entradas": entradas}
+
+    def vaciar(self) -> None:
+        with self._candado:
+            self._accesos.clear()
+        with self._transaccion() as conexion:
+            conexion.execute("DELETE FROM resultados")
+            conexion.execute("UPDATE contadores SET valor = 0 WHERE nombre = 'bytes'")
+
+    def _volcar(self) -> None:
+        try:
+            with self._transaccion() as conexion:
+                self._escribir_pendientes(conexion)
+        except sqlite3.Error as e:
+            # Solo se pierden estadísticas y algo de precisión en el orden LRU
+            print(f"Error volcando los accesos del almacén de resultados: {e}")
+
+    def _escribir_pendientes(self, conexion: sqlite3.Connection) -> None:
+        with self._candado:
+            accesos, self._accesos = self._accesos, {}
+            pendientes, self._pendientes = self._pendientes, {"aciertos": 0, "fallos": 0}
+            self._ultimo_volcado = time.monotonic()
+        if accesos:
+            conexion.executemany(
+                "UPDATE resultados SET accedido = MAX(accedido, ?) WHERE clave = ?",
+                [(cuando, clave) for clave, cuando in accesos.items()],
+            )
+        conexion.executemany(
+            "UPDATE contadores SET valor = valor + ? WHERE nombre = ?",
+            [(veces, nombre) for nombre, veces in pendientes.items() if veces],
+        )
+
+
+class _Transaccion:
+    """
+    Abre una transacción: de escritura inmediata (evita bloqueos al pasar de lectura a escritura) o,
+    con `inmediata=False`, diferida, para lecturas que no bloquean a otros lectores ni al escritor.
+    """
+
+    def __init__(self, conexion: sqlite3.Connection, inmediata: bool = True):
+        self.conexion = conexion
+        self.inmediata = inmediata
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conexion.execute("BEGIN IMMEDIATE" if self.inmediata else "BEGIN")
+        return self.conexion
+
+    def __exit__(self, tipo, valor, traza) -> None:
+        self.conexion.execute("COMMIT" if tipo is None else "ROLLBACK")
+
+
+def crear_almacen() -> AlmacenResultados:
+    """
+    Crea el almacén de resultados según las variables de entorno:
+    ALMACEN_RESULTADOS (sqlite o memoria), RESULTADOS_DB, RESULTADOS_TTL y RESULTADOS_MAX_BYTES.
+    """
+    ttl = float(os.getenv("RESULTADOS_TTL", str(24 * 3600)))
+    max_bytes = int(os.getenv("RESULTADOS_MAX_BYTES", str(256 * 1024 * 1024)))
+    if os.getenv("ALMACEN_RESULTADOS", "sqlite") == "memoria":
+        return AlmacenMemoria(ttl, max_bytes)
+    return AlmacenSQLite(os.getenv("RESULTADOS_DB", "./temp/resultados.db"), ttl, max_bytes)
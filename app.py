@@ -1,19 +1,47 @@
 import streamlit as st
 import requests
-from streamlit.components.v1 import html
+import json
+import plotly.io as pio
 
 # URLs del backend
 import os
 BACKEND_HOST = os.getenv("BACKEND_HOST", "localhost")
-BACKEND_URL_DATOS = f"http://{BACKEND_HOST}:8000/generar_datos/"
-BACKEND_URL_PDF = f"http://{BACKEND_HOST}:8000/descargar_pdf/"
+BACKEND_URL_TRABAJOS = f"http://{BACKEND_HOST}:8000/trabajos/"
+BACKEND_URL_GRAFICOS = f"http://{BACKEND_HOST}:8000/graficos/"
+
+# Mensajes de progreso para cada nodo del grafo
+ETAPAS = {
+    "extraer_ticker": "Ticker identificado",
+    "obtener_datos_financieros": "Precios descargados",
+    "analizar_datos": "Métricas calculadas",
+    "obtener_noticias": "Noticias obtenidas",
+    "analista_financiero": "Informe redactado",
+}
+
+def leer_eventos(respuesta):
+    """
+    Convierte una respuesta Server-Sent Events en pares (evento, datos).
+    """
+    evento, datos = "message", []
+    for linea in respuesta.iter_lines(decode_unicode=True):
+        if linea is None:
+            continue
+        if linea == "":
+            if datos:
+                yield evento, json.loads("\n".join(datos))
+            evento, datos = "message", []
+        elif linea.startswith("event:"):
+            evento = linea[len("event:"):].strip()
+        elif linea.startswith("data:"):
+            datos.append(linea[len("data:"):].strip())
 
 st.title("Generador de Reportes Financieros")
 
 # Variables para almacenar los resultados
 reporte_texto = None
-ruta_figura = None
+grafico_id = None
 reporte_id = None
+reporte_mostrado = False
 
 # Formulario de entrada
 with st.form("form_reporte"):
@@ -24,34 +52,54 @@ with st.form("form_reporte"):
     submit_button = st.form_submit_button(label="Generar Reporte")
     
     if submit_button:
-        # Obtener datos del reporte y la gráfica
-        with st.spinner("Generando datos del reporte..."):
+        # El reporte se encola y se sigue por sus eventos: el informe se va pintando a medida que llega
+        st.subheader("Contenido del Reporte:")
+        contenedor_reporte = st.empty()
+        with st.status("Generando datos del reporte...") as estado_ui:
             try:
-                datos_response = requests.post(
-                    BACKEND_URL_DATOS,
-                    data={"consulta": consulta},
-                    timeout=60  # Aumentar timeout a 60 segundos
-                )
-                if datos_response.status_code == 200:
-                    response_data = datos_response.json()
-                    reporte_texto = response_data["reporte_texto"]
-                    ruta_figura = response_data["ruta_figura"]
-                    reporte_id = response_data["reporte_id"]
-                    st.success("¡Datos cargados con éxito!")
-                elif datos_response.status_code == 408:
-                    st.error("⏱️ El análisis está tomando más tiempo del esperado. El agente pandas puede estar iterando demasiado. Por favor, intenta nuevamente.")
-                elif datos_response.status_code == 500:
-                    try:
-                        error_data = datos_response.json()
-                        st.error(f"Error del servidor: {error_data.get('detail', 'Error interno')}")
-                    except:
-                        st.error("Error interno del servidor. Por favor, intenta nuevamente.")
-                else:
-                    st.error(f"Error al cargar los datos del reporte. Status: {datos_response.status_code}")
+                respuesta = requests.post(BACKEND_URL_TRABAJOS, data={"consulta": consulta}, timeout=10)
+                respuesta.raise_for_status()
+                url_eventos = BACKEND_URL_TRABAJOS + respuesta.json()["trabajo_id"] + "/eventos"
+
+                with requests.get(
+                    url_eventos,
+                    stream=True,
+                    timeout=(5, 60)  # Conexión y espera máxima entre eventos (el backend manda latidos)
+                ) as eventos_response:
+                    eventos_response.raise_for_status()
+                    etapas_mostradas = 0
+                    texto_parcial = ""
+                    for evento, datos in leer_eventos(eventos_response):
+                        if evento == "estado":
+                            for nodo in datos["progreso"][etapas_mostradas:]:
+                                estado_ui.write(f"✅ {ETAPAS.get(nodo, nodo)}")
+                            etapas_mostradas = len(datos["progreso"])
+                            if datos["estado"] == "pendiente" and datos.get("posicion"):
+                                estado_ui.update(label=f"En cola: {datos['posicion']} reportes por delante...")
+                            else:
+                                estado_ui.update(label="Generando datos del reporte...")
+                        elif evento == "token":
+                            texto_parcial += datos["texto"]
+                            contenedor_reporte.markdown(texto_parcial)
+                        elif evento == "reinicio":
+                            texto_parcial = ""
+                            contenedor_reporte.empty()
+                        elif evento == "final":
+                            reporte_texto = datos["reporte_texto"]
+                            grafico_id = datos["grafico_id"]
+                            reporte_id = datos["reporte_id"]
+                            contenedor_reporte.markdown(reporte_texto)
+                            reporte_mostrado = True
+                            estado_ui.update(label="¡Datos cargados con éxito!", state="complete")
+                            if "noticias" in datos.get("parcial", []):
+                                st.warning("📰 Las noticias no llegaron a tiempo: el informe se basa solo en los datos históricos.")
+                        elif evento == "error":
+                            estado_ui.update(label="Error generando el reporte", state="error")
+                            st.error(f"Error del servidor: {datos.get('detalle') or 'Error interno'}")
             except requests.exceptions.ConnectionError:
                 st.error("🔌 No se puede conectar al backend. Asegúrate de que el servicio FastAPI esté ejecutándose.")
             except requests.exceptions.Timeout:
-                st.error("⏱️ Timeout al conectar con el backend. El análisis puede estar tomando más tiempo del esperado debido a múltiples iteraciones del agente pandas.")
+                st.error("⏱️ El análisis está tomando más tiempo del esperado. Vuelve a intentarlo en unos minutos.")
             except Exception as e:
                 st.error(f"❌ Error inesperado: {str(e)}")
 
@@ -60,49 +108,20 @@ def generar_report(reporte_texto):
     st.subheader("Contenido del Reporte:")
     st.write(reporte_texto)
 
-def mostrar_grafico(ruta_html):
+def mostrar_grafico(grafico_id):
     st.subheader("Gráfica Financiera Interactiva:")
     try:
-        # Leer el archivo HTML con UTF-8
-        with open(ruta_html, "r", encoding="UTF8") as f:
-            html_content = f.read()
-            # Renderizar el contenido HTML
-            html(html_content, height=700)
+        # Solo se descarga la especificación JSON de la figura: Streamlit ya incluye plotly.js
+        respuesta = requests.get(BACKEND_URL_GRAFICOS + grafico_id, timeout=10)
+        respuesta.raise_for_status()
+        st.plotly_chart(pio.from_json(respuesta.text), use_container_width=True)
     except Exception as e:
         st.error(f"Error al cargar la gráfica: {e}")
 
-# Mostrar el contenido del reporte
-if reporte_texto:
+# Mostrar el contenido del reporte (si no se ha pintado ya durante el streaming)
+if reporte_texto and not reporte_mostrado:
     generar_report(reporte_texto)
 
 # Mostrar la gráfica
-if ruta_figura:
-    mostrar_grafico(ruta_figura)
-
-# # Botón para descargar el PDF
-
-# if st.button("Descargar Informe PDF"):
-#     with st.spinner("Generando PDF..."):
-#         try:
-#             pdf_response = requests.post(
-#                 BACKEND_URL_PDF,
-#                 json={"reporte_id": reporte_id},
-#                 timeout=10  # Tiempo de espera en segundos
-#             )
-#             if pdf_response.status_code == 200:
-#                 # Verifica que los datos PDF están en el contenido de la respuesta
-#                 pdf_content = pdf_response.content
-#                 if pdf_content:
-#                     # Usa st.download_button para descargar el archivo generado
-#                     st.download_button(
-#                         label="Descargar Informe PDF",
-#                         data=pdf_content,
-#                         file_name=f"reporte_financiero_{reporte_id}.pdf",
-#                         mime="application/pdf"
-#                     )
-#                 else:
-#                     st.error("El contenido del PDF está vacío.")
-#             else:
-#                 st.error(f"Error al generar el PDF. Código de estado: {pdf_response.status_code}")
-#         except requests.exceptions.RequestException as e:
-#             st.error(f"Error de conexión: {str(e)}")
+if grafico_id:
+    mostrar_grafico(grafico_id)
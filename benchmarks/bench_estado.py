@@ -0,0 +1,81 @@
+"""
+Tamaño del estado del grafo y memoria por ejecución del reporte, sin red.
+
+Ejecuta el grafo varias veces (síncrono y asíncrono) y comprueba que el estado final no lleva las
+barras de precios (solo su referencia) y que la memoria retenida no crece con cada ejecución.
+Termina con código 1 si se supera algún límite, para poder usarlo como comprobación en CI.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_estado [--ejecuciones N] [--filas N]
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import pickle
+import sys
+import tracemalloc
+
+from benchmarks.fixtures import instalar_stubs
+
+# El estado solo debería llevar textos (consulta, análisis, noticias, informe) y una referencia
+LIMITE_ESTADO_BYTES = 64 * 1024
+# Memoria que puede quedar retenida por ejecución (cachés de noticias, resultados, trazas...)
+LIMITE_RETENIDO_POR_EJECUCION = 32 * 1024
+
+
+def medir(ejecutar, ejecuciones: int) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        estado = ejecutar()  # calentamiento: agentes, índice de tickers y partición de precios
+        gc.collect()
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        pico_maximo = 0
+        for _ in range(ejecuciones):
+            tracemalloc.reset_peak()
+            antes, _ = tracemalloc.get_traced_memory()
+            estado = ejecutar()
+            _, pico = tracemalloc.get_traced_memory()
+            pico_maximo = max(pico_maximo, pico - antes)
+        gc.collect()
+        final, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "estado_bytes": len(pickle.dumps(estado)),
+        "pico_por_ejecucion": pico_maximo,
+        "retenido_por_ejecucion": (final - base) / ejecuciones,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ejecuciones", type=int, default=20)
+    parser.add_argument("--filas", type=int, default=2_500, help="barras que devuelve la descarga falsa")
+    args = parser.parse_args()
+
+    instalar_stubs(filas_descarga=args.filas)
+    from model.ai_model import correr_modelo, correr_modelo_async
+
+    modos = {
+        "síncrono": lambda: correr_modelo("AAPL"),
+        "asíncrono": lambda: asyncio.run(correr_modelo_async("AAPL")),
+    }
+    correcto = True
+    for nombre, ejecutar in modos.items():
+        r = medir(ejecutar, args.ejecuciones)
+        print(
+            f"{nombre:>10}: estado {r['estado_bytes'] / 1024:6.1f} KB · pico {r['pico_por_ejecucion'] / 1024:8.1f} KB "
+            f"por ejecución · retenido {r['retenido_por_ejecucion'] / 1024:6.1f} KB por ejecución"
+        )
+        if r["estado_bytes"] > LIMITE_ESTADO_BYTES:
+            print(f"  el estado supera {LIMITE_ESTADO_BYTES / 1024:.0f} KB", file=sys.stderr)
+            correcto = False
+        if r["retenido_por_ejecucion"] > LIMITE_RETENIDO_POR_EJECUCION:
+            print(f"  la memoria retenida supera {LIMITE_RETENIDO_POR_EJECUCION / 1024:.0f} KB por ejecución", file=sys.stderr)
+            correcto = False
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Pasarela del LLM frente a un proveedor falso con límites, sin red.
+
+Escenarios:
+- 429: el proveedor admite menos peticiones por minuto de las que la pasarela cree tener; los 429 se
+  reintentan con espera y, mientras dura la saturación, las llamadas van al modelo de respaldo.
+- lento: la mitad de las respuestas del principal son lentas; en cuanto su p95 supera el SLO, las
+  llamadas van al respaldo.
+- presupuesto: 66 peticiones a la vez contra un presupuesto de 60 por minuto; las que no caben en la
+  ráfaga inicial esperan su turno en orden y el proveedor no llega a responder ningún 429.
+
+Termina con código 1 si alguna llamada falla, para poder usarlo como comprobación en CI.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_pasarela [--llamadas N]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+from benchmarks.fixtures import crear_proveedor_falso, instalar_stubs
+
+
+async def ejecutar(pasarela, llamadas: int, oleada: int) -> dict:
+    async def una(i: int):
+        inicio = time.perf_counter()
+        try:
+            await pasarela.ainvoke(f"consulta {i}")
+            return time.perf_counter() - inicio
+        except Exception:
+            return None
+
+    inicio = time.perf_counter()
+    latencias = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Por oleadas: la pasarela decide cada una con las latencias de las anteriores
+        for desde in range(0, llamadas, oleada):
+            latencias += await asyncio.gather(*(una(i) for i in range(desde, min(llamadas, desde + oleada))))
+    correctas = sorted(l for l in latencias if l is not None)
+    return {
+        "total_s": time.perf_counter() - inicio,
+        "fallidas": llamadas - len(correctas),
+        "p95_s": correctas[int(0.95 * (len(correctas) - 1))] if correctas else float("nan"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llamadas", type=int, default=40)
+    args = parser.parse_args()
+
+    instalar_stubs()
+    from model import clientes, pasarela_llm
+
+    escenarios = {
+        # El proveedor admite 10 peticiones por minuto, la pasarela cree que 600
+        "429": ("principal-429", dict(rpm=10, latencia=0.05), "600/100000", {}, 40),
+        "lento": ("principal-lento", dict(rpm=1000, latencia=0.05, latencia_lenta=1.0, prob_lenta=0.5, semilla=1),
+                  "6000/1000000", dict(slo_p95=0.5), 5),
+        # El proveedor admite 70 por minuto y la pasarela se limita a 60 (una por segundo tras la ráfaga inicial)
+        "presupuesto": ("principal-presupuesto", dict(rpm=70, latencia=0.01), "60/1000000", dict(espera_maxima=60), 66),
+    }
+    correcto = True
+    for nombre, (modelo, proveedor, limites, opciones, oleada) in escenarios.items():
+        respaldo = f"respaldo-{nombre}"
+        clientes._llms[(modelo, 0.0)] = crear_proveedor_falso(**proveedor)
+        clientes._llms[(respaldo, 0.0)] = crear_proveedor_falso(rpm=1000, latencia=0.05)
+        os.environ["LLM_LIMITES"] = f"{modelo}={limites},{respaldo}=6000/1000000"
+        llamadas = args.llamadas if nombre != "presupuesto" else 66
+        pasarela = pasarela_llm.PasarelaLLM(modelo, 0, respaldo=respaldo, **opciones)
+
+        r = asyncio.run(ejecutar(pasarela, llamadas, oleada))
+        estadisticas = pasarela_llm.estadisticas_pasarela()
+        principal, secundario = estadisticas[modelo], estadisticas.get(respaldo, {})
+        desvios = principal["desvios_slo"] + principal["desvios_limite"] + principal["desvios_cola"]
+        print(
+            f"{nombre:>12}: {llamadas} llamadas en {r['total_s']:5.2f} s · p95 {r['p95_s']:5.2f} s · "
+            f"fallidas {r['fallidas']} · principal {principal['llamadas']} · respaldo {secundario.get('llamadas', 0)} · "
+            f"desvíos {desvios} · reintentos {principal['reintentos'] + secundario.get('reintentos', 0)} · "
+            f"espera en cola {principal['espera_total_s']:.1f} s"
+        )
+        if r["fallidas"]:
+            print(f"  {r['fallidas']} llamadas fallaron", file=sys.stderr)
+            correcto = False
+        if nombre == "presupuesto" and principal["reintentos"]:
+            print("  el proveedor rechazó llamadas dentro del presupuesto", file=sys.stderr)
+            correcto = False
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Rendimiento del maquetador de PDF: páginas por segundo para un informe de 1 página y otro de 100.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_pdf [--repeticiones N]
+"""
+import argparse
+import re
+import time
+
+from benchmarks.fixtures import informe_markdown
+from maquetador_pdf import maquetar_markdown
+
+
+def contar_paginas(pdf: bytes) -> int:
+    return len(re.findall(rb"/Type /Page\b", pdf))
+
+
+def medir(secciones: int, repeticiones: int) -> dict:
+    texto = informe_markdown(secciones)
+    maquetar_markdown(texto)  # calienta las tablas de anchos
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        pdf = maquetar_markdown(texto)
+    segundos = (time.perf_counter() - inicio) / repeticiones
+    paginas = contar_paginas(pdf)
+    return {"paginas": paginas, "segundos": segundos, "paginas_por_segundo": paginas / segundos, "bytes": len(pdf)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    # 3 secciones ocupan una página; 385, cien
+    for nombre, secciones in (("1 página", 3), ("100 páginas", 385)):
+        r = medir(secciones, args.repeticiones)
+        print(
+            f"{nombre:>12}: {r['paginas']:4d} páginas en {r['segundos'] * 1000:8.1f} ms "
+            f"-> {r['paginas_por_segundo']:7.1f} páginas/s ({r['bytes'] / 1024:.0f} KB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Plazos y cancelación del grafo del reporte frente a servicios lentos, sin red.
+
+Escenarios:
+- noticias lentas: cada búsqueda tarda 5 s y el nodo de noticias tiene 0,5 s; el reporte debe salir
+  a tiempo, marcado como parcial.
+- abandonadas: el asesor tarda 5 s y las peticiones tienen 1 s de plazo; al vencer, sus llamadas al
+  LLM deben cancelarse (ninguna llega a completarse) y liberar sus plazas, de modo que la siguiente
+  tanda, ya con el proveedor rápido, no espera a las abandonadas.
+
+Termina con código 1 si algún escenario no se cumple, para poder usarlo como comprobación en CI.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_plazos [--peticiones N]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+from benchmarks.fixtures import _DDGSFalso, crear_proveedor_falso, instalar_stubs
+
+
+async def reporte(correr_modelo_async, plazo, consulta: str, segundos: float):
+    with plazo(segundos):
+        async with asyncio.timeout(segundos):
+            return await correr_modelo_async(consulta)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=16)
+    args = parser.parse_args()
+
+    # Pocas plazas de LLM para que las llamadas abandonadas que siguieran en curso se notaran, y
+    # presupuesto de sobra en la pasarela para que lo único que pueda frenar a la segunda tanda sean ellas
+    os.environ.update({
+        "LLM_CACHE": "0", "LIMITE_LLM": "4", "PLAZO_OBTENER_NOTICIAS": "0.5",
+        "LLM_LIMITES": "llama-3.3-70b-versatile=6000/100000000",
+    })
+    instalar_stubs()
+    from model import clientes, concurrencia
+    from model.ai_model import correr_modelo_async
+    from model.plazos import plazo
+
+    correcto = True
+    asesor = ("llama-3.3-70b-versatile", 0.0)
+
+    # Noticias lentas: el reporte sale sin ellas
+    texto_original = _DDGSFalso.text
+
+    def texto_lento(self, consulta, max_results=4):
+        time.sleep(5)
+        return texto_original(self, consulta, max_results)
+
+    _DDGSFalso.text = texto_lento
+    clientes._llms[asesor] = crear_proveedor_falso(respuesta="Informe", rpm=1000, latencia=0.05)
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        estado = asyncio.run(reporte(correr_modelo_async, plazo, "AAPL", 10))
+        segundos = time.perf_counter() - inicio
+    _DDGSFalso.text = texto_original
+    print(f"noticias lentas: reporte en {segundos:.2f} s · parcial {estado.get('parcial')} · informe {bool(estado.get('respuesta_final'))}")
+    if estado.get("parcial") != ["noticias"] or not estado.get("respuesta_final") or segundos > 2:
+        print("  el reporte no salió a tiempo como parcial", file=sys.stderr)
+        correcto = False
+
+    # Abandonadas: el plazo cancela las llamadas al LLM y libera sus plazas
+    lento = crear_proveedor_falso(respuesta="Informe", rpm=1000, latencia=5.0)
+    completadas = []
+    generar = type(lento)._agenerate
+
+    async def generar_contando(self, *a, **kw):
+        resultado = await generar(self, *a, **kw)
+        completadas.append(time.monotonic())
+        return resultado
+
+    type(lento)._agenerate = generar_contando
+    rapido = crear_proveedor_falso(respuesta="Informe", rpm=1000, latencia=0.05)
+
+    async def tandas():
+        clientes._llms[asesor] = lento
+        inicio = time.perf_counter()
+        abandonadas = await asyncio.gather(
+            *(reporte(correr_modelo_async, plazo, "AAPL", 1.0) for _ in range(args.peticiones)),
+            return_exceptions=True,
+        )
+        t_abandono = time.perf_counter() - inicio
+        libre = concurrencia.hay_plaza("llm")
+
+        clientes._llms[asesor] = rapido
+        inicio = time.perf_counter()
+        siguientes = await asyncio.gather(
+            *(reporte(correr_modelo_async, plazo, "AAPL", 10.0) for _ in range(args.peticiones)),
+            return_exceptions=True,
+        )
+        t_siguientes = time.perf_counter() - inicio
+        # Da tiempo a que terminara alguna llamada lenta que no se hubiera cancelado
+        await asyncio.sleep(5.5)
+        return abandonadas, t_abandono, libre, siguientes, t_siguientes
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        abandonadas, t_abandono, libre, siguientes, t_siguientes = asyncio.run(tandas())
+    vencidas = sum(isinstance(r, TimeoutError) for r in abandonadas)
+    correctas = sum(isinstance(r, dict) and bool(r.get("respuesta_final")) for r in siguientes)
+    print(
+        f"   abandonadas: {vencidas}/{args.peticiones} vencidas en {t_abandono:.2f} s · "
+        f"llamadas lentas completadas {len(completadas)} · plaza libre {libre} · "
+        f"siguientes {correctas}/{args.peticiones} en {t_siguientes:.2f} s"
+    )
+    if vencidas != args.peticiones or completadas or not libre:
+        print("  las peticiones vencidas no cancelaron su trabajo", file=sys.stderr)
+        correcto = False
+    if correctas != args.peticiones or t_siguientes > 2:
+        print("  la tanda siguiente esperó a las peticiones abandonadas", file=sys.stderr)
+        correcto = False
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == "__main__":
+    main()
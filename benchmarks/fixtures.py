@@ -0,0 +1,200 @@
+"""
+Datos sintéticos y dobles de los servicios externos para ejecutar los benchmarks sin red.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+TAMANOS_OHLCV = [250, 2_500, 25_000, 250_000]
+# Secciones de informe: unas 1, 10 y 100 páginas de PDF
+TAMANOS_INFORME = [3, 40, 385]
+
+SECCION = """## {numero}. Análisis de {ticker}
+
+El precio actual de **{ticker}** es de 187,32 USD, un *2,4 %* por encima de la media de 7 días y un
+**11,8 %** sobre la media móvil de 200 sesiones. El RSI(14) se sitúa en 61,2, lejos de la zona de
+sobrecompra, y el histograma del MACD sigue siendo positivo, lo que apunta a que la tendencia de
+`30 días` (+5,7 %) conserva el impulso. La volatilidad anualizada es del 24,1 % y el drawdown máximo
+del último año fue del -18,3 %.
+
+- **Tendencia:** alcista a medio plazo, con soporte en la media de 50 días.
+- **Riesgo:** publicación de resultados la próxima semana y sensibilidad a los tipos de interés.
+- **Noticias:** la compañía anunció un programa de recompra de acciones y nuevos productos.
+
+### Recomendación
+
+Mantener la posición y reforzar en retrocesos hacia la banda inferior de Bollinger (176,40 USD).
+"""
+
+
+def ohlcv_sintetico(filas: int, semilla: int = 0, fin: str = "2024-12-31") -> pd.DataFrame:
+    """
+    Genera barras OHLCV con un paseo aleatorio geométrico, con las mismas columnas que yfinance.
+
+    Hasta 25.000 filas son barras diarias (días hábiles); por encima, barras de un minuto, porque
+    250.000 días hábiles no caben en el rango de fechas de pandas.
+    """
+    rng = np.random.default_rng(semilla)
+    frecuencia = "B" if filas <= 25_000 else "min"
+    indice = pd.date_range(end=fin, periods=filas, freq=frecuencia, name="Date")
+
+    rendimientos = rng.normal(0.0003, 0.015 if frecuencia == "B" else 0.001, filas)
+    cierre = 100 * np.exp(np.cumsum(rendimientos))
+    apertura = np.concatenate([[cierre[0]], cierre[:-1]])
+    rango = np.abs(rng.normal(0, 0.01, filas))
+    maximo = np.maximum(apertura, cierre) * (1 + rango)
+    minimo = np.minimum(apertura, cierre) * (1 - rango)
+    volumen = rng.lognormal(15, 0.5, filas).round()
+    return pd.DataFrame(
+        {
+            "Open": apertura, "High": maximo, "Low": minimo, "Close": cierre,
+            "Adj Close": cierre * 0.98, "Volume": volumen,
+        },
+        index=indice,
+    )
+
+
+def como_descarga(marcos: dict) -> pd.DataFrame:
+    """
+    Une marcos por ticker en el formato de yf.download(group_by='ticker'): columnas (Ticker, Price).
+    """
+    return pd.concat(marcos, axis=1, names=["Ticker", "Price"])
+
+
+def informe_markdown(secciones: int) -> str:
+    """
+    Informe sintético con la estructura de los que redacta el asesor (títulos, negritas y listas).
+    """
+    cuerpo = "\n".join(SECCION.format(numero=i + 1, ticker=f"T{i % 50}") for i in range(secciones))
+    return f"# Informe financiero\n\n{cuerpo}"
+
+
+class _DDGSFalso:
+    """
+    Sustituto de DDGS que devuelve resultados fijos sin acceder a la red.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def text(self, consulta: str, max_results: int = 4) -> List[dict]:
+        return [
+            {"title": f"{consulta} {i}", "href": f"https://ejemplo.com/{abs(hash(consulta))}/{i}", "body": f"Resumen {i} de {consulta}"}
+            for i in range(max_results)
+        ]
+
+
+class ErrorProveedorFalso(Exception):
+    """
+    Error HTTP del proveedor falso, con `status_code` como los errores del cliente de Groq.
+    """
+
+    def __init__(self, status_code: int, mensaje: str):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+def crear_proveedor_falso(
+    respuesta: str = "AAPL",
+    rpm: int = 60,
+    latencia: float = 0.05,
+    latencia_lenta: float = 2.0,
+    prob_lenta: float = 0.0,
+    prob_error: float = 0.0,
+    semilla: Optional[int] = None,
+):
+    """
+    Chat model local que se comporta como un proveedor con límites: responde 429 si recibe más de
+    `rpm` peticiones en el último minuto (o al azar con `prob_error`), tarda `latencia` segundos
+    y, con probabilidad `prob_lenta`, `latencia_lenta`. Informa de los tokens como Groq.
+    """
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    azar = random.Random(semilla)
+    peticiones: deque = deque()
+    candado = threading.Lock()
+
+    def _admitir() -> float:
+        ahora = time.monotonic()
+        with candado:
+            while peticiones and peticiones[0] <= ahora - 60:
+                peticiones.popleft()
+            if len(peticiones) >= rpm or azar.random() < prob_error:
+                raise ErrorProveedorFalso(429, "Rate limit reached (proveedor falso)")
+            peticiones.append(ahora)
+            return latencia_lenta if azar.random() < prob_lenta else latencia
+
+    def _resultado(mensajes) -> ChatResult:
+        entrada = sum(len(str(m.content)) for m in mensajes) // 4
+        mensaje = AIMessage(respuesta, usage_metadata={
+            "input_tokens": entrada, "output_tokens": 50, "total_tokens": entrada + 50,
+        })
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    class ChatProveedorFalso(BaseChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "proveedor-falso"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            time.sleep(_admitir())
+            return _resultado(messages)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            await asyncio.sleep(_admitir())
+            return _resultado(messages)
+
+    return ChatProveedorFalso()
+
+
+def instalar_stubs(filas_descarga: int = 250) -> None:
+    """
+    Sustituye yfinance, DDGS y Groq por dobles locales. Se llama antes de importar model.ai_model.
+
+    Args:
+        filas_descarga (int): Filas que devuelve la descarga falsa de yfinance.
+    """
+    os.environ.setdefault("GROQ_API_KEY", "sin-red")
+    os.environ["PRECIOS_DIR"] = tempfile.mkdtemp(prefix="bench_precios_")
+    os.environ["GRAFICOS_DIR"] = tempfile.mkdtemp(prefix="bench_graficos_")
+
+    import yfinance as yf
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    def descargar(tickers: Union[str, Iterable[str]], **kwargs) -> pd.DataFrame:
+        lista = [tickers] if isinstance(tickers, str) else list(tickers)
+        # Barras hasta hoy: el almacén de precios descarta las que quedan fuera de su ventana
+        fin = pd.Timestamp.now().normalize()
+        return como_descarga({t: ohlcv_sintetico(filas_descarga, semilla=i, fin=fin) for i, t in enumerate(lista)})
+
+    yf.download = descargar
+
+    import model.noticias
+    model.noticias.DDGS = _DDGSFalso
+
+    # Los modelos que piden los agentes quedan registrados con respuestas fijas
+    from model import clientes
+    for modelo, temperatura in (
+        ("meta-llama/llama-4-maverick-17b-128e-instruct", 0.0),
+        ("llama-3.3-70b-versatile", 0.0),
+        ("llama-3.3-70b-versatile", 1.0),
+        ("llama-3.1-8b-instant", 0.0),
+        ("llama-3.1-8b-instant", 1.0),
+    ):
+        clientes._llms[(modelo, temperatura)] = FakeListChatModel(responses=["AAPL", informe_markdown(3)])
@@ -0,0 +1,217 @@
+"""
+Suite de micro-benchmarks de las rutas de cálculo, sin red (yfinance, DDGS y Groq sustituidos).
+
+Para cada caso y tamaño mide el tiempo (mínimo y mediana), el pico de memoria y los bloques de
+memoria que quedan asignados tras la llamada. Imprime una tabla Markdown y, con --salida, guarda
+los resultados en JSON para compararlos entre commits con --comparar.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.suite [--rapido] [--salida resultados.json] [--comparar base.json]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fixtures import (
+    TAMANOS_INFORME,
+    TAMANOS_OHLCV,
+    como_descarga,
+    informe_markdown,
+    instalar_stubs,
+    ohlcv_sintetico,
+)
+
+VERSION_FORMATO = 1
+# Tiempo orientativo por caso y tamaño; los casos lentos se repiten menos veces
+PRESUPUESTO_SEGUNDOS = 2.0
+
+
+class Caso:
+    """
+    Un benchmark: `preparar(tamano)` crea los argumentos (fuera de la medición) y `funcion(*args)` es
+    lo que se mide.
+    """
+
+    def __init__(self, nombre: str, tamanos: List[int], preparar: Callable[[int], Tuple], funcion: Callable[..., Any]):
+        self.nombre = nombre
+        self.tamanos = tamanos
+        self.preparar = preparar
+        self.funcion = funcion
+
+
+def _casos() -> List[Caso]:
+    instalar_stubs()
+
+    import yfinance as yf
+    import utils
+    from almacen_graficos import AlmacenGraficos
+    from model import ai_model
+    from model.almacen_precios import AlmacenPrecios
+
+    analista = ai_model.AgenteAnalizarDatos(usar_llm=False)
+
+    def preparar_normalizacion(filas: int) -> Tuple:
+        descarga = como_descarga({"BENCH": ohlcv_sintetico(filas)})
+        yf.download = lambda *args, **kwargs: descarga.copy()
+        return ("BENCH",)
+
+    def preparar_almacen(filas: int) -> Tuple:
+        marco = ohlcv_sintetico(filas)
+        almacen = AlmacenPrecios(
+            descargar=lambda ticker, inicio=None: marco,
+            directorio=tempfile.mkdtemp(prefix="bench_almacen_"),
+            dias_historia=40_000,  # conserva toda la serie sintética
+        )
+        return (almacen,)
+
+    def preparar_grafico(filas: int) -> Tuple:
+        # Almacén vacío en cada repetición: si no, la figura saldría de la caché por su hash
+        almacen = AlmacenGraficos(tempfile.mkdtemp(prefix="bench_graficos_"), max_edad=3600, max_bytes=10**9)
+        return (ohlcv_sintetico(filas), "BENCH", almacen)
+
+    return [
+        Caso("normalizacion_descarga", TAMANOS_OHLCV, preparar_normalizacion, ai_model._descargar_yfinance),
+        Caso("almacen_precios_escritura", TAMANOS_OHLCV, preparar_almacen, lambda almacen: almacen.obtener("BENCH")),
+        Caso("analisis_basico", TAMANOS_OHLCV, lambda filas: (ohlcv_sintetico(filas),), analista._analisis_basico),
+        Caso("generar_graficos", TAMANOS_OHLCV, preparar_grafico, utils.generar_graficos),
+        Caso("renderizar_pdf", TAMANOS_INFORME, lambda secciones: (informe_markdown(secciones),), utils.renderizar_pdf),
+    ]
+
+
+def _silencio():
+    # El código medido imprime trazas de depuración: no deben contar ni ensuciar la salida
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def medir(caso: Caso, tamano: int, max_repeticiones: int) -> Dict[str, Any]:
+    """
+    Mide un caso para un tamaño: una llamada de calentamiento, las repeticiones cronometradas y una
+    llamada más con tracemalloc (que ralentiza, por eso va aparte).
+    """
+    with _silencio():
+        args = caso.preparar(tamano)
+        inicio = time.perf_counter()
+        caso.funcion(*args)
+        primera = time.perf_counter() - inicio
+
+        repeticiones = max(1, min(max_repeticiones, int(PRESUPUESTO_SEGUNDOS / max(primera, 1e-6))))
+        tiempos = []
+        for _ in range(repeticiones):
+            args = caso.preparar(tamano)
+            gc.collect()
+            inicio = time.perf_counter()
+            caso.funcion(*args)
+            tiempos.append(time.perf_counter() - inicio)
+
+        args = caso.preparar(tamano)
+        gc.collect()
+        bloques_antes = sys.getallocatedblocks()
+        tracemalloc.start()
+        resultado = caso.funcion(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        bloques = sys.getallocatedblocks() - bloques_antes
+        del resultado
+
+    return {
+        "caso": caso.nombre,
+        "tamano": tamano,
+        "repeticiones": repeticiones,
+        "tiempo_min_s": min(tiempos),
+        "tiempo_mediana_s": statistics.median(tiempos),
+        "memoria_pico_bytes": pico,
+        "bloques_retenidos": bloques,
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def tabla_markdown(resultados: List[Dict[str, Any]], base: Optional[Dict[Tuple[str, int], Dict]] = None) -> str:
+    """
+    Tabla Markdown de resultados; con `base`, añade la relación de tiempos (actual / base).
+    """
+    cabecera = "| caso | tamaño | rep. | mín. (ms) | mediana (ms) | pico (KB) | bloques |"
+    separador = "|---|---:|---:|---:|---:|---:|---:|"
+    if base is not None:
+        cabecera += " vs. base |"
+        separador += "---:|"
+    filas = [cabecera, separador]
+    for r in resultados:
+        fila = (
+            f"| {r['caso']} | {r['tamano']:,} | {r['repeticiones']} | {r['tiempo_min_s'] * 1000:.2f} | "
+            f"{r['tiempo_mediana_s'] * 1000:.2f} | {r['memoria_pico_bytes'] / 1024:,.0f} | {r['bloques_retenidos']:,} |"
+        )
+        if base is not None:
+            anterior = base.get((r["caso"], r["tamano"]))
+            fila += f" {r['tiempo_min_s'] / anterior['tiempo_min_s']:.2f}x |" if anterior else " – |"
+        filas.append(fila)
+    return "\n".join(filas)
+
+
+def ejecutar(rapido: bool = False, max_repeticiones: int = 7, filtro: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ejecuta la suite y devuelve los resultados en el formato JSON de --salida.
+    """
+    resultados = []
+    for caso in _casos():
+        if filtro and filtro not in caso.nombre:
+            continue
+        for tamano in caso.tamanos[:2] if rapido else caso.tamanos:
+            resultado = medir(caso, tamano, max_repeticiones)
+            print(f"  {caso.nombre} [{tamano:,}]: {resultado['tiempo_min_s'] * 1000:.2f} ms", file=sys.stderr)
+            resultados.append(resultado)
+    return {
+        "formato": VERSION_FORMATO,
+        "commit": _commit(),
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rapido", action="store_true", help="solo los dos tamaños más pequeños de cada caso")
+    parser.add_argument("--repeticiones", type=int, default=7, help="repeticiones máximas por caso y tamaño")
+    parser.add_argument("--caso", help="ejecuta solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--salida", help="fichero JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior con el que comparar los tiempos")
+    args = parser.parse_args()
+
+    informe = ejecutar(args.rapido, args.repeticiones, args.caso)
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        base = {(r["caso"], r["tamano"]): r for r in anterior["resultados"]}
+
+    print(f"Commit `{informe['commit']}` · Python {informe['python']} · {informe['fecha']}\n")
+    print(tabla_markdown(informe["resultados"], base))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
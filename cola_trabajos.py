@@ -0,0 +1,429 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from almacen_resultados import _Transaccion
+
+# Estados de un trabajo: pendiente -> en_curso -> completado | error
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+# Cada cuánto vuelca un trabajador en la cola los fragmentos del informe que va redactando el LLM
+INTERVALO_TEXTO = 0.25
+
+
+class ColaTrabajos:
+    """
+    Cola durable de trabajos de reporte en SQLite (modo WAL), compartida por el servidor y los procesos
+    trabajadores sin ningún broker externo.
+
+    Los trabajos salen por prioridad y antigüedad; una consulta con el mismo ticker y la misma pregunta
+    que un trabajo pendiente o en curso se une a ese trabajo. Los trabajadores renuevan un latido mientras
+    ejecutan: si un proceso muere, sus trabajos vuelven a la cola al caducar el latido. El informe se va
+    guardando según lo escribe el LLM, para que se pueda seguir mientras el trabajo está en curso.
+    """
+
+    def __init__(
+        self,
+        ruta: str,
+        max_en_curso: Optional[int] = None,
+        max_intentos: Optional[int] = None,
+        plazo_latido: Optional[float] = None,
+        ttl: Optional[float] = None,
+    ):
+        """
+        :param ruta: Fichero de la base de datos (TRABAJOS_DB).
+        :param max_en_curso: Trabajos en ejecución a la vez entre todos los procesos (TRABAJOS_MAX_EN_CURSO, por defecto 8).
+        :param max_intentos: Ejecuciones de un trabajo antes de darlo por fallido (TRABAJOS_INTENTOS, por defecto 3).
+        :param plazo_latido: Segundos sin latido tras los que un trabajo en curso se considera huérfano (TRABAJOS_LATIDO, por defecto 60).
+        :param ttl: Segundos que se conservan los trabajos terminados (por defecto, RESULTADOS_TTL).
+        """
+        self.ruta = ruta
+        self.max_en_curso = max_en_curso or int(os.getenv("TRABAJOS_MAX_EN_CURSO", "8"))
+        self.max_intentos = max_intentos or int(os.getenv("TRABAJOS_INTENTOS", "3"))
+        self.plazo_latido = plazo_latido or float(os.getenv("TRABAJOS_LATIDO", "60"))
+        self.ttl = ttl or float(os.getenv("RESULTADOS_TTL", str(24 * 3600)))
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._local = threading.local()
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS trabajos ("
+                "id TEXT PRIMARY KEY, consulta TEXT NOT NULL, clave TEXT NOT NULL, prioridad INTEGER NOT NULL, "
+                "estado TEXT NOT NULL, intentos INTEGER NOT NULL DEFAULT 0, progreso TEXT NOT NULL DEFAULT '[]', "
+                "trabajador TEXT, creado REAL NOT NULL, iniciado REAL, latido REAL, terminado REAL, "
+                "resultado TEXT, error TEXT, texto TEXT NOT NULL DEFAULT '')"
+            )
+            # Bases creadas antes de que se guardara el texto parcial del informe
+            columnas = {fila["name"] for fila in conexion.execute("PRAGMA table_info(trabajos)")}
+            if "texto" not in columnas:
+                conexion.execute("ALTER TABLE trabajos ADD COLUMN texto TEXT NOT NULL DEFAULT ''")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_cola ON trabajos (estado, prioridad DESC, creado)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_clave ON trabajos (clave, estado)")
+
+    def _transaccion(self, inmediata: bool = True) -> _Transaccion:
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return _Transaccion(conexion, inmediata)
+
+    def encolar(self, consulta: str, clave: str, prioridad: int = 0) -> Tuple[str, bool]:
+        """
+        Añade un trabajo, o devuelve el que ya está pendiente o en curso para la misma clave.
+
+        Args:
+            consulta (str): Consulta del usuario.
+            clave (str): Clave de deduplicación (ver `clave_consulta`).
+            prioridad (int): Los trabajos de mayor prioridad salen antes.
+
+        Returns:
+            Tuple[str, bool]: ID del trabajo y si se ha creado uno nuevo.
+        """
+        ahora = time.time()
+        with self._transaccion() as conexion:
+            existente = conexion.execute(
+                "SELECT id, prioridad FROM trabajos WHERE clave = ? AND estado IN (?, ?) ORDER BY creado LIMIT 1",
+                (clave, PENDIENTE, EN_CURSO),
+            ).fetchone()
+            if existente is not None:
+                # La petición más urgente marca la prioridad del trabajo compartido
+                if prioridad > existente["prioridad"]:
+                    conexion.execute("UPDATE trabajos SET prioridad = ? WHERE id = ?", (prioridad, existente["id"]))
+                return existente["id"], False
+
+            trabajo_id = str(uuid.uuid4())
+            conexion.execute(
+                "INSERT INTO trabajos (id, consulta, clave, prioridad, estado, creado) VALUES (?, ?, ?, ?, ?, ?)",
+                (trabajo_id, consulta, clave, prioridad, PENDIENTE, ahora),
+            )
+            conexion.execute(
+                "DELETE FROM trabajos WHERE estado IN (?, ?) AND terminado < ?", (COMPLETADO, ERROR, ahora - self.ttl)
+            )
+        return trabajo_id, True
+
+    def reservar(self, trabajador: str) -> Optional[dict]:
+        """
+        Toma el siguiente trabajo pendiente para `trabajador`, si no se ha alcanzado el límite de
+        trabajos en curso.
+        """
+        ahora = time.time()
+        with self._transaccion() as conexion:
+            en_curso = conexion.execute("SELECT COUNT(*) FROM trabajos WHERE estado = ?", (EN_CURSO,)).fetchone()[0]
+            if en_curso >= self.max_en_curso:
+                return None
+            fila = conexion.execute(
+                "SELECT * FROM trabajos WHERE estado = ? ORDER BY prioridad DESC, creado LIMIT 1", (PENDIENTE,)
+            ).fetchone()
+            if fila is None:
+                return None
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, trabajador = ?, iniciado = ?, latido = ?, intentos = intentos + 1, "
+                "progreso = '[]', texto = '' WHERE id = ?",
+                (EN_CURSO, trabajador, ahora, ahora, fila["id"]),
+            )
+        return dict(fila)
+
+    def latir(self, trabajo_ids: List[str]) -> None:
+        """
+        Renueva el latido de los trabajos que un trabajador sigue ejecutando.
+        """
+        if not trabajo_ids:
+            return
+        with self._transaccion() as conexion:
+            conexion.executemany(
+                "UPDATE trabajos SET latido = ? WHERE id = ? AND estado = ?",
+                [(time.time(), trabajo_id, EN_CURSO) for trabajo_id in trabajo_ids],
+            )
+
+    def progresar(self, trabajo_id: str, etapa: str) -> None:
+        """
+        Anota una etapa terminada (nodo del grafo) del trabajo.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET progreso = json_insert(progreso, '$[#]', ?), latido = ? WHERE id = ?",
+                (etapa, time.time(), trabajo_id),
+            )
+
+    def escribir(self, trabajo_id: str, trabajador: str, fragmento: str) -> None:
+        """
+        Añade al texto parcial del trabajo un fragmento del informe que el trabajador está redactando.
+        """
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET texto = texto || ?, latido = ? WHERE id = ? AND estado = ? AND trabajador = ?",
+                (fragmento, time.time(), trabajo_id, EN_CURSO, trabajador),
+            )
+
+    # Solo el trabajador que tiene reservado el trabajo puede cerrarlo: si se dio por huérfano y otro
+    # lo retomó, el resultado tardío del primero se descarta
+    def completar(self, trabajo_id: str, trabajador: str, resultado: dict) -> None:
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, terminado = ?, resultado = ?, error = NULL "
+                "WHERE id = ? AND estado = ? AND trabajador = ?",
+                (COMPLETADO, time.time(), json.dumps(resultado), trabajo_id, EN_CURSO, trabajador),
+            )
+
+    def fallar(self, trabajo_id: str, trabajador: str, error: str) -> None:
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, terminado = ?, error = ? WHERE id = ? AND estado = ? AND trabajador = ?",
+                (ERROR, time.time(), error, trabajo_id, EN_CURSO, trabajador),
+            )
+
+    def recuperar_huerfanos(self) -> int:
+        """
+        Devuelve a la cola los trabajos en curso cuyo trabajador dejó de latir (o los da por fallidos si
+        ya agotaron sus intentos).
+
+        Returns:
+            int: Trabajos recuperados o descartados.
+        """
+        limite = time.time() - self.plazo_latido
+        with self._transaccion() as conexion:
+            descartados = conexion.execute(
+                "UPDATE trabajos SET estado = ?, terminado = ?, error = ? WHERE estado = ? AND latido < ? AND intentos >= ?",
+                (ERROR, time.time(), "El trabajador terminó sin completar el reporte", EN_CURSO, limite, self.max_intentos),
+            ).rowcount
+            recuperados = conexion.execute(
+                "UPDATE trabajos SET estado = ?, trabajador = NULL WHERE estado = ? AND latido < ?",
+                (PENDIENTE, EN_CURSO, limite),
+            ).rowcount
+        if descartados or recuperados:
+            print(f"Trabajos huérfanos: {recuperados} devueltos a la cola, {descartados} descartados")
+        return descartados + recuperados
+
+    def obtener(self, trabajo_id: str, desde: int = 0) -> Optional[dict]:
+        """
+        Devuelve el estado de un trabajo: etapas terminadas, posición en la cola si está pendiente, el
+        texto del informe redactado hasta ahora (a partir del carácter `desde`) y el resultado o el error
+        cuando termina.
+        """
+        with self._transaccion(inmediata=False) as conexion:
+            fila = conexion.execute(
+                "SELECT id, consulta, prioridad, estado, intentos, progreso, creado, iniciado, terminado, resultado, "
+                "error, substr(texto, ? + 1) AS texto_nuevo FROM trabajos WHERE id = ?",
+                (desde, trabajo_id),
+            ).fetchone()
+            if fila is None:
+                return None
+            posicion = None
+            if fila["estado"] == PENDIENTE:
+                posicion = conexion.execute(
+                    "SELECT COUNT(*) FROM trabajos WHERE estado = ? AND (prioridad > ? OR (prioridad = ? AND creado < ?))",
+                    (PENDIENTE, fila["prioridad"], fila["prioridad"], fila["creado"]),
+                ).fetchone()[0]
+        return {
+            "trabajo_id": fila["id"],
+            "estado": fila["estado"],
+            "consulta": fila["consulta"],
+            "prioridad": fila["prioridad"],
+            "posicion": posicion,
+            "progreso": json.loads(fila["progreso"]),
+            "texto": fila["texto_nuevo"],
+            "intentos": fila["intentos"],
+            "creado": fila["creado"],
+            "iniciado": fila["iniciado"],
+            "terminado": fila["terminado"],
+            "resultado": json.loads(fila["resultado"]) if fila["resultado"] else None,
+            "error": fila["error"],
+        }
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._transaccion(inmediata=False) as conexion:
+            filas = conexion.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall()
+        return {PENDIENTE: 0, EN_CURSO: 0, COMPLETADO: 0, ERROR: 0, **{estado: n for estado, n in filas}}
+
+
+def crear_cola() -> ColaTrabajos:
+    """
+    Crea la cola de trabajos según las variables de entorno TRABAJOS_DB, TRABAJOS_MAX_EN_CURSO,
+    TRABAJOS_INTENTOS y TRABAJOS_LATIDO.
+    """
+    return ColaTrabajos(os.getenv("TRABAJOS_DB", "./temp/trabajos.db"))
+
+
+async def _ejecutar_trabajo(cola: ColaTrabajos, trabajo: dict, trabajador: str, timeout: float) -> None:
+    # El grafo y el registro de reportes se importan dentro del proceso trabajador, no en el servidor
+    from reportes import registrar_reporte
+    from model.ai_model import correr_modelo_stream
+    from model.metricas import formatear_desglose, iniciar_desglose
+    from model.plazos import plazo
+
+    trabajo_id, consulta = trabajo["id"], trabajo["consulta"]
+    inicio = time.time()
+    desglose = iniciar_desglose()
+    # Los tokens del informe se vuelcan por lotes: una escritura cada INTERVALO_TEXTO segundos, no una por token
+    fragmentos: List[str] = []
+    ultimo_volcado = time.monotonic()
+
+    async def volcar_texto() -> None:
+        nonlocal ultimo_volcado
+        ultimo_volcado = time.monotonic()
+        if fragmentos:
+            fragmento = "".join(fragmentos)
+            fragmentos.clear()
+            await asyncio.to_thread(cola.escribir, trabajo_id, trabajador, fragmento)
+
+    try:
+        # El plazo llega a cada nodo del grafo: al vencer se cancela lo pendiente y se libera la plaza
+        with plazo(timeout):
+            async with asyncio.timeout(timeout):
+                async for evento, datos in correr_modelo_stream(consulta):
+                    if evento == "token":
+                        fragmentos.append(datos)
+                        if time.monotonic() - ultimo_volcado >= INTERVALO_TEXTO:
+                            await volcar_texto()
+                    elif evento == "progreso":
+                        await volcar_texto()
+                        await asyncio.to_thread(cola.progresar, trabajo_id, datos)
+                    elif evento == "final":
+                        await volcar_texto()
+                        if not datos or not datos.get("respuesta_final") or not datos.get("datos_financieros"):
+                            raise RuntimeError("No se pudieron generar datos válidos para el reporte")
+                        datos = {**datos, "tiempos": formatear_desglose(desglose, time.time() - inicio)}
+                        resultado = await asyncio.to_thread(registrar_reporte, datos, consulta)
+                        await asyncio.to_thread(cola.completar, trabajo_id, trabajador, resultado)
+    except TimeoutError:
+        await asyncio.to_thread(cola.fallar, trabajo_id, trabajador, f"El análisis superó el límite de {timeout:.0f} segundos")
+    except Exception as e:
+        print(f"Error en el trabajo {trabajo_id}: {e}")
+        await asyncio.to_thread(cola.fallar, trabajo_id, trabajador, f"Error interno del servidor: {str(e)}")
+
+
+async def _bucle_trabajador(ruta: str, nombre: str, concurrencia: int, parada) -> None:
+    # Carga el grafo y los agentes antes de tomar trabajos, para que el primero no pague la importación
+    from model.ai_model import precalentar_agentes
+    try:
+        await asyncio.to_thread(precalentar_agentes)
+    except Exception as e:
+        print(f"[{nombre}] Error precalentando los agentes: {e}")
+
+    cola = ColaTrabajos(ruta)
+    timeout = float(os.getenv("TRABAJOS_TIMEOUT", "120"))
+    activos: Dict[str, asyncio.Task] = {}
+    ultimo_latido = 0.0
+    while not (parada is not None and parada.is_set()):
+        # Reserva trabajos mientras haya hueco en este proceso (y en el límite global de la cola)
+        while len(activos) < concurrencia:
+            trabajo = await asyncio.to_thread(cola.reservar, nombre)
+            if trabajo is None:
+                break
+            print(f"[{nombre}] Trabajo {trabajo['id']}: {trabajo['consulta']!r}")
+            activos[trabajo["id"]] = asyncio.create_task(_ejecutar_trabajo(cola, trabajo, nombre, timeout))
+
+        if time.time() - ultimo_latido > cola.plazo_latido / 3:
+            await asyncio.to_thread(cola.latir, list(activos))
+            ultimo_latido = time.time()
+
+        if activos:
+            await asyncio.wait(list(activos.values()), timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+            for trabajo_id in [t for t, tarea in activos.items() if tarea.done()]:
+                del activos[trabajo_id]
+        else:
+            await asyncio.sleep(0.5)
+
+    # Parada ordenada: se terminan los trabajos en curso antes de salir
+    if activos:
+        await asyncio.gather(*activos.values(), return_exceptions=True)
+
+
+def bucle_trabajador(ruta: str, nombre: str, concurrencia: int, parada=None) -> None:
+    """
+    Punto de entrada de un proceso trabajador: ejecuta hasta `concurrencia` trabajos a la vez.
+
+    Args:
+        ruta (str): Base de datos de la cola.
+        nombre (str): Identificador del trabajador (aparece en la cola).
+        concurrencia (int): Trabajos simultáneos en este proceso.
+        parada (multiprocessing.Event): Si se activa, el trabajador termina lo que tiene en curso y sale.
+    """
+    asyncio.run(_bucle_trabajador(ruta, nombre, concurrencia, parada))
+
+
+class GrupoTrabajadores:
+    """
+    Lanza y vigila los procesos trabajadores: los que mueren se vuelven a lanzar, y sus trabajos
+    vuelven a la cola cuando caduca su latido.
+    """
+
+    def __init__(self, cola: ColaTrabajos, procesos: Optional[int] = None, concurrencia: Optional[int] = None):
+        """
+        :param procesos: Procesos trabajadores (TRABAJOS_PROCESOS, por defecto 2; 0 para lanzarlos aparte).
+        :param concurrencia: Trabajos simultáneos por proceso (TRABAJOS_CONCURRENCIA, por defecto 4).
+        """
+        self.cola = cola
+        self.procesos = procesos if procesos is not None else int(os.getenv("TRABAJOS_PROCESOS", "2"))
+        self.concurrencia = concurrencia or int(os.getenv("TRABAJOS_CONCURRENCIA", "4"))
+        # "spawn": el proceso del servidor tiene hilos, y hacer fork con hilos activos no es seguro
+        self._contexto = multiprocessing.get_context("spawn")
+        self._parada = self._contexto.Event()
+        self._trabajadores: Dict[str, multiprocessing.Process] = {}
+
+    def _lanzar(self, nombre: str) -> None:
+        proceso = self._contexto.Process(
+            target=bucle_trabajador,
+            args=(self.cola.ruta, nombre, self.concurrencia, self._parada),
+            name=nombre,
+            daemon=True,
+        )
+        proceso.start()
+        self._trabajadores[nombre] = proceso
+
+    def arrancar(self) -> None:
+        for i in range(self.procesos):
+            self._lanzar(f"trabajador-{os.getpid()}-{i}")
+
+    def vigilar(self) -> None:
+        """
+        Relanza los procesos caídos y devuelve a la cola los trabajos huérfanos.
+        """
+        for nombre, proceso in list(self._trabajadores.items()):
+            if not proceso.is_alive() and not self._parada.is_set():
+                print(f"El trabajador {nombre} terminó con código {proceso.exitcode}; se relanza")
+                self._lanzar(nombre)
+        self.cola.recuperar_huerfanos()
+
+    def parar(self, espera: float = 10.0) -> None:
+        self._parada.set()
+        for proceso in self._trabajadores.values():
+            proceso.join(espera)
+            if proceso.is_alive():
+                proceso.terminate()
+        self._trabajadores.clear()
+
+    def estadisticas(self) -> dict:
+        return {"procesos": sum(p.is_alive() for p in self._trabajadores.values()), "concurrencia": self.concurrencia}
+
+
+if __name__ == "__main__":
+    # Trabajadores independientes del servidor, en la misma máquina (con el servidor arrancado con
+    # TRABAJOS_PROCESOS=0, por ejemplo al usar varios workers de uvicorn)
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Procesos trabajadores de la cola de reportes")
+    parser.add_argument("--procesos", type=int, default=int(os.getenv("TRABAJOS_PROCESOS", "2")) or 1)
+    args = parser.parse_args()
+
+    grupo = GrupoTrabajadores(crear_cola(), procesos=args.procesos)
+    grupo.arrancar()
+    try:
+        while True:
+            time.sleep(5)
+            grupo.vigilar()
+    except KeyboardInterrupt:
+        grupo.parar()
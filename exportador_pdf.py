@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+from model.coalescencia import GrupoVuelo
+from utils import renderizar_pdf
+
+# Versión del maquetador: al cambiarla, los PDF ya guardados en caché dejan de coincidir
+VERSION_PDF = b"1"
+
+TAMANO_TROZO = 64 * 1024
+
+
+def hash_reporte(texto: str) -> str:
+    """
+    Hash del contenido de un reporte, usado como clave de caché y como ETag de su PDF.
+    """
+    return hashlib.sha256(VERSION_PDF + texto.encode("utf-8")).hexdigest()
+
+
+def trocear(datos: bytes, tamano: int = TAMANO_TROZO) -> Iterable[bytes]:
+    """
+    Divide unos bytes en trozos para enviarlos como respuesta en streaming.
+    """
+    vista = memoryview(datos)
+    for inicio in range(0, len(datos), tamano):
+        yield bytes(vista[inicio:inicio + tamano])
+
+
+class ExportadorPDF:
+    """
+    Renderiza reportes a PDF en un pool de procesos, fuera del bucle de eventos, y guarda los bytes en
+    una caché LRU en memoria indexada por el hash del reporte.
+    """
+
+    def __init__(self, procesos: Optional[int] = None, max_bytes: Optional[int] = None):
+        """
+        :param procesos: Procesos del pool de renderizado (PDF_PROCESOS, por defecto 2).
+        :param max_bytes: Tamaño máximo de la caché de PDF (PDF_CACHE_MAX_BYTES, por defecto 64 MB).
+        """
+        self.procesos = procesos or int(os.getenv("PDF_PROCESOS", "2"))
+        self.max_bytes = max_bytes or int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._candado = threading.Lock()
+        # Dos peticiones del mismo reporte a la vez comparten un único renderizado
+        self._vuelos = GrupoVuelo("pdf")
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        with self._candado:
+            if self._pool is None:
+                # "spawn": el proceso del servidor tiene hilos, y hacer fork con hilos activos no es seguro
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def precalentar(self) -> None:
+        """
+        Arranca los procesos del pool con un renderizado vacío, para que el primer PDF no pague el
+        arranque del intérprete.
+        """
+        pool = self._obtener_pool()
+        for _ in range(self.procesos):
+            pool.submit(renderizar_pdf, "")
+
+    def _leer_cache(self, clave: str) -> Optional[bytes]:
+        with self._candado:
+            pdf = self._cache.get(clave)
+            if pdf is None:
+                self.fallos += 1
+                return None
+            self._cache.move_to_end(clave)
+            self.aciertos += 1
+            return pdf
+
+    def _guardar_cache(self, clave: str, pdf: bytes) -> None:
+        with self._candado:
+            if clave in self._cache:
+                return
+            self._cache[clave] = pdf
+            self._bytes += len(pdf)
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, expulsado = self._cache.popitem(last=False)
+                self._bytes -= len(expulsado)
+
+    async def _renderizar(self, clave: str, texto: str) -> bytes:
+        pdf = await asyncio.get_running_loop().run_in_executor(self._obtener_pool(), renderizar_pdf, texto)
+        self._guardar_cache(clave, pdf)
+        return pdf
+
+    async def obtener(self, texto: str) -> Tuple[bytes, str]:
+        """
+        Devuelve el PDF del reporte y su hash, renderizándolo solo si no está en caché.
+
+        Args:
+            texto (str): Reporte en Markdown.
+
+        Returns:
+            Tuple[bytes, str]: Bytes del PDF y hash del reporte (para el ETag).
+        """
+        clave = hash_reporte(texto)
+        pdf = self._leer_cache(clave)
+        if pdf is None:
+            pdf = await self._vuelos.aejecutar(clave, lambda: self._renderizar(clave, texto))
+        return pdf, clave
+
+    async def zip_reportes(self, reportes: Iterable[Tuple[str, str]]) -> AsyncIterator[bytes]:
+        """
+        Genera un ZIP con el PDF de cada reporte, emitiendo sus bytes a medida que se renderizan.
+
+        Args:
+            reportes: Pares (nombre del fichero dentro del ZIP, reporte en Markdown).
+
+        Yields:
+            bytes: Trozos consecutivos del ZIP.
+        """
+        async def renderizar(nombre: str, texto: str) -> Tuple[str, bytes]:
+            try:
+                pdf, _ = await self.obtener(texto)
+                return nombre, pdf
+            except Exception as e:
+                # Un reporte que falla no corta el ZIP: se incluye el error en su lugar
+                print(f"Error al generar el PDF {nombre}: {e}")
+                return f"{nombre}.error.txt", f"Error al generar el PDF: {e}".encode("utf-8")
+
+        salida = _SalidaZip()
+        # Los PDF ya van comprimidos: se guardan sin volver a comprimir para no cargar el bucle de eventos
+        with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as archivo:
+            for tarea in asyncio.as_completed([renderizar(nombre, texto) for nombre, texto in reportes]):
+                nombre, pdf = await tarea
+                archivo.writestr(nombre, pdf)
+                for trozo in trocear(salida.vaciar()):
+                    yield trozo
+        yield salida.vaciar()  # directorio central
+
+    def estadisticas(self) -> dict:
+        with self._candado:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "entradas": len(self._cache), "bytes": self._bytes}
+
+    def cerrar(self) -> None:
+        with self._candado:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+class _SalidaZip:
+    """
+    Destino de escritura no posicionable para zipfile: acumula lo escrito hasta que se vacía.
+    """
+
+    def __init__(self):
+        self._trozos = []
+
+    def write(self, datos: bytes) -> int:
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._trozos)
+        self._trozos.clear()
+        return datos
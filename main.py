@@ -1,49 +1,175 @@
-from fastapi import FastAPI, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
-from model.ai_model import correr_modelo
-from utils import guardar_pdf, generar_graficos
-import uuid
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from model.ai_model import almacen_precios, especulador, clave_consulta, consulta_generica, correr_modelo_async, registro_marcos, servicio_noticias, correr_modelo_stream, precalentar_agentes, preparar_lote, redactar_reporte, ticker_local
+from exportador_pdf import ExportadorPDF, trocear
+from almacen_graficos import RUTA_PLOTLY_JS, pagina_html
+from cola_trabajos import COMPLETADO, ERROR, GrupoTrabajadores, crear_cola
+from reportes import cache, graficos, registrar_reporte
+from precalculo import ContadorPopularidad, Planificador, PresupuestoLLM
+from model.coalescencia import GrupoVuelo, estadisticas_grupos
+from model.cache_llm import obtener_cache_llm
+from model.metricas import exportar_prometheus, formatear_desglose, iniciar_desglose, registrar_colector
+from model.pasarela_llm import estadisticas_pasarela
+from model.plazos import estadisticas as estadisticas_plazos, plazo, plazo_reporte
 import os
 import asyncio
 import time
+import json
+from typing import List, Optional
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
 app = FastAPI()
-# Diccionario para almacenar los resultados temporalmente
-cache = {}
+# PDF renderizados en un pool de procesos y guardados en memoria por el hash del reporte
+exportador_pdf = ExportadorPDF()
+
+# Cola durable de trabajos de reporte y procesos trabajadores que la atienden
+cola_trabajos = crear_cola()
+trabajadores = GrupoTrabajadores(cola_trabajos)
 
 # Configurar un executor para tareas que pueden tomar tiempo
 executor = ThreadPoolExecutor(max_workers=4)
+# Las peticiones simultáneas con el mismo ticker y la misma pregunta comparten una sola ejecución del
+# grafo, y su resultado se reutiliza durante COALESCENCIA_VENTANA segundos
+vuelos_reportes = GrupoVuelo("reportes", retener=float(os.getenv("COALESCENCIA_VENTANA", "30")))
+
+# Peticiones por ticker (con decaimiento) y reportes recalculados en segundo plano para los más pedidos
+popularidad = ContadorPopularidad(vida_media=float(os.getenv("PRECALCULO_VIDA_MEDIA", "3600")))
+PRECALCULO_TTL = float(os.getenv("PRECALCULO_TTL", "900"))
+
+# Estadísticas de las cachés que /metrics exporta junto a las latencias
+registrar_colector("resultados", cache.estadisticas)
+registrar_colector("coalescencia", estadisticas_grupos)
+registrar_colector("noticias", servicio_noticias.estadisticas)
+registrar_colector("especulacion", especulador.estadisticas)
+if obtener_cache_llm() is not None:
+    registrar_colector("llm_cache", obtener_cache_llm().estadisticas)
+registrar_colector("pasarela_llm", estadisticas_pasarela)
+registrar_colector("plazos", estadisticas_plazos)
+registrar_colector("marcos", registro_marcos.estadisticas)
+registrar_colector("trabajos", cola_trabajos.estadisticas)
+registrar_colector("graficos", graficos.estadisticas)
+registrar_colector("pdf", exportador_pdf.estadisticas)
+
+@app.on_event("startup")
+async def precalentar():
+    """
+    Construye los agentes y abre las conexiones con el LLM antes de atender peticiones.
+    """
+    loop = asyncio.get_event_loop()
+    exportador_pdf.precalentar()
+    if trabajadores.procesos:
+        if os.getenv("ALMACEN_RESULTADOS", "sqlite") == "memoria":
+            print("Aviso: con ALMACEN_RESULTADOS=memoria los reportes de los trabajadores no llegan a este proceso (PDF no disponible)")
+        trabajadores.arrancar()
+        asyncio.create_task(vigilar_trabajadores())
+    planificador.arrancar()
+    try:
+        await loop.run_in_executor(executor, precalentar_agentes)
+    except Exception as e:
+        print(f"Error precalentando los agentes: {e}")
+
+async def vigilar_trabajadores():
+    """
+    Relanza los trabajadores caídos y devuelve a la cola los trabajos que dejaron a medias.
+    """
+    while True:
+        await asyncio.sleep(5)
+        try:
+            await asyncio.to_thread(trabajadores.vigilar)
+        except Exception as e:
+            print(f"Error vigilando los trabajadores: {e}")
+
+@app.on_event("shutdown")
+async def cerrar():
+    planificador.parar()
+    exportador_pdf.cerrar()
+    await asyncio.to_thread(trabajadores.parar)
 
-def ejecutar_modelo_con_timeout(consulta: str, timeout: int = 45):
+async def ejecutar_modelo_con_timeout(consulta: str, timeout: Optional[float] = None):
     """
-    Ejecuta el modelo con un timeout específico.
+    Ejecuta el modelo con un timeout específico (por defecto PLAZO_REPORTE). El plazo llega a cada
+    nodo y a cada llamada externa, y al vencer se cancela el trabajo pendiente. El estado final
+    incluye en "tiempos" el desglose de la ejecución por nodo y por servicio externo.
     """
+    timeout = timeout if timeout is not None else plazo_reporte()
     try:
         start_time = time.time()
-        estado_final = correr_modelo(consulta)
+        desglose = iniciar_desglose()
+        with plazo(timeout):
+            async with asyncio.timeout(timeout):
+                estado_final = await correr_modelo_async(consulta)
         execution_time = time.time() - start_time
 
         print(f"Modelo ejecutado en {execution_time:.2f} segundos")
-        return estado_final
+        return {**estado_final, "tiempos": formatear_desglose(desglose, execution_time)}
 
     except Exception as e:
         print(f"Error en ejecución del modelo: {e}")
         raise e
 
+async def regenerar_precalculado(ticker: str) -> None:
+    """
+    Calcula el reporte completo de un ticker y lo deja en caché para las siguientes peticiones.
+    """
+    estado_final = await vuelos_reportes.aejecutar(clave_consulta(ticker), lambda: ejecutar_modelo_con_timeout(ticker))
+    if not estado_final or not estado_final.get("respuesta_final") or not estado_final.get("datos_financieros"):
+        raise ValueError("el modelo no devolvió un reporte válido")
+    respuesta = await asyncio.to_thread(registrar_reporte, estado_final, ticker)
+    # Los tiempos son los de la ejecución en segundo plano, no los de la petición que lo recibirá
+    respuesta["tiempos"] = None
+    await asyncio.to_thread(cache.guardar, f"precalculado:{ticker}", {**respuesta, "creado": time.time()})
+
+async def precalentar_datos(ticker: str) -> None:
+    """
+    Refresca los precios y las noticias de un ticker sin llamar al LLM.
+    """
+    await asyncio.gather(
+        asyncio.to_thread(almacen_precios.obtener, ticker),
+        asyncio.to_thread(servicio_noticias.obtener, ticker),
+    )
+
+planificador = Planificador(
+    popularidad,
+    regenerar=regenerar_precalculado,
+    precalentar=precalentar_datos,
+    presupuesto=PresupuestoLLM(int(os.getenv("PRECALCULO_LLM_POR_HORA", "60"))),
+    # El ticker se resuelve en el índice local; el LLM redacta el informe (y analiza, si ANALISIS_LLM=1)
+    llamadas_por_reporte=2 if os.getenv("ANALISIS_LLM", "0") == "1" else 1,
+)
+registrar_colector("precalculo", planificador.estadisticas)
+
+def reporte_precalculado(ticker: str):
+    """
+    Reporte recalculado en segundo plano para un ticker, si existe y tiene menos de PRECALCULO_TTL segundos.
+    """
+    entrada = cache.obtener(f"precalculado:{ticker}")
+    if entrada is None or time.time() - entrada.get("creado", 0) > PRECALCULO_TTL:
+        return None
+    return entrada
+
 @app.post("/generar_datos/")
 async def generar_datos(consulta: str = Form(...)):
     """
-    Genera el contenido del reporte financiero y los datos para la gráfica.
+    Genera el contenido del reporte financiero y los datos para la gráfica. Las consultas que son solo
+    un ticker de los más pedidos (o el nombre de su empresa) se sirven desde el reporte que el
+    planificador recalcula en segundo plano; una pregunta concreta siempre ejecuta el grafo.
     """
     try:
-        # Ejecutar el modelo con timeout usando asyncio
-        loop = asyncio.get_event_loop()
+        ticker = ticker_local(consulta)
+        if ticker is not None:
+            popularidad.registrar(ticker)
+        if ticker is not None and consulta_generica(consulta, ticker):
+            precalculado = await asyncio.to_thread(reporte_precalculado, ticker)
+            if precalculado is not None:
+                planificador.servido()
+                precalculado.pop("creado", None)
+                return JSONResponse({**precalculado, "precalculado": True})
 
-        # Ejecutar en un thread separado con timeout
+        # Ejecutar el grafo de forma asíncrona con timeout: no ocupa ningún hilo mientras espera a la red.
+        # Si vence (o el cliente se va) y nadie más espera el mismo reporte, el grafo se cancela.
         estado_final = await asyncio.wait_for(
-            loop.run_in_executor(executor, ejecutar_modelo_con_timeout, consulta, 45),
-            timeout=50.0  # Timeout total de 50 segundos
+            vuelos_reportes.aejecutar(clave_consulta(consulta), lambda: ejecutar_modelo_con_timeout(consulta)),
+            timeout=plazo_reporte() + 5  # Margen sobre el plazo del reporte, por si se une a uno ya en curso
         )
 
         # Verificar que tenemos datos válidos
@@ -53,34 +179,7 @@ async def generar_datos(consulta: str = Form(...)):
                 detail="No se pudieron generar datos válidos para el reporte"
             )
 
-        # Preparar datos para la gráfica
-        try:
-            ruta_figura = generar_graficos(
-                estado_final["datos_financieros"][-1],
-                estado_final["ticker"][-1]
-            )
-        except Exception as e:
-            print(f"Error generando gráficos: {e}")
-            ruta_figura = None
-
-        reporte_texto = estado_final["respuesta_final"][-1]
-
-        # Generar un ID único para esta consulta
-        reporte_id = str(uuid.uuid4())
-
-        # Guardar los datos en caché
-        cache[reporte_id] = {
-            "reporte_texto": reporte_texto,
-            "ticker": estado_final["ticker"][-1] if estado_final.get("ticker") else "N/A",
-            "ruta_figura": ruta_figura,
-            "consulta": consulta
-        }
-
-        return JSONResponse({
-            "reporte_texto": reporte_texto,
-            "ruta_figura": ruta_figura,
-            "reporte_id": reporte_id
-        })
+        return JSONResponse(await asyncio.to_thread(registrar_reporte, estado_final, consulta))
 
     except asyncio.TimeoutError:
         raise HTTPException(
@@ -93,19 +192,286 @@ async def generar_datos(consulta: str = Form(...)):
             status_code=500,
             detail=f"Error interno del servidor: {str(e)}"
         )
+def evento_sse(evento: str, datos: dict) -> str:
+    """
+    Serializa un evento en formato Server-Sent Events.
+    """
+    return f"event: {evento}\ndata: {json.dumps(datos)}\n\n"
+
+@app.post("/generar_datos_stream/")
+async def generar_datos_stream(consulta: str = Form(...)):
+    """
+    Igual que /generar_datos/, pero como Server-Sent Events: un evento `progreso` por cada nodo del
+    grafo que termina, un evento `token` por cada fragmento del informe según lo escribe el LLM y un
+    evento `final` con los mismos campos que /generar_datos/ (o `error` si algo falla).
+    """
+    async def emitir():
+        try:
+            inicio = time.time()
+            desglose = iniciar_desglose()
+            with plazo(plazo_reporte()):
+                async with asyncio.timeout(plazo_reporte()):
+                    async for evento, datos in correr_modelo_stream(consulta):
+                        if evento == "progreso":
+                            yield evento_sse("progreso", {"nodo": datos})
+                        elif evento == "token":
+                            yield evento_sse("token", {"texto": datos})
+                        elif not datos or not datos.get("respuesta_final") or not datos.get("datos_financieros"):
+                            yield evento_sse("error", {"detalle": "No se pudieron generar datos válidos para el reporte"})
+                        else:
+                            datos = {**datos, "tiempos": formatear_desglose(desglose, time.time() - inicio)}
+                            yield evento_sse("final", await asyncio.to_thread(registrar_reporte, datos, consulta))
+        except TimeoutError:
+            yield evento_sse("error", {"detalle": "El análisis está tomando más tiempo del esperado. Por favor, intenta nuevamente."})
+        except Exception as e:
+            print(f"Error en generar_datos_stream: {e}")
+            yield evento_sse("error", {"detalle": f"Error interno del servidor: {str(e)}"})
+
+    return StreamingResponse(
+        emitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/trabajos/", status_code=202)
+async def crear_trabajo(consulta: str = Form(...), prioridad: int = Form(0)):
+    """
+    Encola un reporte y devuelve su ID al instante. Si ya hay un trabajo pendiente o en curso con el
+    mismo ticker y la misma pregunta, se devuelve ese. El estado se consulta en /trabajos/{id} o se sigue
+    en /trabajos/{id}/eventos.
+    """
+    try:
+        trabajo_id, nuevo = await asyncio.to_thread(cola_trabajos.encolar, consulta, clave_consulta(consulta), prioridad)
+    except Exception as e:
+        print(f"Error encolando el trabajo: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    return {
+        "trabajo_id": trabajo_id,
+        "duplicado": not nuevo,
+        "url_estado": f"/trabajos/{trabajo_id}",
+        "url_eventos": f"/trabajos/{trabajo_id}/eventos",
+    }
+
+@app.get("/trabajos/{trabajo_id}")
+async def estado_trabajo(trabajo_id: str):
+    """
+    Estado de un trabajo: pendiente (con su posición en la cola), en_curso (con las etapas terminadas
+    y el texto del informe redactado hasta ahora), completado (con los mismos campos que /generar_datos/
+    en `resultado`) o error.
+    """
+    trabajo = await asyncio.to_thread(cola_trabajos.obtener, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+# Cada cuánto se consulta la cola al seguir un trabajo, y cada cuánto se manda un latido si no hay novedades
+INTERVALO_EVENTOS = 0.25
+LATIDO_EVENTOS = 15.0
+
+@app.get("/trabajos/{trabajo_id}/eventos")
+async def eventos_trabajo(trabajo_id: str):
+    """
+    Sigue un trabajo como Server-Sent Events: un evento `estado` cada vez que cambia, un evento `token`
+    con cada fragmento del informe según lo escribe el LLM (como en /generar_datos_stream/), `reinicio`
+    si el trabajo se vuelve a ejecutar desde el principio (el texto recibido deja de valer) y, al
+    terminar, `final` con el resultado o `error`.
+    """
+    if await asyncio.to_thread(cola_trabajos.obtener, trabajo_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def emitir():
+        anterior, intentos, enviado = None, None, 0
+        ultimo_evento = time.monotonic()
+        while True:
+            trabajo = await asyncio.to_thread(cola_trabajos.obtener, trabajo_id, enviado)
+            if trabajo is None:
+                yield evento_sse("error", {"detalle": "Trabajo no encontrado"})
+                return
+            # Un trabajo huérfano que otro trabajador retoma empieza el informe de nuevo
+            if intentos is not None and trabajo["intentos"] != intentos and enviado:
+                yield evento_sse("reinicio", {})
+                enviado = 0
+                trabajo = await asyncio.to_thread(cola_trabajos.obtener, trabajo_id)
+            intentos = trabajo["intentos"]
+            if trabajo["texto"]:
+                yield evento_sse("token", {"texto": trabajo["texto"]})
+                enviado += len(trabajo["texto"])
+                ultimo_evento = time.monotonic()
+            if trabajo["estado"] == COMPLETADO:
+                yield evento_sse("final", trabajo["resultado"])
+                return
+            if trabajo["estado"] == ERROR:
+                yield evento_sse("error", {"detalle": trabajo["error"]})
+                return
+            resumen = {k: trabajo[k] for k in ("estado", "posicion", "progreso")}
+            if resumen != anterior:
+                yield evento_sse("estado", resumen)
+                anterior = resumen
+                ultimo_evento = time.monotonic()
+            elif time.monotonic() - ultimo_evento >= LATIDO_EVENTOS:
+                # Comentario SSE: mantiene viva la conexión mientras el trabajo espera en la cola
+                yield ": latido\n\n"
+                ultimo_evento = time.monotonic()
+            await asyncio.sleep(INTERVALO_EVENTOS)
+
+    return StreamingResponse(
+        emitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def procesar_reporte_lote(preparado: dict) -> dict:
+    """
+    Redacta y registra el reporte de un elemento del lote. Nunca lanza: los errores van en la respuesta.
+    """
+    try:
+        with plazo(plazo_reporte()):
+            async with asyncio.timeout(plazo_reporte()):
+                estado_final = await redactar_reporte(preparado)
+        respuesta = await asyncio.to_thread(registrar_reporte, estado_final, preparado["consulta"])
+    except TimeoutError:
+        respuesta = {"error": "El análisis está tomando más tiempo del esperado. Por favor, intenta nuevamente."}
+    except Exception as e:
+        print(f"Error en el reporte por lotes de {preparado.get('ticker')}: {e}")
+        respuesta = {"error": str(e)}
+    return {"consulta": preparado["consulta"], "ticker": preparado.get("ticker"), **respuesta}
+
+@app.post("/generar_lote/")
+async def generar_lote(consultas: List[str] = Form(...)):
+    """
+    Genera reportes para varias consultas o tickers. Los precios se descargan con una sola petición
+    y cada reporte se devuelve en cuanto termina, como una línea JSON (NDJSON).
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        preparados = await loop.run_in_executor(executor, preparar_lote, consultas)
+    except Exception as e:
+        print(f"Error preparando el lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+    async def emitir():
+        for preparado in preparados:
+            if "error" in preparado:
+                yield json.dumps({k: preparado.get(k) for k in ("consulta", "ticker", "error")}) + "\n"
+        # La concurrencia de noticias y LLM la limitan los semáforos de cada servicio
+        tareas = [procesar_reporte_lote(preparado) for preparado in preparados if "error" not in preparado]
+        for tarea in asyncio.as_completed(tareas):
+            yield json.dumps(await tarea) + "\n"
+
+    return StreamingResponse(emitir(), media_type="application/x-ndjson")
+
+@app.get("/cache/estadisticas")
+async def estadisticas_cache():
+    """
+    Devuelve aciertos, fallos, expulsiones, entradas y bytes del almacén de resultados, y las
+    llamadas ejecutadas y ahorradas por coalescencia, los aciertos de las cachés de noticias y del LLM
+    y de las descargas especulativas, el tamaño de los almacenes de gráficos y de PDF, los trabajos de la cola
+    por estado y los reportes precalculados para los tickers más pedidos.
+    """
+    estadisticas = await asyncio.to_thread(cache.estadisticas)
+    return JSONResponse({
+        **estadisticas,
+        "coalescencia": estadisticas_grupos(),
+        "noticias": servicio_noticias.estadisticas(),
+        "especulacion": especulador.estadisticas(),
+        "llm": await asyncio.to_thread(obtener_cache_llm().estadisticas) if obtener_cache_llm() else None,
+        "pasarela_llm": estadisticas_pasarela(),
+        "plazos": estadisticas_plazos(),
+        "graficos": await asyncio.to_thread(graficos.estadisticas),
+        "pdf": exportador_pdf.estadisticas(),
+        "trabajos": {**await asyncio.to_thread(cola_trabajos.estadisticas), **trabajadores.estadisticas()},
+        "precalculo": {**planificador.estadisticas(), "top": popularidad.top(10)},
+    })
+
+@app.get("/metrics")
+async def metricas():
+    """
+    Métricas en formato Prometheus: latencia por nodo del grafo y por servicio externo, errores,
+    tokens por modelo y estadísticas de las cachés.
+    """
+    texto = await asyncio.to_thread(exportar_prometheus)
+    return PlainTextResponse(texto, media_type="text/plain; version=0.0.4")
+
+@app.get("/graficos/plotly.min.js")
+async def plotly_js():
+    """
+    Sirve plotly.js una sola vez para todas las figuras; el navegador lo guarda en caché.
+    """
+    return FileResponse(
+        RUTA_PLOTLY_JS,
+        media_type="application/javascript",
+        headers={"Cache-Control": "public, max-age=604800"},
+    )
+
+@app.get("/graficos/{grafico_id}.html")
+async def pagina_grafico(grafico_id: str):
+    """
+    Página ligera que dibuja la figura con el plotly.js compartido.
+    """
+    if not await asyncio.to_thread(graficos.existe, grafico_id):
+        raise HTTPException(status_code=404, detail="Gráfico no encontrado")
+    return HTMLResponse(pagina_html(f"/graficos/{grafico_id}", "/graficos/plotly.min.js"))
+
+@app.get("/graficos/{grafico_id}")
+async def obtener_grafico(grafico_id: str, request: Request):
+    """
+    Devuelve la especificación JSON de la figura. Su contenido nunca cambia para un mismo ID, así que
+    se puede guardar en caché indefinidamente.
+    """
+    etag = f'"{grafico_id}"'
+    cabeceras = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cabeceras)
+    figura = await asyncio.to_thread(graficos.leer, grafico_id)
+    if figura is None:
+        raise HTTPException(status_code=404, detail="Gráfico no encontrado")
+    return Response(figura, media_type="application/json", headers=cabeceras)
+
 @app.post("/descargar_pdf/")
-async def descargar_pdf(reporte_id: str = Form(...)):
+async def descargar_pdf(request: Request, reporte_id: str = Form(...)):
     """
     Genera y descarga el informe financiero en formato PDF utilizando datos almacenados.
     """
     # Verificar si el reporte existe en caché
-    if reporte_id not in cache:
+    reporte = await asyncio.to_thread(cache.obtener, reporte_id)
+    if reporte is None:
         return JSONResponse({"error": "Reporte no encontrado"}, status_code=404)
-    
-    reporte_texto = cache[reporte_id]["reporte_texto"]
 
     try:
-        # Intentar guardar el PDF
-        guardar_pdf(reporte_texto)
+        pdf, hash_pdf = await exportador_pdf.obtener(reporte["reporte_texto"])
     except Exception as e:
+        print(f"Error al generar el PDF: {e}")
         return JSONResponse({"error": f"Error al generar el PDF: {str(e)}"}, status_code=500)
+
+    etag = f'"{hash_pdf}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return StreamingResponse(
+        trocear(pdf),
+        media_type="application/pdf",
+        headers={
+            "Content-Length": str(len(pdf)),
+            "ETag": etag,
+            "Content-Disposition": f'attachment; filename="reporte_financiero_{reporte_id}.pdf"',
+        },
+    )
+
+@app.post("/descargar_pdf_lote/")
+async def descargar_pdf_lote(reporte_ids: List[str] = Form(...)):
+    """
+    Descarga un ZIP con el PDF de varios reportes. El ZIP se envía a medida que se renderiza cada PDF.
+    """
+    reportes = []
+    for reporte_id in dict.fromkeys(reporte_ids):
+        reporte = await asyncio.to_thread(cache.obtener, reporte_id)
+        if reporte is not None:
+            nombre = f"reporte_financiero_{reporte.get('ticker', 'NA')}_{reporte_id}.pdf"
+            reportes.append((nombre, reporte["reporte_texto"]))
+    if not reportes:
+        return JSONResponse({"error": "Reportes no encontrados"}, status_code=404)
+
+    return StreamingResponse(
+        exportador_pdf.zip_reportes(reportes),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="reportes_financieros.zip"'},
+    )
@@ -0,0 +1,307 @@
+import io
+import re
+from functools import lru_cache
+from typing import Iterator, List, NamedTuple, Tuple
+
+import markdown
+from bs4 import BeautifulSoup, NavigableString, Tag
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+# Fuente según (negrita, cursiva); el código en línea usa Courier
+FUENTES = {
+    (False, False): "Helvetica",
+    (True, False): "Helvetica-Bold",
+    (False, True): "Helvetica-Oblique",
+    (True, True): "Helvetica-BoldOblique",
+}
+FUENTE_CODIGO = "Courier"
+
+# Los flujos ya van comprimidos con Flate: codificarlos además en ASCII85 solo cuesta tiempo y bytes
+rl_config.useA85 = 0
+
+PATRON_PALABRA = re.compile(r"\S+")
+
+# Salto de línea forzado (<br>), distinto de los saltos de línea del propio texto HTML
+SALTO = "\u2028"
+
+
+class EstiloBloque(NamedTuple):
+    tamano: float
+    interlineado: float
+    negrita: bool = False
+    centrado: bool = False
+    espacio_despues: float = 6.0
+
+
+ESTILOS = {
+    "h1": EstiloBloque(14, 20, negrita=True, centrado=True, espacio_despues=8),
+    "h2": EstiloBloque(12, 17, negrita=True, centrado=True),
+    "h3": EstiloBloque(11, 15, negrita=True),
+    "h4": EstiloBloque(10, 14, negrita=True),
+    "p": EstiloBloque(10, 14),
+    "li": EstiloBloque(10, 14, espacio_despues=2),
+    "pre": EstiloBloque(9, 12),
+}
+
+
+class _AnchosFuente(dict):
+    """
+    Anchos en puntos (a tamaño 1) de los caracteres y palabras de una fuente, medidos una sola vez.
+    """
+
+    def __init__(self, fuente: str):
+        super().__init__()
+        self.fuente = fuente
+        self.glifos = {}
+
+    def __missing__(self, palabra: str) -> float:
+        glifos = self.glifos
+        ancho = 0.0
+        for caracter in palabra:
+            valor = glifos.get(caracter)
+            if valor is None:
+                valor = glifos[caracter] = pdfmetrics.stringWidth(caracter, self.fuente, 1.0)
+            ancho += valor
+        # Las palabras se repiten mucho en un informe: también se guardan, hasta un límite
+        if len(self) < 50000:
+            self[palabra] = ancho
+        return ancho
+
+
+@lru_cache(maxsize=None)
+def anchos_fuente(fuente: str) -> _AnchosFuente:
+    return _AnchosFuente(fuente)
+
+
+class Palabra(NamedTuple):
+    texto: str
+    fuente: str
+    espacio_antes: bool
+
+
+def _fragmentos(nodo: Tag, negrita: bool = False, cursiva: bool = False, codigo: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    Recorre el HTML de un bloque y devuelve pares (texto, fuente) con los estilos en línea aplicados.
+    """
+    for hijo in nodo.children:
+        if isinstance(hijo, NavigableString):
+            yield str(hijo), FUENTE_CODIGO if codigo else FUENTES[(negrita, cursiva)]
+        elif hijo.name in ("strong", "b"):
+            yield from _fragmentos(hijo, True, cursiva, codigo)
+        elif hijo.name in ("em", "i"):
+            yield from _fragmentos(hijo, negrita, True, codigo)
+        elif hijo.name == "code":
+            yield from _fragmentos(hijo, negrita, cursiva, True)
+        elif hijo.name == "br":
+            yield SALTO, FUENTES[(negrita, cursiva)]
+        elif hijo.name in ("ul", "ol"):
+            continue  # las listas anidadas se maquetan como bloques propios
+        else:
+            yield from _fragmentos(hijo, negrita, cursiva, codigo)
+
+
+def _palabras(fragmentos: Iterator[Tuple[str, str]]) -> List[Palabra]:
+    """
+    Divide los fragmentos en palabras, recordando si iban separadas de la anterior por un espacio
+    (para no separar, por ejemplo, una palabra en negrita de la coma que la sigue).
+    """
+    palabras: List[Palabra] = []
+    espacio_pendiente = False
+    for texto, fuente in fragmentos:
+        if texto == SALTO:
+            palabras.append(Palabra(SALTO, fuente, False))
+            espacio_pendiente = False
+            continue
+        fin_anterior = 0
+        for coincidencia in PATRON_PALABRA.finditer(texto):
+            separada = espacio_pendiente or coincidencia.start() > fin_anterior
+            palabras.append(Palabra(coincidencia.group(), fuente, separada))
+            espacio_pendiente = False
+            fin_anterior = coincidencia.end()
+        if fin_anterior < len(texto):
+            espacio_pendiente = True
+    return palabras
+
+
+def _trozos(palabra: Palabra, ancho_maximo: float) -> List[Palabra]:
+    """
+    Corta una palabra más ancha que una línea entera (una línea de código, una URL larga) en trozos
+    que quepan; `ancho_maximo` va en unidades de tamaño 1.
+    """
+    medidas = anchos_fuente(palabra.fuente)
+    if medidas[palabra.texto] <= ancho_maximo:
+        return [palabra]
+    trozos: List[Palabra] = []
+    inicio, ancho = 0, 0.0
+    for i, caracter in enumerate(palabra.texto):
+        ancho_caracter = medidas[caracter]
+        if i > inicio and ancho + ancho_caracter > ancho_maximo:
+            trozos.append(Palabra(palabra.texto[inicio:i], palabra.fuente, palabra.espacio_antes and not trozos))
+            inicio, ancho = i, 0.0
+        ancho += ancho_caracter
+    trozos.append(Palabra(palabra.texto[inicio:], palabra.fuente, palabra.espacio_antes and not trozos))
+    return trozos
+
+
+def partir_lineas(palabras: List[Palabra], ancho_disponible: float, tamano: float) -> List[List[Palabra]]:
+    """
+    Reparte las palabras en líneas que no superan `ancho_disponible`, midiendo con los anchos reales
+    de cada fuente.
+    """
+    lineas: List[List[Palabra]] = []
+    linea: List[Palabra] = []
+    ancho = 0.0
+    for palabra in palabras:
+        if palabra.texto == SALTO:
+            lineas.append(linea)
+            linea, ancho = [], 0.0
+            continue
+        medidas = anchos_fuente(palabra.fuente)
+        for trozo in _trozos(palabra, ancho_disponible / tamano):
+            ancho_palabra = medidas[trozo.texto] * tamano
+            separacion = medidas[" "] * tamano if linea and trozo.espacio_antes else 0.0
+            if linea and ancho + separacion + ancho_palabra > ancho_disponible:
+                lineas.append(linea)
+                linea, ancho, separacion = [], 0.0, 0.0
+            linea.append(trozo)
+            ancho += separacion + ancho_palabra
+    if linea:
+        lineas.append(linea)
+    return lineas
+
+
+def ancho_linea(linea: List[Palabra], tamano: float) -> float:
+    ancho = 0.0
+    for i, palabra in enumerate(linea):
+        medidas = anchos_fuente(palabra.fuente)
+        ancho += medidas[palabra.texto]
+        if i and palabra.espacio_antes:
+            ancho += medidas[" "]
+    return ancho * tamano
+
+
+class MaquetadorPDF:
+    """
+    Maqueta bloques de texto con estilos en línea sobre un canvas de ReportLab. Cada párrafo se emite
+    como un único objeto de texto, y la fuente solo se cambia cuando cambia el estilo.
+    """
+
+    def __init__(self, pdf: canvas.Canvas, margen: float = 60):
+        self.pdf = pdf
+        self.ancho_pagina, self.alto_pagina = pdf._pagesize
+        self.margen = margen
+        self.y = self.alto_pagina - margen
+
+    def _nueva_pagina(self) -> None:
+        self.pdf.showPage()
+        self.y = self.alto_pagina - self.margen
+
+    def bloque(self, palabras: List[Palabra], estilo: EstiloBloque, sangria: float = 0.0) -> None:
+        """
+        Escribe un bloque (párrafo, título o elemento de lista) y avanza la posición vertical.
+        """
+        x = self.margen + sangria
+        ancho_disponible = self.ancho_pagina - self.margen - x
+        lineas = partir_lineas(palabras, ancho_disponible, estilo.tamano)
+        if not lineas:
+            return
+
+        texto = None
+        fuente_actual = None
+        for linea in lineas:
+            if self.y < self.margen:
+                if texto is not None:
+                    self.pdf.drawText(texto)
+                    texto = None
+                self._nueva_pagina()
+            if texto is None:
+                texto = self.pdf.beginText(x, self.y)
+                texto.setLeading(estilo.interlineado)
+                fuente_actual = None
+            # Las líneas alineadas a la izquierda solo bajan con T* (textLine); las centradas se recolocan
+            if estilo.centrado:
+                texto.setTextOrigin((self.ancho_pagina - ancho_linea(linea, estilo.tamano)) / 2, self.y)
+
+            # Palabras consecutivas con la misma fuente van en una sola cadena
+            tramo: List[str] = []
+            for i, palabra in enumerate(linea):
+                if palabra.fuente != fuente_actual:
+                    if tramo:
+                        texto.textOut("".join(tramo))
+                        tramo = []
+                    texto.setFont(palabra.fuente, estilo.tamano, estilo.interlineado)
+                    fuente_actual = palabra.fuente
+                if i and palabra.espacio_antes:
+                    tramo.append(" ")
+                tramo.append(palabra.texto)
+            texto.textLine("".join(tramo))
+            self.y -= estilo.interlineado
+
+        self.pdf.drawText(texto)
+        self.y -= estilo.espacio_despues
+
+
+def _bloques(contenedor: Tag, nivel_lista: int = 0) -> Iterator[Tuple[List[Palabra], EstiloBloque, float]]:
+    """
+    Convierte el HTML del Markdown en bloques (palabras, estilo, sangría) listos para maquetar.
+    """
+    for nodo in contenedor.children:
+        if isinstance(nodo, NavigableString):
+            if nodo.strip():
+                yield _palabras(iter([(str(nodo), FUENTES[(False, False)])])), ESTILOS["p"], 0.0
+            continue
+        if nodo.name in ("ul", "ol"):
+            for numero, li in enumerate(nodo.find_all("li", recursive=False), start=1):
+                vineta = f"{numero}." if nodo.name == "ol" else "•"
+                palabras = _palabras(_fragmentos(li))
+                if palabras:
+                    palabras[0] = palabras[0]._replace(espacio_antes=True)
+                palabras.insert(0, Palabra(vineta, FUENTES[(False, False)], False))
+                yield palabras, ESTILOS["li"], 20.0 * (nivel_lista + 1)
+                for sublista in li.find_all(["ul", "ol"], recursive=False):
+                    yield from _bloques(_envolver(sublista), nivel_lista + 1)
+        elif nodo.name == "pre":
+            # Un solo bloque con saltos forzados: las líneas vacías del código también ocupan su línea
+            palabras: List[Palabra] = []
+            for i, linea in enumerate(nodo.get_text().splitlines()):
+                if i:
+                    palabras.append(Palabra(SALTO, FUENTE_CODIGO, False))
+                if linea:
+                    palabras.append(Palabra(linea, FUENTE_CODIGO, False))
+            yield palabras, ESTILOS["pre"], 0.0
+        elif nodo.name in ESTILOS:
+            estilo = ESTILOS[nodo.name]
+            yield _palabras(_fragmentos(nodo, negrita=estilo.negrita)), estilo, 0.0
+        elif nodo.name in ("h5", "h6"):
+            yield _palabras(_fragmentos(nodo, negrita=True)), ESTILOS["h4"], 0.0
+        elif nodo.name in ("blockquote", "div"):
+            yield from _bloques(nodo, nivel_lista)
+        elif nodo.name != "hr":
+            yield _palabras(_fragmentos(nodo)), ESTILOS["p"], 0.0
+
+
+def _envolver(nodo: Tag) -> Tag:
+    # _bloques recorre los hijos de un contenedor: una lista suelta necesita uno
+    contenedor = BeautifulSoup("", "html.parser").new_tag("div")
+    contenedor.append(nodo.__copy__())
+    return contenedor
+
+
+def maquetar_markdown(contenido_markdown: str) -> bytes:
+    """
+    Convierte un informe en Markdown a un PDF A4 en memoria.
+
+    :param contenido_markdown: Texto en formato Markdown.
+    :return: Bytes del PDF.
+    """
+    soup = BeautifulSoup(markdown.markdown(contenido_markdown), "lxml")
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    maquetador = MaquetadorPDF(pdf)
+    for palabras, estilo, sangria in _bloques(soup.body or soup):
+        maquetador.bloque(palabras, estilo, sangria)
+    pdf.save()
+    return buffer.getvalue()
@@ -1,18 +1,115 @@
 from langgraph.graph import StateGraph, END, START
-from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_groq import ChatGroq
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from ddgs import DDGS
-from typing import List, TypedDict, Annotated
+from typing import Annotated, Dict, List, Optional, TypedDict
+import asyncio
 import operator
+import os
 import yfinance as yf
 import pandas as pd
 from datetime import datetime
-# Obtener la clave de API desde las variables de entorno
+# Obtener la clave de API desde las variables de entorno (antes de importar los módulos que leen la configuración)
 load_dotenv()
+from model.almacen_precios import AlmacenPrecios
+from model.coalescencia import GrupoVuelo
+from model.concurrencia import ejecutar_en_servicio, limitar
+from model.especulacion import Especulador
+from model.clientes import obtener_agente, precalentar_conexiones
+from model.resolutor_tickers import UMBRAL_CONFIANZA, normalizar, obtener_indice
+from model.indicadores import calcular_indicadores, formatear_indicadores
+from model.noticias import ServicioNoticias
+from model.ohlcv import normalizar_ohlcv
+from model.metricas import instrumentar_nodo, medir
+from model.pasarela_llm import obtener_pasarela
+from model.plazos import acotar, comprobar, limitar_nodo, plazo_peticion
+from model.prompts import compactar, rellenar_con_presupuesto
+from model.registro_marcos import RegistroMarcos
+
+def _descargar_yfinance(ticker: str, inicio=None) -> pd.DataFrame:
+    """
+    Descarga barras diarias de Yahoo Finance y las deja en el esquema canónico (model/ohlcv.py).
+
+    Args:
+        ticker (str): Símbolo del ticker de la empresa.
+        inicio (datetime, opcional): Fecha desde la que descargar (incluida). Si es None, se descarga el último año.
+
+    Returns:
+        pd.DataFrame: Barras canónicas ordenadas por fecha (de solo lectura).
+    """
+    rango = {"period": "1y"} if inicio is None else {"start": pd.Timestamp(inicio).strftime("%Y-%m-%d")}
+    # El timeout de yfinance (10 s por defecto) se acorta a lo que le quede a la petición
+    rango["timeout"] = acotar(10)
+
+    # Descargar datos - usar group_by='ticker' para evitar MultiIndex cuando sea un solo ticker
+    with medir("llamada", "yfinance", "download"):
+        df = yf.download(ticker, auto_adjust=False, group_by='ticker', progress=False, **rango)
+
+    # Debug: Imprimir información sobre las columnas
+    print(f"Columnas descargadas para {ticker}: {list(df.columns)}")
+    print(f"Shape del DataFrame: {df.shape}")
+
+    # Si el DataFrame está vacío, intentar con auto_adjust=True (solo en la descarga completa:
+    # una cola vacía es normal si no hay barras nuevas)
+    if df.empty and inicio is None:
+        comprobar("el segundo intento de descarga")
+        print(f"Datos vacíos con auto_adjust=False, intentando con auto_adjust=True")
+        with medir("llamada", "yfinance", "download"):
+            df = yf.download(ticker, auto_adjust=True, group_by='ticker', progress=False, **rango)
+        print(f"Columnas con auto_adjust=True: {list(df.columns)}")
+
+    # Única normalización de las barras: MultiIndex, nombres, fechas, orden y tipos en una pasada
+    return normalizar_ohlcv(df)
+
+
+def _descargar_yfinance_lote(tickers: List[str], inicio=None) -> Dict[str, pd.DataFrame]:
+    """
+    Descarga barras diarias de varios tickers con una sola llamada a Yahoo Finance.
+
+    Args:
+        tickers (list): Símbolos de los tickers.
+        inicio (datetime, opcional): Fecha desde la que descargar (incluida). Si es None, se descarga el último año.
+
+    Returns:
+        dict: Barras canónicas por ticker. Los tickers sin datos no aparecen.
+    """
+    rango = {"period": "1y"} if inicio is None else {"start": pd.Timestamp(inicio).strftime("%Y-%m-%d")}
+    with medir("llamada", "yfinance", "download_lote"):
+        df = yf.download(tickers, auto_adjust=False, group_by='ticker', progress=False, threads=True, **rango)
+    if df.empty or not isinstance(df.columns, pd.MultiIndex):
+        return {}
+
+    # Con group_by='ticker' el primer nivel de columnas es el ticker: cada df[ticker] es un bloque
+    # del DataFrame descargado, que se normaliza directamente (una copia por columna)
+    marcos = {}
+    for ticker in df.columns.get_level_values(0).unique():
+        marco = df[ticker]
+        # Los tickers de mercados con otro calendario traen filas vacías en las fechas ajenas
+        vacias = marco.isna().all(axis=1)
+        if vacias.all():
+            continue
+        marcos[ticker] = normalizar_ohlcv(marco[~vacias] if vacias.any() else marco)
+    print(f"Descarga por lotes: {len(marcos)}/{len(tickers)} tickers con datos")
+    return marcos
+
+
+# Almacén local de precios: sirve barras cacheadas y solo descarga la cola que falta
+almacen_precios = AlmacenPrecios(descargar=_descargar_yfinance, descargar_lote=_descargar_yfinance_lote)
+
+
+# Barras de cada reporte, fuera del estado del grafo (el estado guarda solo su referencia); las que
+# se hayan olvidado mientras el reporte seguía en curso se vuelven a leer del almacén de precios
+registro_marcos = RegistroMarcos(recargar=almacen_precios.obtener)
+
+# Coalescencia de llamadas concurrentes a las herramientas para el mismo ticker
+vuelos_precios = GrupoVuelo("precios")
+vuelos_noticias = GrupoVuelo("noticias")
+# Noticias de varias consultas en paralelo, deduplicadas y guardadas por ticker durante NOTICIAS_TTL segundos
+servicio_noticias = ServicioNoticias(nombre_empresa=lambda ticker: obtener_indice().nombre(ticker))
+
+
 @tool
 def ObtenerDatosFinancieros(ticker: str) -> pd.DataFrame:
     """
@@ -24,37 +121,12 @@ def ObtenerDatosFinancieros(ticker: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame con los datos financieros históricos.
     """
+    return vuelos_precios.ejecutar(ticker.strip().upper(), _obtener_datos_financieros, ticker)
+
+
+def _obtener_datos_financieros(ticker: str) -> pd.DataFrame:
     try:
-        # Descargar datos - usar group_by='ticker' para evitar MultiIndex cuando sea un solo ticker
-        df = yf.download(ticker, period="1y", auto_adjust=False, group_by='ticker')
-
-        # Debug: Imprimir información sobre las columnas
-        print(f"Columnas descargadas para {ticker}: {list(df.columns)}")
-        print(f"Tipo de columnas: {type(df.columns)}")
-        print(f"Shape del DataFrame: {df.shape}")
-
-        # Si el DataFrame está vacío, intentar con auto_adjust=True
-        if df.empty:
-            print(f"Datos vacíos con auto_adjust=False, intentando con auto_adjust=True")
-            df = yf.download(ticker, period="1y", auto_adjust=True, group_by='ticker')
-            print(f"Columnas con auto_adjust=True: {list(df.columns)}")
-
-        # Manejar MultiIndex si existe
-        if isinstance(df.columns, pd.MultiIndex):
-            print(f"MultiIndex detectado con {df.columns.nlevels} niveles")
-            if df.columns.nlevels == 2:
-                # Para un solo ticker, el primer nivel será el ticker y el segundo los nombres de columnas
-                # Usar solo el segundo nivel (nombres de columnas)
-                df.columns = df.columns.get_level_values(1)
-                print(f"Columnas después de aplanar MultiIndex: {list(df.columns)}")
-
-        # Verificar si el índice es 'Date' y resetear si es necesario
-        if df.index.name == 'Date':
-            df = df.reset_index()
-            datos_financieros = df.sort_values(by='Date').set_index('Date')
-        else:
-            # Si el índice ya es datetime, solo ordenar
-            datos_financieros = df.sort_index()
+        datos_financieros = almacen_precios.obtener(ticker)
 
         print(f"Datos financieros finales para {ticker}: {datos_financieros.shape}")
         print(f"Columnas finales: {list(datos_financieros.columns)}")
@@ -77,26 +149,34 @@ def ObtenerNoticias(ticker: str) -> str:
     Returns:
         str: Noticias obtenidas en formato de texto.
     """
-    try:
-        with DDGS() as ddgs:
-            # Usamos el ticker como parte de la búsqueda
-            query = f"{ticker} stock news"
-            max_results = 2
-            results = ddgs.text(query, max_results=max_results)
-            noticias = []
-            for r in results:
-                titulo = r.get("title", "Sin título")
-                enlace = r.get("href", "#")
-                snippet = r.get("body", "Sin descripción")
-                noticias.append(f"{titulo}\n{snippet}\n{enlace}")
-            return "\n\n".join(noticias) if noticias else "No se encontraron noticias relevantes."
-    except Exception as e:
-        return f"Hubo un error al obtener las noticias de {ticker}: {str(e)}"
+    return vuelos_noticias.ejecutar(ticker.strip().upper(), _obtener_noticias, ticker)
+
+
+def _obtener_noticias(ticker: str) -> str:
+    return servicio_noticias.obtener(ticker)
+
+
+def _lanzar_descargas(ticker: str) -> list:
+    # Mismas claves que los nodos del grafo: si se confirma el ticker, los nodos se suman a estas descargas.
+    # Se lanzan desde extraer_ticker, pero las esperan los nodos siguientes: llevan el plazo de la petición
+    with plazo_peticion():
+        return [
+            asyncio.ensure_future(vuelos_precios.aejecutar(
+                ticker, lambda: ejecutar_en_servicio("yfinance", _obtener_datos_financieros, ticker)
+            )),
+            asyncio.ensure_future(vuelos_noticias.aejecutar(
+                ticker, lambda: ejecutar_en_servicio("noticias", _obtener_noticias, ticker)
+            )),
+        ]
+
+
+# Descarga los precios y noticias del candidato local mientras el LLM confirma el ticker
+especulador = Especulador(_lanzar_descargas)
 
 class AgenteProcesadorConsulta:
     def __init__(self):
-        # Inicializa el LLM de OpenAI con la clave API proporcionada
-        self.llm = ChatGroq(temperature=0, model="meta-llama/llama-4-maverick-17b-128e-instruct")
+        # Todas las llamadas al LLM pasan por la pasarela compartida (límites, reintentos y respaldo)
+        self.llm = obtener_pasarela("meta-llama/llama-4-maverick-17b-128e-instruct", temperatura=0)
         # Define la plantilla del prompt para extraer el ticker
         self.prompt = PromptTemplate(
             input_variables=["consulta"],
@@ -109,251 +189,505 @@ class AgenteProcesadorConsulta:
         # Crea una cadena LLM con el LLM y el prompt
         self.chain = self.prompt | self.llm | StrOutputParser()
     def extraer_ticker(self, consulta: str) -> str:
-        return self.chain.invoke(consulta)
+        """
+        Extrae el ticker de la consulta. Primero busca en el índice local de símbolos y solo
+        consulta al LLM si la confianza es baja; la respuesta del LLM se valida contra el índice.
+
+        Args:
+            consulta (str): Consulta del usuario.
+
+        Returns:
+            str: Ticker validado.
+        """
+        resolucion = self._resolver_localmente(consulta)
+        if resolucion is not None and resolucion.confianza >= UMBRAL_CONFIANZA:
+            return resolucion.ticker
+        return obtener_indice().validar(self.chain.invoke(consulta), respaldo=resolucion)
+
+    async def aextraer_ticker(self, consulta: str) -> str:
+        """
+        Versión asíncrona de `extraer_ticker`.
+        """
+        resolucion = self._resolver_localmente(consulta)
+        if resolucion is not None and resolucion.confianza >= UMBRAL_CONFIANZA:
+            return resolucion.ticker
+        async with limitar("llm"):
+            salida = await self.chain.ainvoke(consulta)
+        return obtener_indice().validar(salida, respaldo=resolucion)
+
+    def _resolver_localmente(self, consulta: str):
+        resolucion = obtener_indice().resolver(consulta)
+        if resolucion is not None and resolucion.confianza >= UMBRAL_CONFIANZA:
+            print(f"Ticker resuelto localmente ({resolucion.metodo}): {resolucion.ticker}")
+        return resolucion
 
 
 class AgenteAnalizarDatos:
-    def __init__(self):
+    def __init__(self, usar_llm: bool = None):
         """
         Inicializa el agente de análisis de datos financieros.
+
+        Args:
+            usar_llm (bool): Si es True, además de las métricas se responde la consulta libre con el
+                agente pandas. Por defecto se toma de la variable de entorno ANALISIS_LLM.
         """
-        # Inicializar el modelo de lenguaje con la clave de API
-        self.llm = ChatGroq(temperature=0, model="meta-llama/llama-4-maverick-17b-128e-instruct")
+        if usar_llm is None:
+            usar_llm = os.getenv("ANALISIS_LLM", "0") == "1"
+        self.usar_llm = usar_llm
+        # El LLM solo se necesita para el modo opcional de preguntas libres
+        self.llm = obtener_pasarela("meta-llama/llama-4-maverick-17b-128e-instruct", temperatura=0) if usar_llm else None
 
     def ejecutar(self, datos_financieros: pd.DataFrame, consulta: str) -> str:
         """
         Analiza los datos financieros y extrae información relevante según la consulta.
 
+        Las métricas se calculan siempre con el motor de indicadores; el agente pandas solo se usa,
+        si está activado, para responder a la consulta libre del usuario.
+
         Args:
             datos_financieros (pd.DataFrame): DataFrame con los datos financieros.
             consulta (str): Pregunta o consulta específica para el análisis.
 
         Returns:
-            str: Respuesta generada por el agente basada en la consulta.
+            str: Métricas calculadas y, opcionalmente, la respuesta del agente a la consulta.
         """
-        # Obtener la fecha y hora actuales
-        fecha_hora_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        analisis = self._analisis_basico(datos_financieros)
+        if not self.usar_llm:
+            return analisis
+
+        respuesta_llm = self._responder_con_agente(datos_financieros, consulta)
+        if respuesta_llm:
+            analisis += f"\n\nRespuesta del agente pandas a la consulta:\n{respuesta_llm}"
+        return analisis
 
-        # Crear el mensaje de sistema con la fecha y hora actuales
+    def _responder_con_agente(self, datos_financieros: pd.DataFrame, consulta: str) -> str:
+        """
+        Responde la consulta libre con un agente pandas. Devuelve una cadena vacía si falla.
+        """
+        # Solo se importa en este modo opcional: langchain_experimental tarda en cargar
+        from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+        
+        # Obtener la fecha actual (sin la hora, para que el prompt se repita y lo sirva la caché del LLM)
+        fecha_actual = datetime.now().strftime("%Y-%m-%d")
+
+        # Crear el mensaje de sistema con la fecha actual
         mensaje_sistema = f"""
                     You are a financial analyst specializing in historical stock data analysis. You work with datasets already filtered by the corresponding ticker symbol, so there is no need for additional filtering by symbol.
                     The data is provided in a structured format, typically as a Pandas DataFrame.
                     Context: The dataset comes from Yahoo Finance and contains historical data for the last year of the stock.
                     The data is structured as a Pandas DataFrame, with each row representing a trading day. The columns include: Date (index), Open, High, Low, Close, Adj Close, Volume.
 
-                    Your task is to calculate these 3 specific metrics ONLY:
-
-                    1. Average Closing Price Over the Last 7 Days: df['Close'].tail(7).mean()
-                    2. 200-Period Moving Average: df['Close'].rolling(window=200).mean().iloc[-1]
-                    3. 30-Day Price Trend: Compare current price with price 30 days ago to determine if trend is upward, downward, or neutral.
-
                     CRITICAL INSTRUCTIONS:
-                    - Use ONLY simple pandas operations as shown above
-                    - Do NOT use complex analysis or additional calculations
+                    - Use ONLY simple pandas operations
                     - Do NOT iterate more than 2 times
-                    - If any calculation fails, skip it and continue with the others
-                    - Provide results in a simple format: "7-day average: $X, 200-day MA: $Y, 30-day trend: direction"
+                    - Answer briefly in Spanish
 
-                    The current date and time are: {fecha_hora_actual}.
+                    The current date is: {fecha_actual}.
                     """
 
         # Crear el agente de Pandas con límites estrictos
         agente = create_pandas_dataframe_agent(
             llm=self.llm,
-            df=datos_financieros,
+            # Copia superficial: el código del agente puede añadir columnas sin tocar las barras compartidas
+            df=datos_financieros.copy(deep=False),
             verbose=False,  # Reducir verbosidad para mejorar rendimiento
             allow_dangerous_code=True,
             max_iterations=2,  # Límite máximo de iteraciones
-            max_execution_time=20  # Límite de tiempo en segundos
+            max_execution_time=acotar(20)  # Límite de tiempo en segundos (o lo que le quede a la petición)
         )
 
         try:
-            # Ejecutar la consulta utilizando el agente con el mensaje de sistema
-            respuesta = agente.invoke({
-                "input": "Calculate: 1) df['Close'].tail(7).mean() 2) df['Close'].rolling(200).mean().iloc[-1] 3) Compare current vs 30-day ago price. " + mensaje_sistema
-            })
+            respuesta = agente.invoke({"input": f"Question: {consulta}\n{mensaje_sistema}"})
             return respuesta["output"]
         except Exception as e:
-            # Si hay un error o timeout, devolver un análisis básico
+            # Si hay un error o timeout, nos quedamos solo con las métricas
             print(f"Error en análisis pandas: {e}")
-            return self._analisis_basico(datos_financieros)
+            return ""
 
     def _analisis_basico(self, df: pd.DataFrame) -> str:
         """
-        Realiza un análisis básico si el agente pandas falla.
+        Calcula las métricas con el motor de indicadores vectorizado.
         """
         try:
-            # Análisis básico usando pandas directamente
             if 'Close' in df.columns and len(df) > 0:
-                # Últimos 7 días promedio
-                avg_7_days = df['Close'].tail(7).mean()
-
-                # Media móvil de 200 períodos
-                if len(df) >= 200:
-                    ma_200 = df['Close'].rolling(window=200).mean().iloc[-1]
-                else:
-                    ma_200 = df['Close'].mean()  # Usar promedio total si no hay suficientes datos
-
-                # Tendencia de 30 días
-                if len(df) >= 30:
-                    price_30_days_ago = df['Close'].iloc[-30]
-                    current_price = df['Close'].iloc[-1]
-                    trend_pct = ((current_price - price_30_days_ago) / price_30_days_ago) * 100
-
-                    if trend_pct > 2:
-                        trend = f"alcista (+{trend_pct:.1f}%)"
-                    elif trend_pct < -2:
-                        trend = f"bajista ({trend_pct:.1f}%)"
-                    else:
-                        trend = f"neutral ({trend_pct:.1f}%)"
-                else:
-                    current_price = df['Close'].iloc[-1]
-                    trend = "datos insuficientes para tendencia"
-
-                return f"""
-                Análisis Financiero (Análisis Directo):
-
-                Métricas Calculadas:
-                - Promedio de precio de cierre últimos 7 días: ${avg_7_days:.2f}
-                - Media móvil de 200 períodos: ${ma_200:.2f}
-                - Tendencia de 30 días: {trend}
-                - Precio actual: ${current_price:.2f}
-
-                Nota: Este análisis fue generado directamente debido a limitaciones de tiempo en el procesamiento del agente pandas.
-                """
+                return formatear_indicadores(calcular_indicadores(df))
             else:
                 return "No se pudieron analizar los datos financieros - datos insuficientes o columna 'Close' no encontrada."
         except Exception as e:
             return f"Error en análisis básico: {str(e)}"
 
+# Instrucciones fijas del asesor: se envían como mensaje de sistema idéntico en todas las llamadas,
+# así el proveedor puede reutilizar su caché de prefijos. Los datos de cada reporte van en el mensaje del usuario.
+INSTRUCCIONES_ASESOR = compactar("""
+    Eres un asesor financiero experto y tu tarea es elaborar un informe integral hasta la fecha indicada, basado en dos fuentes principales que se te proporcionarán en el mensaje del usuario:
+
+    Análisis financiero basado en datos históricos:
+
+    Recibirás métricas calculadas a partir de datos históricos, entre ellas:
+    Promedio del precio de cierre en los últimos 7 días.
+    Tendencia del precio en los últimos 7 días (indicando si es alcista, bajista o neutral).
+    Media móvil de 200 períodos para evaluar la tendencia a largo plazo de la acción.
+    Deberás integrar esta información de manera clara y accesible para el usuario.
+    Noticias del mercado:
+
+    Recibirás un resumen de noticias relevantes relacionadas con el símbolo bursátil.
+    Estas noticias pueden incluir eventos significativos como cambios regulatorios, reportes financieros o situaciones del mercado que hayan impactado en el precio de la acción.
+    Estructura del informe:
+
+    Introducción
+    Introduce brevemente el símbolo bursátil analizado y el objetivo del informe.
+    Análisis Financiero
+    Presenta de forma clara y accesible las métricas proporcionadas:
+    Media del precio de cierre en los últimos 7 días.
+    Media móvil de 200 periodos y su interpretación.
+    Noticias del Mercado
+    Resume las noticias clave relacionadas con el símbolo.
+    Explica de forma sencilla cómo estas noticias podrían haber influido en el precio o la percepción del mercado.
+    Conclusión
+    Integra las métricas financieras y las noticias para proporcionar una evaluación clara y fundamentada.
+    Responde a la pregunta del usuario considerando tanto el análisis financiero como el contexto de las noticias.
+    Ofrece recomendaciones accionables basadas en los hallazgos.
+
+    Escribe el informe de manera profesional pero accesible, orientado a personas con conocimientos limitados de finanzas. Usa un lenguaje claro, evita tecnicismos innecesarios, y organiza la información de manera lógica y estructurada.
+""")
+
+# Parte variable del prompt del asesor, limitada a PROMPT_MAX_TOKENS tokens
+DATOS_ASESOR = (
+    "Fecha: {fecha}\n"
+    "Pregunta del usuario: {consulta}\n\n"
+    "Métricas del análisis financiero:\n{respuesta_analisis}\n\n"
+    "Noticias del mercado:\n{noticias}"
+)
+
+
 class AgenteAsesorFinanciero:
     def __init__(self):
-        # Inicializa el LLM
-        self.llm = ChatGroq(temperature=1, model="llama-3.3-70b-versatile")
-        # Define la plantilla del prompt para extraer el ticker
-        self.prompt = PromptTemplate(
-            input_variables=["consulta","respuesta_analisis","noticias","fecha"],
-            template=(
-                 """
-                    Eres un asesor financiero experto y tu tarea es elaborar un informe integral hasta el día de {fecha}, basado en dos fuentes principales que se te proporcionarán:
-
-                    Análisis financiero basado en datos históricos:
-
-                    Recibirás las siguientes métricas generadas por un bot especializado en pandas: {respuesta_analisis}, calculadas a partir de datos históricos:
-                    Promedio del precio de cierre en los últimos 7 días.
-                    Tendencia del precio en los últimos 7 días (indicando si es alcista, bajista o neutral).
-                    Media móvil de 200 períodos para evaluar la tendencia a largo plazo de la acción.
-                    Deberás integrar esta información de manera clara y accesible para el usuario.
-                    Noticias del mercado:
-
-                    Recibirás un resumen de noticias relevantes relacionadas con el símbolo bursátil: {noticias}.
-                    Estas noticias pueden incluir eventos significativos como cambios regulatorios, reportes financieros o situaciones del mercado que hayan impactado en el precio de la acción.
-                    Estructura del informe:
-
-                    Introducción
-                    Introduce brevemente el símbolo bursátil analizado y el objetivo del informe.
-                    Análisis Financiero
-                    Presenta de forma clara y accesible las métricas proporcionadas por el bot de Pandas:
-                    Media del precio de cierre en los últimos 7 días.
-                    Media móvil de 200 periodos y su interpretación.
-                    Noticias del Mercado
-                    Resume las noticias clave relacionadas con el símbolo.
-                    Explica de forma sencilla cómo estas noticias podrían haber influido en el precio o la percepción del mercado.
-                    Conclusión
-                    Integra las métricas financieras y las noticias para proporcionar una evaluación clara y fundamentada.
-                    Responde a la pregunta del usuario considerando tanto el análisis financiero como el contexto de las noticias.
-                    Ofrece recomendaciones accionables basadas en los hallazgos.
-                    Pregunta del usuario: {consulta}
-
-                    Tu respuesta:
-                    Escribe el informe de manera profesional pero accesible, orientado a personas con conocimientos limitados de finanzas. Usa un lenguaje claro, evita tecnicismos innecesarios, y organiza la información de manera lógica y estructurada.
-                                        """)
-
-        )
+        # En modo determinista (ASESOR_DETERMINISTA, por defecto) el informe sale de la caché del LLM
+        # cuando la consulta, las métricas, las noticias y la fecha coinciden con una llamada anterior
+        determinista = os.getenv("ASESOR_DETERMINISTA", "1") == "1"
+        self.llm = obtener_pasarela("llama-3.3-70b-versatile", temperatura=0 if determinista else 1)
+        self.max_tokens = int(os.getenv("PROMPT_MAX_TOKENS", "1500"))
+        # Instrucciones fijas como prefijo y datos del reporte como mensaje del usuario
+        self.prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(INSTRUCCIONES_ASESOR),
+            ("human", "{datos}"),
+        ])
         # Crea una cadena LLM con el LLM y el prompt
         self.chain = self.prompt | self.llm | StrOutputParser()
-    def responder(self, consulta: str, respuesta_analisis:str, noticias: str, fecha:str) -> str:
-         # Empaquetar las variables como un diccionario
-        inputs = {
-            "consulta": consulta,
-            "respuesta_analisis": respuesta_analisis,
-            "noticias": noticias,
-            "fecha": fecha
-        }
-        return self.chain.invoke(inputs)
-    
-class Estado(TypedDict):
-    consulta: Annotated[List[str], operator.add]   # Consulta proporcionada por el usuario
-    ticker: Annotated[List[str], operator.add]  # Ticker extraído de la consulta
-    datos_financieros: Annotated[List[pd.DataFrame], operator.add]  # Datos financieros del ticker
-    respuesta_analisis: Annotated[List[str], operator.add]  # Respuesta generada por el análisis de datos
-    ruta_html: Annotated[List[str], operator.add]  # Ruta del archivo HTML generado para los gráficos
-    noticias: Annotated[List[str], operator.add]  # Lista de noticias relacionadas
-    respuesta_final: Annotated[List[str], operator.add]  # Respuesta final generada por el analista financiero
-
-grafico = StateGraph(Estado)
+
+    def _datos(self, consulta: str, respuesta_analisis: str, noticias: str, fecha: str, ticker: Optional[str]) -> dict:
+        """
+        Compone el mensaje del usuario: consulta y métricas enteras, y las noticias que quepan en el
+        presupuesto, primero las que mencionan el ticker o la empresa.
+        """
+        terminos = [ticker, obtener_indice().nombre(ticker)] if ticker else []
+        datos = rellenar_con_presupuesto(
+            DATOS_ASESOR, self.max_tokens, noticias, terminos,
+            fecha=fecha, consulta=consulta, respuesta_analisis=respuesta_analisis,
+        )
+        return {"datos": datos}
+
+    def responder(self, consulta: str, respuesta_analisis:str, noticias: str, fecha:str, ticker: Optional[str] = None) -> str:
+        return self.chain.invoke(self._datos(consulta, respuesta_analisis, noticias, fecha, ticker))
+
+    async def aresponder(self, consulta: str, respuesta_analisis: str, noticias: str, fecha: str, ticker: Optional[str] = None) -> str:
+        """
+        Versión asíncrona de `responder`.
+        """
+        async with limitar("llm"):
+            return await self.chain.ainvoke(self._datos(consulta, respuesta_analisis, noticias, fecha, ticker))
+
+class Estado(TypedDict, total=False):
+    # Cada nodo devuelve solo los campos que escribe; LangGraph los combina con el resto del estado
+    consulta: str  # Consulta proporcionada por el usuario
+    ticker: str  # Ticker extraído de la consulta
+    datos_financieros: str  # Referencia a las barras del ticker en `registro_marcos` (no el DataFrame)
+    respuesta_analisis: str  # Respuesta generada por el análisis de datos
+    noticias: str  # Noticias relacionadas
+    respuesta_final: str  # Respuesta final generada por el analista financiero
+    parcial: Annotated[List[str], operator.add]  # Partes que faltan en el reporte por haber agotado su plazo
+
+def precalentar_agentes() -> None:
+    """
+    Construye los agentes compartidos y abre las conexiones con Groq antes de la primera consulta.
+    """
+    for clase in (AgenteProcesadorConsulta, AgenteAnalizarDatos, AgenteAsesorFinanciero):
+        obtener_agente(clase)
+    precalentar_conexiones()
 
 def extraer_ticker(estado: Estado) -> Estado:
-    agente = AgenteProcesadorConsulta()
-    ticker = agente.extraer_ticker(estado["consulta"][-1])
-    estado["ticker"].append(ticker)
-    return estado
+    agente = obtener_agente(AgenteProcesadorConsulta)
+    return {"ticker": agente.extraer_ticker(estado["consulta"])}
 def obtener_datos_financieros(estado: Estado) -> Estado:
-    if estado["ticker"]:
-        df = ObtenerDatosFinancieros.invoke(estado["ticker"][-1])
-        estado["datos_financieros"].append(df)
-    return estado
+    if not estado.get("ticker"):
+        return {}
+    df = ObtenerDatosFinancieros.invoke(estado["ticker"])
+    return {"datos_financieros": registro_marcos.guardar(estado["ticker"], df)}
 def analizar_datos(estado: Estado) -> Estado:
-    if estado["datos_financieros"] is not None:
-        agente_analizar = AgenteAnalizarDatos()
-        respuesta = agente_analizar.ejecutar(
-            datos_financieros=estado["datos_financieros"][-1],
-            consulta=estado["consulta"]
-        )
-        estado["respuesta_analisis"].append(respuesta)
-    return estado
+    agente_analizar = obtener_agente(AgenteAnalizarDatos)
+    respuesta = agente_analizar.ejecutar(
+        datos_financieros=registro_marcos.obtener(estado.get("datos_financieros")),
+        consulta=estado["consulta"]
+    )
+    return {"respuesta_analisis": respuesta}
 def obtener_noticias(estado: Estado) -> Estado:
-    if estado["ticker"][-1]:
-        ticker = estado["ticker"][-1]
-        noticias = ObtenerNoticias.invoke(ticker)
-        estado["noticias"].append(noticias)
-    return estado
+    if not estado.get("ticker"):
+        return {}
+    return {"noticias": ObtenerNoticias.invoke(estado["ticker"])}
 
 def analista_financiero(estado: Estado) -> Estado:
-    fecha_hora_actual = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    agente = AgenteAsesorFinanciero()
-    respuesta = agente.responder(consulta=estado["consulta"], respuesta_analisis=estado["respuesta_analisis"],noticias = estado["noticias"],fecha=fecha_hora_actual)
-    estado["respuesta_final"].append(respuesta)
-    return estado
-
-grafico.add_node("extraer_ticker", extraer_ticker)
-grafico.add_node("obtener_datos_financieros", obtener_datos_financieros)
-grafico.add_node("analizar_datos", analizar_datos)
-grafico.add_node("obtener_noticias", obtener_noticias)
-grafico.add_node("analista_financiero", analista_financiero)
-grafico.add_edge(START, "extraer_ticker")
-grafico.add_edge("extraer_ticker", "obtener_datos_financieros")
-grafico.add_edge("extraer_ticker", "obtener_noticias")
-grafico.add_edge("obtener_datos_financieros", "analizar_datos")
-grafico.add_node("esperar_ambos", lambda x: x)  # Nodo de sincronización
-grafico.add_edge("analizar_datos", "esperar_ambos")
-grafico.add_edge("obtener_noticias", "esperar_ambos")
-grafico.add_edge("esperar_ambos", "analista_financiero")
-grafico.add_edge("analista_financiero", END)
-
-app = grafico.compile()
+    fecha_actual = datetime.now().strftime("%Y-%m-%d")
+    agente = obtener_agente(AgenteAsesorFinanciero)
+    respuesta = agente.responder(consulta=estado["consulta"], respuesta_analisis=estado.get("respuesta_analisis", ""),noticias = estado.get("noticias", ""),fecha=fecha_actual, ticker=estado.get("ticker"))
+    return {"respuesta_final": respuesta}
+
+# Versiones asíncronas de los nodos: las herramientas bloqueantes corren en el pool de su servicio
+# y las llamadas al LLM usan ainvoke, todo limitado por los semáforos de model/concurrencia.py
+async def extraer_ticker_async(estado: Estado) -> Estado:
+    agente = obtener_agente(AgenteProcesadorConsulta)
+    especulacion = especulador.iniciar(estado["consulta"])
+    ticker = None
+    try:
+        ticker = await agente.aextraer_ticker(estado["consulta"])
+    finally:
+        especulador.confirmar(especulacion, ticker)
+    return {"ticker": ticker}
+async def obtener_datos_financieros_async(estado: Estado) -> Estado:
+    if not estado.get("ticker"):
+        return {}
+    ticker = estado["ticker"]
+    df = await vuelos_precios.aejecutar(
+        ticker.strip().upper(), lambda: ejecutar_en_servicio("yfinance", _obtener_datos_financieros, ticker)
+    )
+    return {"datos_financieros": registro_marcos.guardar(ticker, df)}
+async def analizar_datos_async(estado: Estado) -> Estado:
+    agente_analizar = obtener_agente(AgenteAnalizarDatos)
+    datos_financieros = registro_marcos.obtener(estado.get("datos_financieros"))
+    if agente_analizar.usar_llm:
+        respuesta = await ejecutar_en_servicio("llm", agente_analizar.ejecutar, datos_financieros, estado["consulta"])
+    else:
+        # Solo métricas con NumPy: microsegundos, no merece la pena salir del bucle
+        respuesta = agente_analizar.ejecutar(datos_financieros, estado["consulta"])
+    return {"respuesta_analisis": respuesta}
+async def obtener_noticias_async(estado: Estado) -> Estado:
+    if not estado.get("ticker"):
+        return {}
+    ticker = estado["ticker"]
+    noticias = await vuelos_noticias.aejecutar(
+        ticker.strip().upper(), lambda: ejecutar_en_servicio("noticias", _obtener_noticias, ticker)
+    )
+    return {"noticias": noticias}
+
+async def analista_financiero_async(estado: Estado) -> Estado:
+    fecha_actual = datetime.now().strftime("%Y-%m-%d")
+    agente = obtener_agente(AgenteAsesorFinanciero)
+    respuesta = await agente.aresponder(consulta=estado["consulta"], respuesta_analisis=estado.get("respuesta_analisis", ""),noticias = estado.get("noticias", ""),fecha=fecha_actual, ticker=estado.get("ticker"))
+    return {"respuesta_final": respuesta}
+
+# Lo que escriben los nodos no imprescindibles cuando agotan su plazo: el reporte sale sin esa parte
+AVISO_SIN_NOTICIAS = "No se pudieron obtener las noticias a tiempo; el informe se basa solo en las métricas."
+
+
+def _sin_noticias(estado: Estado) -> Estado:
+    return {"noticias": AVISO_SIN_NOTICIAS, "parcial": ["noticias"]}
+
+
+def _solo_metricas(estado: Estado) -> Estado:
+    datos_financieros = registro_marcos.obtener(estado.get("datos_financieros"))
+    return {
+        "respuesta_analisis": obtener_agente(AgenteAnalizarDatos)._analisis_basico(datos_financieros),
+        "parcial": ["analisis"],
+    }
+
+
+RESPALDOS_NODOS = {"obtener_noticias": _sin_noticias, "analizar_datos": _solo_metricas}
+
+
+def construir_grafo(extraer_ticker, obtener_datos_financieros, analizar_datos, obtener_noticias, analista_financiero):
+    """
+    Compila el StateGraph del reporte con las funciones de nodo indicadas (síncronas o asíncronas).
+    Los nodos asíncronos tienen cada uno su plazo (model/plazos.py); las noticias y el análisis con
+    LLM no son imprescindibles y, si lo agotan, el grafo sigue con `RESPALDOS_NODOS`.
+    """
+    grafico = StateGraph(Estado)
+    nodos = {
+        "extraer_ticker": extraer_ticker,
+        "obtener_datos_financieros": obtener_datos_financieros,
+        "analizar_datos": analizar_datos,
+        "obtener_noticias": obtener_noticias,
+        "analista_financiero": analista_financiero,
+    }
+    for nombre, funcion in nodos.items():
+        grafico.add_node(nombre, instrumentar_nodo(nombre, limitar_nodo(nombre, funcion, RESPALDOS_NODOS.get(nombre))))
+    grafico.add_edge(START, "extraer_ticker")
+    grafico.add_edge("extraer_ticker", "obtener_datos_financieros")
+    grafico.add_edge("extraer_ticker", "obtener_noticias")
+    grafico.add_edge("obtener_datos_financieros", "analizar_datos")
+    grafico.add_node("esperar_ambos", lambda estado: {})  # Nodo de sincronización (no escribe nada)
+    # Arista de unión: espera a las dos ramas (con dos aristas sueltas el nodo se ejecutaba una vez por rama)
+    grafico.add_edge(["analizar_datos", "obtener_noticias"], "esperar_ambos")
+    grafico.add_edge("esperar_ambos", "analista_financiero")
+    grafico.add_edge("analista_financiero", END)
+    return grafico.compile()
+
+app = construir_grafo(extraer_ticker, obtener_datos_financieros, analizar_datos, obtener_noticias, analista_financiero)
+app_async = construir_grafo(
+    extraer_ticker_async, obtener_datos_financieros_async, analizar_datos_async,
+    obtener_noticias_async, analista_financiero_async,
+)
+
+
+def resumen_estado(estado: Estado) -> str:
+    """
+    Resumen de una línea del estado para las trazas, sin volcar el informe ni las barras.
+    """
+    return (
+        f"ticker={estado.get('ticker')} datos={estado.get('datos_financieros')} "
+        f"analisis={len(estado.get('respuesta_analisis', ''))} car. noticias={len(estado.get('noticias', ''))} car. "
+        f"informe={len(estado.get('respuesta_final', ''))} car."
+        + (f" parcial={','.join(estado['parcial'])}" if estado.get("parcial") else "")
+    )
 
 
 def correr_modelo(consulta: str):
-    estado_inicial = {
-    "consulta": [consulta],
-    "ticker": [],
-    "datos_financieros": [],
-    "respuesta_analisis": [],
-    "ruta_html": [],
-    "noticias": [],
-    "respuesta_final": []
-}
-    estado_final = app.invoke(estado_inicial)
-    print(estado_final)
-    return estado_final
\ No newline at end of file
+    estado_final = app.invoke(_estado_inicial(consulta))
+    print(f"Estado final: {resumen_estado(estado_final)}")
+    return estado_final
+
+
+def ticker_local(consulta: str) -> Optional[str]:
+    """
+    Ticker de la consulta si el índice local lo resuelve con confianza, sin llamar al LLM.
+    """
+    resolucion = obtener_indice().resolver(consulta)
+    if resolucion is not None and resolucion.confianza >= UMBRAL_CONFIANZA:
+        return resolucion.ticker
+    return None
+
+
+def clave_consulta(consulta: str) -> str:
+    """
+    Clave con la que se agrupan reportes equivalentes: el texto normalizado de la consulta, precedido
+    del ticker si el índice local lo resuelve con confianza. Dos preguntas distintas sobre el mismo
+    ticker no comparten reporte (el informe responde a la pregunta); sí comparten las descargas de
+    precios y noticias, que se agrupan solo por ticker en `vuelos_precios` y `vuelos_noticias`.
+    """
+    texto = normalizar(consulta)
+    ticker = ticker_local(consulta)
+    return f"{ticker}:{texto}" if ticker else texto
+
+
+def consulta_generica(consulta: str, ticker: str) -> bool:
+    """
+    Indica si la consulta es solo el ticker o el nombre de la empresa, sin pregunta: la que responde
+    el reporte genérico que se recalcula en segundo plano.
+    """
+    texto = normalizar(consulta)
+    return texto == normalizar(ticker) or obtener_indice().buscar_exacto(texto) == ticker
+
+
+def _estado_inicial(consulta: str) -> Estado:
+    return {"consulta": consulta}
+
+
+async def correr_modelo_async(consulta: str):
+    """
+    Ejecuta el grafo con ainvoke: la concurrencia queda limitada por los semáforos de cada servicio
+    externo y no por un número fijo de hilos.
+    """
+    estado_final = await app_async.ainvoke(_estado_inicial(consulta))
+    print(f"Estado final: {resumen_estado(estado_final)}")
+    return estado_final
+
+
+async def correr_modelo_stream(consulta: str):
+    """
+    Ejecuta el grafo emitiendo eventos a medida que avanza.
+
+    Yields:
+        tuple: ("progreso", nombre_nodo) cuando termina un nodo, ("token", texto) por cada fragmento
+        del informe del asesor y, al final, ("final", estado_final).
+    """
+    estado_final = None
+    async for modo, datos in app_async.astream(
+        _estado_inicial(consulta), stream_mode=["updates", "messages", "values"]
+    ):
+        if modo == "updates":
+            for nodo in datos:
+                if nodo != "esperar_ambos":
+                    yield "progreso", nodo
+        elif modo == "messages":
+            fragmento, metadatos = datos
+            if metadatos.get("langgraph_node") == "analista_financiero" and fragmento.content:
+                yield "token", fragmento.content
+        else:
+            estado_final = datos
+    yield "final", estado_final
+
+def preparar_lote(consultas: List[str]) -> List[dict]:
+    """
+    Primera fase del reporte por lotes: resuelve los tickers, descarga los precios de todos con una
+    sola petición y calcula sus métricas.
+
+    Args:
+        consultas (list): Consultas o tickers del lote.
+
+    Returns:
+        list: Un diccionario por consulta con consulta, ticker, datos_financieros y respuesta_analisis,
+        o con la clave error si no se pudo preparar.
+    """
+    agente = obtener_agente(AgenteProcesadorConsulta)
+    preparados = []
+    for consulta in consultas:
+        try:
+            preparados.append({"consulta": consulta, "ticker": agente.extraer_ticker(consulta)})
+        except Exception as e:
+            preparados.append({"consulta": consulta, "error": f"No se pudo extraer el ticker: {e}"})
+
+    tickers = [p["ticker"] for p in preparados if "error" not in p]
+    precios = almacen_precios.obtener_varios(tickers) if tickers else {}
+
+    agente_analizar = obtener_agente(AgenteAnalizarDatos)
+    for preparado in preparados:
+        if "error" in preparado:
+            continue
+        datos_financieros = precios.get(preparado["ticker"].strip().upper(), pd.DataFrame())
+        if datos_financieros.empty:
+            preparado["error"] = f"No hay datos financieros para {preparado['ticker']}"
+            continue
+        preparado["datos_financieros"] = datos_financieros
+        preparado["respuesta_analisis"] = agente_analizar._analisis_basico(datos_financieros)
+    return preparados
+
+
+async def redactar_reporte(preparado: dict) -> dict:
+    """
+    Segunda fase del reporte por lotes: noticias e informe del asesor para un ticker ya preparado.
+
+    Args:
+        preparado (dict): Elemento devuelto por `preparar_lote` sin error.
+
+    Returns:
+        dict: Estado final con la misma forma que el de `correr_modelo`.
+    """
+    ticker = preparado["ticker"]
+    # Las noticias tienen el mismo plazo que en el grafo; si lo agotan, el reporte sale sin ellas
+    buscar_noticias = limitar_nodo("obtener_noticias", obtener_noticias_async, _sin_noticias)
+    actualizacion = await buscar_noticias({"ticker": ticker})
+    noticias = actualizacion["noticias"]
+    respuesta = await obtener_agente(AgenteAsesorFinanciero).aresponder(
+        consulta=preparado["consulta"],
+        respuesta_analisis=preparado["respuesta_analisis"],
+        noticias=noticias,
+        fecha=datetime.now().strftime("%Y-%m-%d"),
+        ticker=ticker,
+    )
+    return {
+        "consulta": preparado["consulta"],
+        "ticker": preparado["ticker"],
+        "datos_financieros": registro_marcos.guardar(preparado["ticker"], preparado["datos_financieros"]),
+        "respuesta_analisis": preparado["respuesta_analisis"],
+        "noticias": noticias,
+        "respuesta_final": respuesta,
+        "parcial": actualizacion.get("parcial", []),
+    }
@@ -0,0 +1,285 @@
+import os
+import re
+import threading
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from model.ohlcv import normalizar_ohlcv, vacio
+
+# Horario de la bolsa de Nueva York, que usamos como referencia para decidir si un dato está vigente
+ZONA_MERCADO = ZoneInfo("America/New_York")
+APERTURA_MERCADO = dtime(9, 30)
+CIERRE_MERCADO = dtime(16, 0)
+# Margen tras el cierre para que Yahoo publique la barra definitiva del día
+MARGEN_CIERRE = timedelta(minutes=20)
+
+CLAVE_ULTIMA_CONSULTA = b"ultima_consulta"
+
+
+def mercado_abierto(ahora: datetime) -> bool:
+    """
+    Indica si el mercado está en sesión (o en el margen posterior al cierre).
+
+    Args:
+        ahora (datetime): Instante con zona horaria.
+
+    Returns:
+        bool: True si la barra del día todavía puede cambiar.
+    """
+    local = ahora.astimezone(ZONA_MERCADO)
+    if local.weekday() >= 5:
+        return False
+    cierre = datetime.combine(local.date(), CIERRE_MERCADO, tzinfo=ZONA_MERCADO) + MARGEN_CIERRE
+    apertura = datetime.combine(local.date(), APERTURA_MERCADO, tzinfo=ZONA_MERCADO)
+    return apertura <= local < cierre
+
+
+def ultimo_cierre(ahora: datetime) -> datetime:
+    """
+    Devuelve el instante (cierre + margen) de la última sesión ya cerrada.
+    No contempla festivos: un festivo solo provoca una consulta de cola que vuelve vacía.
+
+    Args:
+        ahora (datetime): Instante con zona horaria.
+
+    Returns:
+        datetime: Instante del último cierre en la zona del mercado.
+    """
+    local = ahora.astimezone(ZONA_MERCADO)
+    dia = local.date()
+    cierre_hoy = datetime.combine(dia, CIERRE_MERCADO, tzinfo=ZONA_MERCADO) + MARGEN_CIERRE
+    if local.weekday() < 5 and local >= cierre_hoy:
+        return cierre_hoy
+    dia -= timedelta(days=1)
+    while dia.weekday() >= 5:
+        dia -= timedelta(days=1)
+    return datetime.combine(dia, CIERRE_MERCADO, tzinfo=ZONA_MERCADO) + MARGEN_CIERRE
+
+
+class AlmacenPrecios:
+    """
+    Almacén columnar de barras OHLCV con un fichero Parquet por ticker.
+
+    Sirve las barras guardadas mientras estén vigentes y, cuando no lo están, solo descarga
+    la cola que falta desde la última fecha almacenada.
+    """
+
+    def __init__(
+        self,
+        descargar: Callable[[str, Optional[datetime]], pd.DataFrame],
+        descargar_lote: Optional[Callable[[List[str], Optional[datetime]], Dict[str, pd.DataFrame]]] = None,
+        directorio: Optional[str] = None,
+        ttl_intradia: Optional[int] = None,
+        dias_historia: int = 365,
+    ):
+        """
+        Args:
+            descargar (Callable): Función (ticker, inicio) -> DataFrame. Con inicio=None debe descargar
+                el histórico completo; en otro caso, las barras desde esa fecha (incluida).
+            descargar_lote (Callable): Igual que `descargar` pero para varios tickers en una sola
+                petición; devuelve un DataFrame por ticker.
+            directorio (str): Carpeta donde se guardan los ficheros Parquet.
+            ttl_intradia (int): Segundos que una consulta sigue vigente con el mercado abierto.
+            dias_historia (int): Días de histórico que se devuelven y se conservan.
+        """
+        self.descargar = descargar
+        self.descargar_lote = descargar_lote
+        self.directorio = directorio or os.getenv("PRECIOS_DIR", "./temp/precios")
+        self.ttl_intradia = timedelta(
+            seconds=ttl_intradia if ttl_intradia is not None else int(os.getenv("PRECIOS_TTL_INTRADIA", "900"))
+        )
+        self.dias_historia = dias_historia
+        os.makedirs(self.directorio, exist_ok=True)
+        # Copia en memoria de las particiones leídas, invalidada por la fecha de modificación del fichero
+        self._memoria: Dict[str, Tuple[int, pd.DataFrame, Optional[datetime]]] = {}
+        self._candados: Dict[str, threading.Lock] = {}
+        self._candado_global = threading.Lock()
+
+    def ruta(self, ticker: str) -> str:
+        nombre = re.sub(r"[^A-Z0-9._=^-]", "_", ticker.upper())
+        return os.path.join(self.directorio, f"{nombre}.parquet")
+
+    def esta_vigente(self, ultima_consulta: Optional[datetime], ahora: Optional[datetime] = None) -> bool:
+        """
+        Decide si las barras guardadas pueden servirse sin ir a la red.
+
+        Con el mercado abierto caducan a los `ttl_intradia` segundos; con el mercado cerrado
+        siguen vigentes si se consultaron después del último cierre.
+        """
+        if ultima_consulta is None:
+            return False
+        ahora = ahora or datetime.now(ZONA_MERCADO)
+        if mercado_abierto(ahora):
+            return ahora - ultima_consulta < self.ttl_intradia
+        return ultima_consulta >= ultimo_cierre(ahora)
+
+    def leer(self, ticker: str) -> pd.DataFrame:
+        """
+        Lectura en caliente: devuelve las barras guardadas sin tocar la red.
+
+        Returns:
+            pd.DataFrame: Ventana de `dias_historia` días (barras canónicas de model/ohlcv.py), o un
+            DataFrame vacío si no hay partición.
+        """
+        almacenado, _ = self._leer(ticker.strip().upper())
+        return self._ventana(almacenado) if almacenado is not None else pd.DataFrame()
+
+    def obtener(self, ticker: str) -> pd.DataFrame:
+        """
+        Devuelve las barras del ticker, descargando solo la cola que falte si no están vigentes.
+
+        Args:
+            ticker (str): Símbolo del ticker.
+
+        Returns:
+            pd.DataFrame: Barras canónicas (model/ohlcv.py) indexadas por fecha, de solo lectura.
+        """
+        ticker = ticker.strip().upper()
+        with self._candado(ticker):
+            almacenado, ultima_consulta = self._leer(ticker)
+            if almacenado is not None and self.esta_vigente(ultima_consulta):
+                return self._ventana(almacenado)
+
+            inicio = almacenado.index[-1] if almacenado is not None and not almacenado.empty else None
+            ahora = datetime.now(ZONA_MERCADO)
+            try:
+                nuevo = self.descargar(ticker, inicio)
+            except Exception as e:
+                if almacenado is None:
+                    raise
+                print(f"Error descargando la cola de {ticker}, se sirven datos almacenados: {e}")
+                return self._ventana(almacenado)
+
+            return self._actualizar(ticker, almacenado, nuevo, ahora)
+
+    def obtener_varios(self, tickers: List[str]) -> Dict[str, pd.DataFrame]:
+        """
+        Versión por lotes de `obtener`: sirve desde disco los tickers vigentes y descarga las colas
+        de todos los demás en una única petición.
+
+        Args:
+            tickers (list): Símbolos de los tickers.
+
+        Returns:
+            dict: DataFrame de barras por ticker (vacío si no hay datos), en el orden recibido.
+        """
+        tickers = list(dict.fromkeys(t.strip().upper() for t in tickers))
+        if self.descargar_lote is None:
+            return {ticker: self.obtener(ticker) for ticker in tickers}
+
+        # Orden fijo de adquisición para no bloquearse con otro lote concurrente
+        candados = [self._candado(ticker) for ticker in sorted(tickers)]
+        for candado in candados:
+            candado.acquire()
+        try:
+            resultado: Dict[str, pd.DataFrame] = {}
+            pendientes: Dict[str, Optional[pd.DataFrame]] = {}
+            for ticker in tickers:
+                almacenado, ultima_consulta = self._leer(ticker)
+                if almacenado is not None and self.esta_vigente(ultima_consulta):
+                    resultado[ticker] = self._ventana(almacenado)
+                else:
+                    pendientes[ticker] = almacenado
+
+            if pendientes:
+                inicios = [a.index[-1] if a is not None and not a.empty else None for a in pendientes.values()]
+                # Una sola descarga desde la cola más antigua (o el histórico completo si falta algún ticker)
+                inicio = None if any(i is None for i in inicios) else min(inicios)
+                ahora = datetime.now(ZONA_MERCADO)
+                try:
+                    nuevos = self.descargar_lote(list(pendientes), inicio)
+                except Exception as e:
+                    print(f"Error en la descarga por lotes, se sirven datos almacenados: {e}")
+                    nuevos = {}
+                for ticker, almacenado in pendientes.items():
+                    if ticker in nuevos:
+                        resultado[ticker] = self._actualizar(ticker, almacenado, nuevos[ticker], ahora)
+                    else:
+                        resultado[ticker] = self._ventana(almacenado) if almacenado is not None else pd.DataFrame()
+
+            return {ticker: resultado[ticker] for ticker in tickers}
+        finally:
+            for candado in candados:
+                candado.release()
+
+    def _actualizar(
+        self, ticker: str, almacenado: Optional[pd.DataFrame], nuevo: pd.DataFrame, ahora: datetime
+    ) -> pd.DataFrame:
+        combinado = self._combinar(almacenado, nuevo)
+        if combinado.empty:
+            return combinado
+        self._escribir(ticker, combinado, ahora)
+        return self._ventana(combinado)
+
+    def _candado(self, ticker: str) -> threading.Lock:
+        with self._candado_global:
+            return self._candados.setdefault(ticker, threading.Lock())
+
+    def _leer(self, ticker: str) -> Tuple[Optional[pd.DataFrame], Optional[datetime]]:
+        ruta = self.ruta(ticker)
+        try:
+            mtime = os.stat(ruta).st_mtime_ns
+        except FileNotFoundError:
+            return None, None
+
+        en_memoria = self._memoria.get(ticker)
+        if en_memoria is not None and en_memoria[0] == mtime:
+            return en_memoria[1], en_memoria[2]
+
+        try:
+            tabla = pq.read_table(ruta)
+            # Las particiones antiguas pueden tener otros tipos (float64): en memoria quedan canónicas
+            df = normalizar_ohlcv(tabla.to_pandas())
+        except Exception as e:
+            print(f"Partición de precios corrupta para {ticker}, se descartará: {e}")
+            return None, None
+        metadatos = tabla.schema.metadata or {}
+        ultima_consulta = None
+        if CLAVE_ULTIMA_CONSULTA in metadatos:
+            ultima_consulta = datetime.fromisoformat(metadatos[CLAVE_ULTIMA_CONSULTA].decode())
+        self._memoria[ticker] = (mtime, df, ultima_consulta)
+        return df, ultima_consulta
+
+    def _combinar(self, almacenado: Optional[pd.DataFrame], nuevo: pd.DataFrame) -> pd.DataFrame:
+        if almacenado is None or almacenado.empty:
+            combinado = nuevo
+        elif nuevo is None or nuevo.empty:
+            combinado = almacenado
+        else:
+            # La última barra guardada puede ser intradía: la reemplaza la recién descargada
+            combinado = pd.concat([almacenado.iloc[: almacenado.index.searchsorted(nuevo.index[0])], nuevo])
+        if combinado is None or combinado.empty:
+            return vacio()
+        # Ordena y quita fechas repetidas (se queda la última) solo si hace falta
+        combinado = normalizar_ohlcv(combinado)
+        return combinado.iloc[combinado.index.searchsorted(self._limite(combinado.index, dias_extra=30)):]
+
+    def _escribir(self, ticker: str, df: pd.DataFrame, ultima_consulta: datetime) -> None:
+        tabla = pa.Table.from_pandas(df, preserve_index=True)
+        metadatos = dict(tabla.schema.metadata or {})
+        metadatos[CLAVE_ULTIMA_CONSULTA] = ultima_consulta.isoformat().encode()
+        tabla = tabla.replace_schema_metadata(metadatos)
+
+        ruta = self.ruta(ticker)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Sin codificación por diccionario: los precios y las fechas casi nunca se repiten, y con ella
+        # la escritura es varias veces más lenta y el fichero más grande
+        pq.write_table(tabla, temporal, use_dictionary=False)
+        # Reemplazo atómico para que otros procesos nunca lean un fichero a medias
+        os.replace(temporal, ruta)
+        self._memoria[ticker] = (os.stat(ruta).st_mtime_ns, df, ultima_consulta)
+
+    def _limite(self, indice: pd.Index, dias_extra: int = 0) -> pd.Timestamp:
+        limite = pd.Timestamp.now().normalize() - pd.Timedelta(days=self.dias_historia + dias_extra)
+        if getattr(indice, "tz", None) is not None:
+            limite = limite.tz_localize(indice.tz)
+        return limite
+
+    def _ventana(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Las barras canónicas están ordenadas: la ventana es una porción de filas, sin copiar los datos
+        return df.iloc[df.index.searchsorted(self._limite(df.index)):]
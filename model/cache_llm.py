@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation, GenerationChunk
+
+from almacen_resultados import AlmacenMemoria, AlmacenResultados, AlmacenSQLite
+
+
+# Lo único que se reconstruye desde la caché: respuestas del modelo, nunca clientes ni configuración
+TIPOS_PERMITIDOS = [Generation, GenerationChunk, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+
+
+def _revivir(serializada: str) -> Generation:
+    generacion = loads(serializada, allowed_objects=TIPOS_PERMITIDOS)
+    # Los tokens de una respuesta servida desde caché no se han consumido: no deben contar en /metrics
+    if isinstance(generacion, ChatGeneration) and generacion.message.usage_metadata:
+        generacion.message = generacion.message.model_copy(update={"usage_metadata": None})
+    return generacion
+
+
+def _modelo(llm_string: str) -> str:
+    # llm_string es la configuración serializada del cliente seguida de "---" y los parámetros de la llamada
+    try:
+        return json.loads(llm_string.split("---", 1)[0])["kwargs"]["model_name"]
+    except (ValueError, KeyError, TypeError):
+        return "desconocido"
+
+
+class CacheLLM(BaseCache):
+    """
+    Caché de respuestas del LLM para `set_llm_cache` o el parámetro `cache` de un ChatModel.
+
+    La clave es el hash del prompt ya renderizado junto con la configuración del cliente (modelo,
+    temperatura, etc.), así que dos llamadas solo comparten respuesta si el modelo recibiría
+    exactamente lo mismo. Las respuestas se guardan en un almacén de resultados, con su TTL y su
+    presupuesto de bytes, compartido entre procesos si es SQLite.
+    """
+
+    def __init__(self, almacen: AlmacenResultados):
+        self.almacen = almacen
+        self._por_modelo: Dict[str, Dict[str, int]] = {}
+        self._candado = threading.Lock()
+
+    @staticmethod
+    def _clave(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode()).hexdigest()
+
+    def _contar(self, llm_string: str, resultado: str) -> None:
+        with self._candado:
+            contadores = self._por_modelo.setdefault(_modelo(llm_string), {"aciertos": 0, "fallos": 0})
+            contadores[resultado] += 1
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        try:
+            valor = self.almacen.obtener(self._clave(prompt, llm_string))
+        except Exception as e:
+            # Sin caché la llamada sigue adelante contra el LLM
+            print(f"Error leyendo la caché del LLM: {e}")
+            valor = None
+        self._contar(llm_string, "fallos" if valor is None else "aciertos")
+        if valor is None:
+            return None
+        return [_revivir(generacion) for generacion in valor["generaciones"]]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        try:
+            self.almacen.guardar(
+                self._clave(prompt, llm_string), {"generaciones": [dumps(generacion) for generacion in return_val]}
+            )
+        except Exception as e:
+            print(f"Error guardando en la caché del LLM: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        # El almacén es exclusivo de la caché del LLM (LLM_CACHE_DB): se puede vaciar entero
+        self.almacen.vaciar()
+
+    def estadisticas(self) -> dict:
+        with self._candado:
+            por_modelo = {
+                modelo: {
+                    **contadores,
+                    "tasa_aciertos": round(contadores["aciertos"] / (contadores["aciertos"] + contadores["fallos"]), 3),
+                }
+                for modelo, contadores in self._por_modelo.items()
+            }
+        return {**self.almacen.estadisticas(), "modelos": por_modelo}
+
+
+_cache: Optional[CacheLLM] = None
+_candado = threading.Lock()
+
+
+def obtener_cache_llm() -> Optional[CacheLLM]:
+    """
+    Devuelve la caché del LLM del proceso según las variables de entorno (LLM_CACHE, LLM_CACHE_DB,
+    LLM_CACHE_TTL y LLM_CACHE_MAX_BYTES), o None si está desactivada.
+    """
+    global _cache
+    if os.getenv("LLM_CACHE", "sqlite") == "0":
+        return None
+    if _cache is None:
+        with _candado:
+            if _cache is None:
+                ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+                max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+                if os.getenv("LLM_CACHE", "sqlite") == "memoria":
+                    almacen = AlmacenMemoria(ttl, max_bytes)
+                else:
+                    almacen = AlmacenSQLite(os.getenv("LLM_CACHE_DB", "./temp/llm_cache.db"), ttl, max_bytes)
+                _cache = CacheLLM(almacen)
+    return _cache
@@ -0,0 +1,127 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple, Type, TypeVar
+
+import httpx
+from langchain_groq import ChatGroq
+
+from model.cache_llm import obtener_cache_llm
+from model.metricas import ACTIVAS, ManejadorMetricasLLM
+
+# Registro de clientes y agentes compartidos por todo el proceso.
+# ChatGroq y las cadenas de LangChain son seguros entre hilos, así que basta con construirlos una vez.
+
+URL_GROQ = "https://api.groq.com/openai/v1/models"
+
+T = TypeVar("T")
+
+_candado = threading.Lock()
+_http_cliente: Optional[httpx.Client] = None
+_http_cliente_async: Optional[httpx.AsyncClient] = None
+_llms: Dict[Tuple[str, float], ChatGroq] = {}
+_agentes: Dict[type, object] = {}
+
+
+def _limites() -> httpx.Limits:
+    max_conexiones = int(os.getenv("LLM_MAX_CONEXIONES", "20"))
+    return httpx.Limits(
+        max_connections=max_conexiones,
+        max_keepalive_connections=max_conexiones,
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE", "120")),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "60")), connect=10.0)
+
+
+def obtener_http_cliente() -> httpx.Client:
+    """
+    Devuelve el cliente HTTP compartido, con pool de conexiones keep-alive.
+    """
+    global _http_cliente
+    if _http_cliente is None:
+        with _candado:
+            if _http_cliente is None:
+                _http_cliente = httpx.Client(limits=_limites(), timeout=_timeout())
+    return _http_cliente
+
+
+def obtener_http_cliente_async() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente HTTP asíncrono compartido, con pool de conexiones keep-alive.
+    """
+    global _http_cliente_async
+    if _http_cliente_async is None:
+        with _candado:
+            if _http_cliente_async is None:
+                _http_cliente_async = httpx.AsyncClient(limits=_limites(), timeout=_timeout())
+    return _http_cliente_async
+
+
+def obtener_llm(modelo: str, temperatura: float) -> ChatGroq:
+    """
+    Devuelve el ChatGroq compartido para el modelo y la temperatura indicados.
+
+    Args:
+        modelo (str): Nombre del modelo en Groq.
+        temperatura (float): Temperatura de muestreo.
+
+    Returns:
+        ChatGroq: Cliente reutilizable que comparte el pool de conexiones del proceso. Con temperatura 0
+        sus respuestas se guardan en la caché del LLM; con más temperatura cada llamada es una muestra nueva.
+    """
+    clave = (modelo, float(temperatura))
+    llm = _llms.get(clave)
+    if llm is None:
+        http_cliente = obtener_http_cliente()
+        http_cliente_async = obtener_http_cliente_async()
+        with _candado:
+            llm = _llms.get(clave)
+            if llm is None:
+                llm = ChatGroq(
+                    temperature=temperatura,
+                    model=modelo,
+                    http_client=http_cliente,
+                    http_async_client=http_cliente_async,
+                    # Latencia y tokens de cada llamada, para /metrics
+                    callbacks=[ManejadorMetricasLLM(modelo)] if ACTIVAS else None,
+                    cache=obtener_cache_llm() if float(temperatura) == 0 else None,
+                    # Los reintentos (con espera y modelo de respaldo) los gestiona model/pasarela_llm.py
+                    max_retries=0,
+                )
+                _llms[clave] = llm
+    return llm
+
+
+def obtener_agente(clase: Type[T]) -> T:
+    """
+    Devuelve la instancia compartida del agente, construyéndola (prompt y cadena) la primera vez.
+
+    Args:
+        clase (type): Clase del agente, sin argumentos obligatorios en el constructor.
+
+    Returns:
+        Instancia única del agente para este proceso.
+    """
+    agente = _agentes.get(clase)
+    if agente is None:
+        # La construcción puede pedir un LLM al registro, por eso no se hace bajo el candado
+        nuevo = clase()
+        with _candado:
+            agente = _agentes.setdefault(clase, nuevo)
+    return agente
+
+
+def precalentar_conexiones() -> None:
+    """
+    Abre por adelantado la conexión TLS con Groq para que la primera consulta no pague el handshake.
+    """
+    clave_api = os.getenv("GROQ_API_KEY")
+    if not clave_api:
+        return
+    try:
+        obtener_http_cliente().get(URL_GROQ, headers={"Authorization": f"Bearer {clave_api}"})
+    except Exception as e:
+        print(f"No se pudo precalentar la conexión con Groq: {e}")
+
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from model.plazos import PlazoCompartido, contexto_compartido, vencimiento_actual
+
+# Todos los grupos creados en el proceso, para exponer sus estadísticas
+GRUPOS: List["GrupoVuelo"] = []
+
+
+async def _ejecutar(fabrica: Callable[[], Awaitable[Any]]) -> Any:
+    # La corrutina se crea ya dentro de la tarea, con el contexto (y el plazo) compartido
+    return await fabrica()
+
+
+class _Vuelo:
+    __slots__ = ("evento", "resultado", "error", "terminado")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado: Any = None
+        self.error: BaseException = None
+        self.terminado = 0.0
+
+
+class GrupoVuelo:
+    """
+    Coalescencia de llamadas idénticas ("single flight"): mientras una llamada con cierta clave está
+    en curso, las demás con la misma clave esperan su resultado en lugar de repetir el trabajo.
+
+    Con `retener` > 0 el resultado se sigue compartiendo durante esos segundos tras terminar, de modo
+    que la clave efectiva es (clave, ventana de tiempo).
+    """
+
+    def __init__(self, nombre: str, retener: float = 0.0):
+        """
+        Args:
+            nombre (str): Nombre del grupo, para las estadísticas.
+            retener (float): Segundos que se reutiliza un resultado ya terminado.
+        """
+        self.nombre = nombre
+        self.retener = retener
+        self._candado = threading.Lock()
+        self._vuelos: Dict[Hashable, _Vuelo] = {}
+        self._tareas: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Tuple[asyncio.Task, list, list, PlazoCompartido]]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.lideres = 0
+        self.seguidores = 0
+        self.abandonadas = 0
+        GRUPOS.append(self)
+
+    def ejecutar(self, clave: Hashable, funcion: Callable[..., Any], *args: Any) -> Any:
+        """
+        Ejecuta `funcion(*args)` salvo que ya haya una llamada con la misma clave en curso (o retenida),
+        en cuyo caso espera y devuelve su resultado. Para código síncrono ejecutado en varios hilos.
+        """
+        with self._candado:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None and vuelo.terminado and time.monotonic() - vuelo.terminado > self.retener:
+                del self._vuelos[clave]
+                vuelo = None
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.lideres += 1
+            else:
+                self.seguidores += 1
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion(*args)
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._candado:
+                # Los errores no se retienen: la siguiente llamada lo vuelve a intentar
+                if self.retener > 0 and vuelo.error is None:
+                    vuelo.terminado = time.monotonic()
+                else:
+                    self._vuelos.pop(clave, None)
+            vuelo.evento.set()
+
+    async def aejecutar(self, clave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versión asíncrona de `ejecutar`: `fabrica()` crea la corrutina, que solo se lanza si no hay
+        otra en curso (o retenida) con la misma clave en este bucle de eventos.
+
+        La tarea compartida no lleva el plazo de quien la lanzó sino el del último de sus solicitantes
+        (model/plazos.py): una petición con poco margen no recorta el trabajo que otra, con más, también
+        espera. Si la tarea se cancela porque la abandonaron los demás, quien siga esperándola la repite.
+        """
+        while True:
+            tareas = self._tareas.setdefault(asyncio.get_running_loop(), {})
+            existente = tareas.get(clave)
+            if existente is not None:
+                tarea, terminado, _, _ = existente
+                if tarea.cancelled() or (
+                    terminado and (tarea.exception() is not None or time.monotonic() - terminado[0] > self.retener)
+                ):
+                    existente = None
+
+            if existente is None:
+                contexto, compartido = contexto_compartido()
+                tarea = asyncio.get_running_loop().create_task(_ejecutar(fabrica), context=contexto)
+                terminado: list = []
+                solicitantes = [0]
+                tareas[clave] = (tarea, terminado, solicitantes, compartido)
+                self.lideres += 1
+
+                def al_terminar(t: asyncio.Task, clave=clave, tareas=tareas, terminado=terminado) -> None:
+                    if self.retener > 0 and not t.cancelled() and t.exception() is None:
+                        terminado.append(time.monotonic())
+                    elif tareas.get(clave, (None,))[0] is t:
+                        del tareas[clave]
+
+                tarea.add_done_callback(al_terminar)
+            else:
+                self.seguidores += 1
+                tarea, _, solicitantes, compartido = existente
+                compartido.ampliar(vencimiento_actual())
+
+            # shield: si un solicitante se cancela, los demás siguen esperando el mismo resultado. Cuando
+            # se cancelan todos, la llamada ya no le sirve a nadie y se cancela también; antes se quita del
+            # grupo, para que quien llegue después lance otra en lugar de unirse a una que se está cancelando.
+            solicitantes[0] += 1
+            try:
+                return await asyncio.shield(tarea)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() == 0 and tarea.cancelled():
+                    # No se canceló este solicitante sino la tarea compartida: se vuelve a intentar
+                    continue
+                if solicitantes[0] == 1 and not tarea.done():
+                    if tareas.get(clave, (None,))[0] is tarea:
+                        del tareas[clave]
+                    tarea.cancel()
+                    self.abandonadas += 1
+                raise
+            finally:
+                solicitantes[0] -= 1
+
+    def estadisticas(self) -> dict:
+        return {"lideres": self.lideres, "seguidores": self.seguidores, "abandonadas": self.abandonadas}
+
+
+def estadisticas_grupos() -> dict:
+    """
+    Devuelve llamadas ejecutadas (líderes), ahorradas (seguidores) y canceladas porque ya nadie las
+    esperaba (abandonadas) de cada grupo del proceso.
+    """
+    return {grupo.nombre: grupo.estadisticas() for grupo in GRUPOS}
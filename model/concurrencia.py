@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+
+from model.plazos import comprobar
+
+# Límite de llamadas simultáneas por servicio externo. Cada servicio tiene además su propio pool de
+# hilos para las librerías bloqueantes (yfinance, DDGS), así un servicio lento no acapara a los demás.
+LIMITES_POR_DEFECTO = {
+    "yfinance": 8,
+    "noticias": 8,
+    "llm": 16,
+}
+
+_candado = threading.Lock()
+_pools: Dict[str, ThreadPoolExecutor] = {}
+# Los semáforos de asyncio pertenecen a un bucle de eventos: uno por bucle y servicio
+_semaforos: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def limite(servicio: str) -> int:
+    """
+    Devuelve el límite de concurrencia del servicio, configurable con LIMITE_<SERVICIO>.
+    """
+    return int(os.getenv(f"LIMITE_{servicio.upper()}", str(LIMITES_POR_DEFECTO.get(servicio, 4))))
+
+
+def _semaforo(servicio: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _candado:
+        por_servicio = _semaforos.setdefault(loop, {})
+        if servicio not in por_servicio:
+            por_servicio[servicio] = asyncio.Semaphore(limite(servicio))
+        return por_servicio[servicio]
+
+
+def _pool(servicio: str) -> ThreadPoolExecutor:
+    with _candado:
+        if servicio not in _pools:
+            _pools[servicio] = ThreadPoolExecutor(max_workers=limite(servicio), thread_name_prefix=servicio)
+        return _pools[servicio]
+
+
+@asynccontextmanager
+async def limitar(servicio: str):
+    """
+    Reserva una plaza del servicio durante el bloque (para llamadas que ya son asíncronas).
+    """
+    async with _semaforo(servicio):
+        yield
+
+
+async def ejecutar_en_servicio(servicio: str, funcion: Callable[..., Any], *args: Any) -> Any:
+    """
+    Ejecuta una función bloqueante en el pool del servicio sin bloquear el bucle de eventos.
+
+    Args:
+        servicio (str): Nombre del servicio externo ("yfinance", "noticias", ...).
+        funcion (Callable): Función bloqueante.
+        *args: Argumentos de la función.
+
+    Returns:
+        El resultado de la función.
+
+    Si la petición se cancela mientras la función espera turno en el pool, ya no se ejecuta; si vence
+    su plazo antes de que empiece, lanza PlazoAgotado sin llamar al servicio.
+    """
+    # run_in_executor no propaga las variables de contexto (como el desglose de tiempos o el plazo de la petición)
+    contexto = contextvars.copy_context()
+    async with _semaforo(servicio):
+        return await asyncio.get_running_loop().run_in_executor(
+            _pool(servicio), contexto.run, _ejecutar_con_plazo, servicio, funcion, *args
+        )
+
+
+def _ejecutar_con_plazo(servicio: str, funcion: Callable[..., Any], *args: Any) -> Any:
+    # Un trabajo que ha esperado en la cola del pool más que el plazo de su petición no llega a empezar
+    comprobar(servicio)
+    return funcion(*args)
+
+
+def hay_plaza(servicio: str) -> bool:
+    """
+    Indica si el servicio tiene alguna plaza libre en este bucle de eventos (sin reservarla).
+    """
+    return not _semaforo(servicio).locked()
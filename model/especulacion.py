@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+from model.concurrencia import hay_plaza
+from model.resolutor_tickers import UMBRAL_CONFIANZA, obtener_indice
+
+
+class Especulacion:
+    """
+    Descargas lanzadas para un ticker adivinado antes de que `extraer_ticker` lo confirme.
+    """
+
+    __slots__ = ("ticker", "tareas")
+
+    def __init__(self, ticker: str, tareas: List[asyncio.Future]):
+        self.ticker = ticker
+        self.tareas = tareas
+
+
+class Especulador:
+    """
+    Ejecución especulativa de las ramas de precios y noticias.
+
+    Mientras el LLM extrae el ticker de una consulta que el índice local no resuelve con confianza, el
+    mejor candidato local ya se descarga. Las descargas van por los mismos grupos de coalescencia y
+    cachés que los nodos del grafo: si el LLM confirma el candidato, los nodos se suman a la descarga
+    en curso o la encuentran en caché; si no, se cancelan. Las descargas llevan el plazo de la petición,
+    no el del nodo que extrae el ticker, porque las esperan los nodos siguientes.
+
+    El trabajo desperdiciado se limita de tres formas: un máximo de especulaciones en curso, ninguna
+    especulación si yfinance o las noticias no tienen plazas libres, y, si la tasa de aciertos reciente
+    cae por debajo de `acierto_minimo`, solo se especula una de cada diez veces para seguir midiéndola.
+    """
+
+    def __init__(
+        self,
+        lanzar: Callable[[str], List[asyncio.Future]],
+        umbral: Optional[float] = None,
+        max_en_curso: Optional[int] = None,
+        acierto_minimo: Optional[float] = None,
+        ventana: int = 50,
+    ):
+        """
+        Args:
+            lanzar (Callable): Recibe un ticker y devuelve las tareas que descargan sus precios y noticias.
+            umbral (float): Confianza local mínima del candidato (ESPECULACION_UMBRAL, por defecto 0.5).
+            max_en_curso (int): Especulaciones simultáneas (ESPECULACION_MAX_EN_CURSO, por defecto 4).
+            acierto_minimo (float): Tasa de aciertos por debajo de la cual se deja de especular casi
+                siempre (ESPECULACION_ACIERTO_MIN, por defecto 0.25).
+            ventana (int): Resultados recientes con los que se calcula esa tasa.
+        """
+        self.lanzar = lanzar
+        self.activa = os.getenv("ESPECULACION", "1") != "0"
+        self.umbral = umbral if umbral is not None else float(os.getenv("ESPECULACION_UMBRAL", "0.5"))
+        self.max_en_curso = max_en_curso or int(os.getenv("ESPECULACION_MAX_EN_CURSO", "4"))
+        self.acierto_minimo = (
+            acierto_minimo if acierto_minimo is not None else float(os.getenv("ESPECULACION_ACIERTO_MIN", "0.25"))
+        )
+        self._recientes: deque = deque(maxlen=ventana)  # True si acertó, False si se descartó
+        self._en_curso = 0
+        self._oportunidades_en_pausa = 0
+        self._candado = threading.Lock()
+        self._contadores = {"lanzadas": 0, "aciertos": 0, "fallos": 0, "omitidas": 0}
+
+    def _tasa_reciente(self) -> Optional[float]:
+        if len(self._recientes) < 20:
+            return None
+        return sum(self._recientes) / len(self._recientes)
+
+    def _permitida(self) -> bool:
+        with self._candado:
+            if self._en_curso >= self.max_en_curso:
+                return False
+            tasa = self._tasa_reciente()
+            if tasa is not None and tasa < self.acierto_minimo:
+                self._oportunidades_en_pausa += 1
+                if self._oportunidades_en_pausa % 10:
+                    return False
+            self._en_curso += 1
+            return True
+
+    def iniciar(self, consulta: str) -> Optional[Especulacion]:
+        """
+        Lanza las descargas del candidato local de la consulta si merece la pena especular.
+        Debe llamarse dentro del bucle de eventos, antes de esperar al LLM.
+
+        Returns:
+            Especulacion | None: Las descargas lanzadas, o None si no se especula.
+        """
+        if not self.activa:
+            return None
+        resolucion = obtener_indice().resolver(consulta)
+        # Con confianza alta el ticker se resuelve sin LLM y no hay nada que adelantar
+        if resolucion is None or not self.umbral <= resolucion.confianza < UMBRAL_CONFIANZA:
+            return None
+        if not (hay_plaza("yfinance") and hay_plaza("noticias")) or not self._permitida():
+            self._contadores["omitidas"] += 1
+            return None
+
+        tareas = self.lanzar(resolucion.ticker)
+        for tarea in tareas:
+            # Un fallo en una descarga descartada no debe quedar como excepción sin recoger
+            tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._contadores["lanzadas"] += 1
+        return Especulacion(resolucion.ticker, tareas)
+
+    def confirmar(self, especulacion: Optional[Especulacion], ticker: Optional[str]) -> None:
+        """
+        Compara el candidato con el ticker confirmado. Si coincide, las descargas siguen y los nodos
+        del grafo las aprovechan; si no, se cancelan.
+        """
+        if especulacion is None:
+            return
+        acierto = ticker is not None and ticker.strip().upper() == especulacion.ticker
+        if not acierto:
+            # Se suelta la espera. Si ninguna otra petición espera la descarga compartida del grupo de
+            # coalescencia, el grupo la cancela: lo que aún no había empezado en el pool ya no se ejecuta, y
+            # lo que ya corría en un hilo termina sin que nadie lo espere
+            for tarea in especulacion.tareas:
+                tarea.cancel()
+        with self._candado:
+            self._en_curso -= 1
+            self._recientes.append(acierto)
+        self._contadores["aciertos" if acierto else "fallos"] += 1
+
+    def estadisticas(self) -> dict:
+        resueltas = self._contadores["aciertos"] + self._contadores["fallos"]
+        return {
+            **self._contadores,
+            "tasa_aciertos": round(self._contadores["aciertos"] / resueltas, 3) if resueltas else None,
+        }
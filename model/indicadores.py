@@ -0,0 +1,170 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Sesiones bursátiles por año, para anualizar la volatilidad diaria
+SESIONES_POR_ANO = 252
+
+
+def _ema(valores: np.ndarray, alfa: float) -> np.ndarray:
+    """
+    Media móvil exponencial recursiva (y_t = alfa * x_t + (1 - alfa) * y_{t-1}).
+    La recursión se delega en la implementación compilada de pandas para no iterar en Python.
+    """
+    return pd.Series(valores, copy=False).ewm(alpha=alfa, adjust=False).mean().to_numpy()
+
+
+def _columna(df: pd.DataFrame, nombre: str) -> Optional[np.ndarray]:
+    if nombre not in df.columns:
+        return None
+    return np.ascontiguousarray(df[nombre].to_numpy(dtype=np.float64))
+
+
+def calcular_indicadores(df: pd.DataFrame) -> Dict[str, Optional[float]]:
+    """
+    Calcula todas las métricas del análisis en una sola pasada sobre arrays contiguos.
+
+    Args:
+        df (pd.DataFrame): Barras OHLCV indexadas por fecha. Solo 'Close' es obligatoria;
+            'High' y 'Low' se usan para el ATR si están disponibles.
+
+    Returns:
+        dict: Métricas calculadas. Las que no se pueden calcular con los datos disponibles valen None.
+    """
+    cierre = _columna(df, "Close")
+    if cierre is None:
+        raise ValueError("columna 'Close' no encontrada")
+    alto = _columna(df, "High")
+    bajo = _columna(df, "Low")
+
+    validos = np.isfinite(cierre)
+    if not validos.all():
+        cierre = cierre[validos]
+        alto = alto[validos] if alto is not None else None
+        bajo = bajo[validos] if bajo is not None else None
+    n = cierre.size
+    if n == 0:
+        raise ValueError("no hay precios de cierre")
+
+    resultado: Dict[str, Optional[float]] = {
+        "precio_actual": float(cierre[-1]),
+        "media_7_dias": float(cierre[-7:].mean()),
+        # Con menos de 200 barras se usa el promedio total, como en el análisis original
+        "media_movil_200": float(cierre[-200:].mean()),
+        "media_movil_200_completa": n >= 200,
+        "tendencia_30_pct": None,
+        "rsi_14": None,
+        "macd": None,
+        "macd_senal": None,
+        "macd_histograma": None,
+        "bollinger_media": None,
+        "bollinger_superior": None,
+        "bollinger_inferior": None,
+        "atr_14": None,
+        "volatilidad_anual_pct": None,
+        "drawdown_maximo_pct": None,
+        "drawdown_actual_pct": None,
+    }
+
+    if n >= 30:
+        resultado["tendencia_30_pct"] = float((cierre[-1] - cierre[-30]) / cierre[-30] * 100)
+
+    if n >= 2:
+        variaciones = np.diff(cierre)
+
+        # RSI de Wilder (suavizado exponencial con alfa = 1/14)
+        if n > 14:
+            ganancias = _ema(np.clip(variaciones, 0, None), 1 / 14)[-1]
+            perdidas = _ema(np.clip(-variaciones, 0, None), 1 / 14)[-1]
+            resultado["rsi_14"] = float(100.0 if perdidas == 0 else 100 - 100 / (1 + ganancias / perdidas))
+
+        # Volatilidad anualizada de los rendimientos logarítmicos
+        if n > 2:
+            rendimientos = np.log(cierre[1:] / cierre[:-1])
+            resultado["volatilidad_anual_pct"] = float(rendimientos.std(ddof=1) * np.sqrt(SESIONES_POR_ANO) * 100)
+
+    # MACD (12, 26, 9)
+    if n >= 26:
+        linea_macd = _ema(cierre, 2 / 13) - _ema(cierre, 2 / 27)
+        senal = _ema(linea_macd, 2 / 10)
+        resultado["macd"] = float(linea_macd[-1])
+        resultado["macd_senal"] = float(senal[-1])
+        resultado["macd_histograma"] = float(linea_macd[-1] - senal[-1])
+
+    # Bandas de Bollinger (20, 2)
+    if n >= 20:
+        ventana = cierre[-20:]
+        media = ventana.mean()
+        desviacion = ventana.std()
+        resultado["bollinger_media"] = float(media)
+        resultado["bollinger_superior"] = float(media + 2 * desviacion)
+        resultado["bollinger_inferior"] = float(media - 2 * desviacion)
+
+    # ATR de Wilder (14)
+    if alto is not None and bajo is not None and n > 14:
+        cierre_previo = cierre[:-1]
+        rango_verdadero = np.maximum.reduce([
+            alto[1:] - bajo[1:],
+            np.abs(alto[1:] - cierre_previo),
+            np.abs(bajo[1:] - cierre_previo),
+        ])
+        resultado["atr_14"] = float(_ema(rango_verdadero, 1 / 14)[-1])
+
+    # Drawdown respecto al máximo acumulado
+    drawdown = cierre / np.maximum.accumulate(cierre) - 1
+    resultado["drawdown_maximo_pct"] = float(drawdown.min() * 100)
+    resultado["drawdown_actual_pct"] = float(drawdown[-1] * 100)
+
+    return resultado
+
+
+def _describir_tendencia(tendencia_pct: Optional[float]) -> str:
+    if tendencia_pct is None:
+        return "datos insuficientes para tendencia"
+    if tendencia_pct > 2:
+        return f"alcista (+{tendencia_pct:.1f}%)"
+    if tendencia_pct < -2:
+        return f"bajista ({tendencia_pct:.1f}%)"
+    return f"neutral ({tendencia_pct:.1f}%)"
+
+
+def formatear_indicadores(indicadores: Dict[str, Optional[float]]) -> str:
+    """
+    Convierte las métricas en el texto que recibe el asesor financiero.
+
+    Args:
+        indicadores (dict): Resultado de `calcular_indicadores`.
+
+    Returns:
+        str: Resumen legible de las métricas.
+    """
+    def fmt(clave: str, plantilla: str) -> Optional[str]:
+        valor = indicadores.get(clave)
+        return None if valor is None else plantilla.format(valor)
+
+    nota_ma = "" if indicadores["media_movil_200_completa"] else " (promedio total: menos de 200 sesiones)"
+    lineas = [
+        f"- Promedio de precio de cierre últimos 7 días: ${indicadores['media_7_dias']:.2f}",
+        f"- Media móvil de 200 períodos: ${indicadores['media_movil_200']:.2f}{nota_ma}",
+        f"- Tendencia de 30 días: {_describir_tendencia(indicadores['tendencia_30_pct'])}",
+        f"- Precio actual: ${indicadores['precio_actual']:.2f}",
+        fmt("rsi_14", "- RSI (14): {:.1f}"),
+    ]
+    if indicadores.get("macd") is not None:
+        lineas.append(
+            f"- MACD (12, 26, 9): {indicadores['macd']:.2f}, señal {indicadores['macd_senal']:.2f}, "
+            f"histograma {indicadores['macd_histograma']:.2f}"
+        )
+    if indicadores.get("bollinger_media") is not None:
+        lineas.append(
+            f"- Bandas de Bollinger (20, 2): inferior ${indicadores['bollinger_inferior']:.2f}, "
+            f"media ${indicadores['bollinger_media']:.2f}, superior ${indicadores['bollinger_superior']:.2f}"
+        )
+    lineas += [
+        fmt("atr_14", "- ATR (14): ${:.2f}"),
+        fmt("volatilidad_anual_pct", "- Volatilidad anualizada: {:.1f}%"),
+        fmt("drawdown_maximo_pct", "- Drawdown máximo del periodo: {:.1f}%"),
+        fmt("drawdown_actual_pct", "- Drawdown actual desde máximos: {:.1f}%"),
+    ]
+    return "Análisis Financiero (Métricas Calculadas):\n" + "\n".join(l for l in lineas if l)
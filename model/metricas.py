@@ -0,0 +1,270 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Métricas del proceso en formato Prometheus, sin dependencias externas. Con METRICAS=0 no se mide
+# nada: los nodos no se envuelven y `medir` no toma tiempos.
+ACTIVAS = os.getenv("METRICAS", "1") != "0"
+
+# Límites (en segundos) de los histogramas de latencia
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+_candado = threading.Lock()
+_histogramas: Dict[str, Dict[Etiquetas, List[float]]] = {}  # nombre -> etiquetas -> [cubos..., suma, cuenta]
+_contadores: Dict[str, Dict[Etiquetas, float]] = {}
+_ayudas: Dict[str, Tuple[str, str]] = {}  # nombre -> (tipo, ayuda)
+_colectores: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+# Desglose de tiempos de la petición en curso: segundos acumulados por nodo y por llamada externa
+_desglose: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("desglose", default=None)
+
+
+def _describir(nombre: str, tipo: str, ayuda: str) -> None:
+    _ayudas.setdefault(nombre, (tipo, ayuda))
+
+
+_describir("informe_nodo_segundos", "histogram", "Latencia de cada nodo del grafo del reporte")
+_describir("informe_llamada_segundos", "histogram", "Latencia de las llamadas a servicios externos")
+_describir("informe_errores_total", "counter", "Errores en nodos y llamadas externas")
+_describir("informe_tokens_total", "counter", "Tokens de entrada y salida consumidos por modelo")
+
+
+def observar(nombre: str, valor: float, **etiquetas: str) -> None:
+    """
+    Añade una observación a un histograma de latencia.
+    """
+    if not ACTIVAS:
+        return
+    clave = tuple(sorted(etiquetas.items()))
+    with _candado:
+        serie = _histogramas.setdefault(nombre, {}).get(clave)
+        if serie is None:
+            serie = _histogramas[nombre][clave] = [0.0] * (len(LIMITES_LATENCIA) + 2)
+        for i, limite in enumerate(LIMITES_LATENCIA):
+            if valor <= limite:
+                serie[i] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+
+def incrementar(nombre: str, valor: float = 1.0, **etiquetas: str) -> None:
+    """
+    Suma `valor` a un contador.
+    """
+    if not ACTIVAS:
+        return
+    clave = tuple(sorted(etiquetas.items()))
+    with _candado:
+        serie = _contadores.setdefault(nombre, {})
+        serie[clave] = serie.get(clave, 0.0) + valor
+
+
+def registrar_tokens(modelo: str, entrada: int, salida: int) -> None:
+    incrementar("informe_tokens_total", entrada, modelo=modelo, tipo="entrada")
+    incrementar("informe_tokens_total", salida, modelo=modelo, tipo="salida")
+
+
+def registrar_colector(prefijo: str, funcion: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Registra una función de estadísticas (como `estadisticas()` de los almacenes) cuyos valores
+    numéricos se exportan como `informe_<prefijo>_<clave>` en cada lectura de /metrics.
+    """
+    _colectores.append((prefijo, funcion))
+
+
+def _acumular_desglose(clave: str, segundos: float) -> None:
+    desglose = _desglose.get()
+    if desglose is not None:
+        desglose[clave] = desglose.get(clave, 0.0) + segundos
+
+
+@contextmanager
+def medir(tipo: str, nombre: str, operacion: str = ""):
+    """
+    Mide la duración del bloque como nodo del grafo (tipo "nodo") o como llamada a un servicio
+    externo (tipo "llamada"), cuenta sus errores y la suma al desglose de la petición en curso.
+
+    Args:
+        tipo (str): "nodo" o "llamada".
+        nombre (str): Nodo o servicio ("yfinance", "ddgs", "llm"...).
+        operacion (str): Detalle de la llamada (modelo, consulta...), solo para las llamadas.
+    """
+    if not ACTIVAS:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        incrementar("informe_errores_total", tipo=tipo, origen=nombre)
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        if tipo == "nodo":
+            observar("informe_nodo_segundos", segundos, nodo=nombre)
+        else:
+            observar("informe_llamada_segundos", segundos, servicio=nombre, operacion=operacion)
+        _acumular_desglose(f"{tipo}:{nombre}", segundos)
+
+
+def instrumentar_nodo(nombre: str, funcion: Callable) -> Callable:
+    """
+    Envuelve un nodo del grafo (síncrono o asíncrono) para medir su latencia. Con las métricas
+    desactivadas devuelve la función original.
+    """
+    if not ACTIVAS:
+        return funcion
+
+    if inspect.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def nodo_async(*args, **kwargs):
+            with medir("nodo", nombre):
+                return await funcion(*args, **kwargs)
+        return nodo_async
+
+    @functools.wraps(funcion)
+    def nodo(*args, **kwargs):
+        with medir("nodo", nombre):
+            return funcion(*args, **kwargs)
+    return nodo
+
+
+def iniciar_desglose() -> Optional[Dict[str, float]]:
+    """
+    Empieza el desglose de tiempos de una petición en el contexto actual (tarea o hilo) y lo devuelve.
+    """
+    if not ACTIVAS:
+        return None
+    desglose: Dict[str, float] = {}
+    _desglose.set(desglose)
+    return desglose
+
+
+def formatear_desglose(desglose: Optional[Dict[str, float]], total: float) -> Optional[Dict[str, Any]]:
+    """
+    Convierte un desglose en milisegundos, agrupado en nodos y llamadas externas, para la respuesta JSON.
+    """
+    if desglose is None:
+        return None
+    resultado: Dict[str, Any] = {"total_ms": round(total * 1000, 1), "nodos": {}, "llamadas": {}}
+    for clave, segundos in desglose.items():
+        tipo, nombre = clave.split(":", 1)
+        resultado["nodos" if tipo == "nodo" else "llamadas"][nombre] = round(segundos * 1000, 1)
+    return resultado
+
+
+class ManejadorMetricasLLM(BaseCallbackHandler):
+    """
+    Callback de LangChain que mide cada llamada a un modelo y cuenta sus tokens.
+    """
+
+    # Se ejecuta en el mismo hilo o tarea que la llamada, para ver el desglose de la petición
+    run_inline = True
+
+    def __init__(self, modelo: str):
+        self.modelo = modelo
+        self._inicios: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs) -> None:
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs) -> None:
+        self._inicios[run_id] = time.perf_counter()
+
+    def _terminar(self, run_id: UUID) -> None:
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is None:
+            return
+        segundos = time.perf_counter() - inicio
+        observar("informe_llamada_segundos", segundos, servicio="llm", operacion=self.modelo)
+        _acumular_desglose("llamada:llm", segundos)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        self._terminar(run_id)
+        entrada = salida = 0
+        for generaciones in response.generations:
+            for generacion in generaciones:
+                uso = getattr(getattr(generacion, "message", None), "usage_metadata", None)
+                if uso:
+                    entrada += uso.get("input_tokens", 0)
+                    salida += uso.get("output_tokens", 0)
+        if not entrada and not salida:
+            uso = (response.llm_output or {}).get("token_usage") or {}
+            entrada, salida = uso.get("prompt_tokens", 0), uso.get("completion_tokens", 0)
+        if entrada or salida:
+            registrar_tokens(self.modelo, entrada, salida)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        self._terminar(run_id)
+        incrementar("informe_errores_total", tipo="llamada", origen="llm")
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas: Etiquetas, limite: str = "") -> str:
+    partes = [f'{k}="{_escapar(str(v))}"' for k, v in etiquetas]
+    if limite:
+        partes.append(f'le="{limite}"')
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def exportar_prometheus() -> str:
+    """
+    Devuelve todas las métricas en el formato de texto de Prometheus (versión 0.0.4).
+    """
+    lineas: List[str] = []
+    with _candado:
+        histogramas = {n: {k: list(v) for k, v in s.items()} for n, s in _histogramas.items()}
+        contadores = {n: dict(s) for n, s in _contadores.items()}
+
+    for nombre, series in sorted(histogramas.items()):
+        _, ayuda = _ayudas.get(nombre, ("histogram", nombre))
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for etiquetas, serie in sorted(series.items()):
+            for limite, cuenta in zip(LIMITES_LATENCIA, serie):
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, str(limite))} {cuenta:g}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, '+Inf')} {serie[-1]:g}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {serie[-2]:.6f}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {serie[-1]:g}")
+
+    for nombre, series in sorted(contadores.items()):
+        _, ayuda = _ayudas.get(nombre, ("counter", nombre))
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for etiquetas, valor in sorted(series.items()):
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor:g}")
+
+    # Las estadísticas de los colectores se agrupan por métrica: cada una lleva un solo TYPE
+    indicadores: Dict[str, List[str]] = {}
+    for prefijo, funcion in _colectores:
+        try:
+            valores = funcion()
+        except Exception as e:
+            print(f"Error leyendo las estadísticas de {prefijo}: {e}")
+            continue
+        for metrica, etiquetas, valor in _aplanar(f"informe_{prefijo}", valores, ()):
+            indicadores.setdefault(metrica, []).append(f"{metrica}{_etiquetas(etiquetas)} {valor:g}")
+    for metrica, muestras in indicadores.items():
+        lineas.append(f"# TYPE {metrica} gauge")
+        lineas += muestras
+    return "\n".join(lineas) + "\n"
+
+
+def _aplanar(nombre: str, valores: Dict[str, Any], etiquetas: Etiquetas) -> Iterator[Tuple[str, Etiquetas, float]]:
+    # Los diccionarios anidados (estadísticas por grupo) pasan a ser una etiqueta "grupo"
+    for clave, valor in valores.items():
+        if isinstance(valor, dict):
+            yield from _aplanar(nombre, valor, etiquetas + (("grupo", str(clave)),))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield f"{nombre}_{clave}", etiquetas, valor
@@ -0,0 +1,214 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from ddgs import DDGS
+
+from model.metricas import medir
+from model.plazos import PlazoAgotado, acotar, restante
+
+# Parámetros de seguimiento que no cambian la noticia a la que apunta un enlace
+PARAMETROS_SEGUIMIENTO = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "guccounter", "ref"}
+
+# Dos fragmentos se consideran la misma noticia si comparten al menos esta fracción de tejas (Jaccard)
+UMBRAL_DUPLICADO = 0.6
+TAMANO_TEJA = 3
+
+
+def normalizar_url(url: str) -> str:
+    """
+    Reduce un enlace a su forma canónica: sin esquema, sin "www.", sin barra final ni parámetros de seguimiento.
+    """
+    partes = urlsplit(url.strip())
+    dominio = partes.netloc.lower().removeprefix("www.")
+    consulta = urlencode(sorted((k, v) for k, v in parse_qsl(partes.query) if k.lower() not in PARAMETROS_SEGUIMIENTO))
+    return f"{dominio}{partes.path.rstrip('/')}" + (f"?{consulta}" if consulta else "")
+
+
+def tejas(texto: str, tamano: int = TAMANO_TEJA) -> Set[int]:
+    """
+    Devuelve los hashes de las secuencias de `tamano` palabras consecutivas del texto.
+    """
+    palabras = re.findall(r"\w+", texto.lower())
+    if len(palabras) < tamano:
+        return {hash(" ".join(palabras))} if palabras else set()
+    return {hash(" ".join(palabras[i:i + tamano])) for i in range(len(palabras) - tamano + 1)}
+
+
+def deduplicar(resultados: List[dict], umbral: float = UMBRAL_DUPLICADO) -> List[dict]:
+    """
+    Elimina resultados con el mismo enlace o con un título y fragmento casi idénticos a otro anterior.
+
+    Args:
+        resultados (List[dict]): Resultados de DDGS (claves "title", "href" y "body"), por orden de relevancia.
+        umbral (float): Similitud de Jaccard entre tejas a partir de la cual dos textos son duplicados.
+
+    Returns:
+        List[dict]: Los resultados únicos, en el orden original.
+    """
+    urls: Set[str] = set()
+    vistos: List[Set[int]] = []
+    unicos = []
+    for r in resultados:
+        url = normalizar_url(r.get("href", ""))
+        if url and url in urls:
+            continue
+        conjunto = tejas(f"{r.get('title', '')} {r.get('body', '')}")
+        if conjunto and any(len(conjunto & otro) / len(conjunto | otro) >= umbral for otro in vistos):
+            continue
+        urls.add(url)
+        vistos.append(conjunto)
+        unicos.append(r)
+    return unicos
+
+
+class ServicioNoticias:
+    """
+    Búsqueda de noticias de un ticker: varias consultas a DuckDuckGo en paralelo bajo un plazo común,
+    resultados deduplicados y una caché por ticker con caducidad (TTL).
+    """
+
+    def __init__(
+        self,
+        nombre_empresa: Optional[Callable[[str], Optional[str]]] = None,
+        ttl: Optional[float] = None,
+        ttl_parcial: Optional[float] = None,
+        plazo: Optional[float] = None,
+        max_resultados: Optional[int] = None,
+        por_consulta: int = 4,
+        max_entradas: int = 512,
+    ):
+        """
+        Args:
+            nombre_empresa (Callable): Devuelve el nombre de la empresa de un ticker, o None si no se conoce.
+            ttl (float): Segundos que se reutilizan las noticias de un ticker (NOTICIAS_TTL, por defecto 900).
+            ttl_parcial (float): Segundos que se reutilizan si alguna consulta no respondió a tiempo o falló
+                (NOTICIAS_TTL_PARCIAL, por defecto 60).
+            plazo (float): Segundos que se espera a las consultas en curso (NOTICIAS_PLAZO, por defecto 6).
+            max_resultados (int): Noticias que se devuelven como máximo (NOTICIAS_MAX, por defecto 6).
+            por_consulta (int): Resultados pedidos a cada consulta.
+            max_entradas (int): Tickers que se conservan en la caché.
+        """
+        self.nombre_empresa = nombre_empresa or (lambda ticker: None)
+        self.ttl = ttl if ttl is not None else float(os.getenv("NOTICIAS_TTL", "900"))
+        self.ttl_parcial = ttl_parcial if ttl_parcial is not None else float(os.getenv("NOTICIAS_TTL_PARCIAL", "60"))
+        self.plazo = plazo if plazo is not None else float(os.getenv("NOTICIAS_PLAZO", "6"))
+        self.max_resultados = max_resultados or int(os.getenv("NOTICIAS_MAX", "6"))
+        self.por_consulta = por_consulta
+        self.max_entradas = max_entradas
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # ticker -> (texto, caduca)
+        self._candado = threading.Lock()
+        # Una sesión de DDGS por hilo del pool: se reutilizan sus conexiones entre búsquedas
+        self._sesiones = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ddgs")
+        self.aciertos = 0
+        self.fallos = 0
+
+    def consultas(self, ticker: str) -> List[str]:
+        consultas = [f"{ticker} stock news"]
+        nombre = self.nombre_empresa(ticker)
+        if nombre:
+            consultas.append(f"{nombre} news")
+        consultas.append(f"{ticker} earnings")
+        return consultas
+
+    def _sesion(self) -> DDGS:
+        sesion = getattr(self._sesiones, "ddgs", None)
+        if sesion is None:
+            sesion = self._sesiones.ddgs = DDGS()
+        return sesion
+
+    def _buscar(self, consulta: str) -> List[dict]:
+        try:
+            with medir("llamada", "ddgs", "text"):
+                return list(self._sesion().text(consulta, max_results=self.por_consulta) or [])
+        except Exception:
+            # Una sesión que ha fallado puede haber quedado en mal estado: la siguiente búsqueda abre otra
+            self._sesiones.ddgs = None
+            raise
+
+    def buscar(self, ticker: str) -> Tuple[List[dict], bool]:
+        """
+        Lanza todas las consultas del ticker en paralelo y combina lo que haya llegado dentro del plazo
+        (el del servicio o, si es menor, lo que le quede a la petición).
+
+        Returns:
+            Tuple[List[dict], bool]: Los resultados y si están completos (todas las consultas respondieron).
+
+        Raises:
+            Exception: El error de la primera consulta, si ninguna ha devuelto resultados.
+        """
+        consultas = self.consultas(ticker)
+        # Cada consulta se ejecuta en el contexto de la petición, para que cuente en su desglose de tiempos
+        futuros = [self._pool.submit(contextvars.copy_context().run, self._buscar, consulta) for consulta in consultas]
+        # Sin esperar más de lo que le quede a la petición
+        wait(futuros, timeout=acotar(self.plazo))
+
+        resultados, error, completo = [], None, True
+        # Por orden de consulta: la del ticker es la más relevante y sus resultados van primero
+        for futuro in futuros:
+            if not futuro.done():
+                # Las que aún no han empezado ya no se lanzan; las que están en curso siguen en el pool
+                futuro.cancel()
+                completo = False
+                continue
+            if futuro.exception() is not None:
+                error = error or futuro.exception()
+                completo = False
+                continue
+            resultados.extend(futuro.result())
+        if not resultados and error is not None:
+            raise error
+        if not resultados and restante() == 0.0:
+            # Nada ha llegado antes de que venciera la petición: no es lo mismo que no haber noticias
+            raise PlazoAgotado(f"Ninguna búsqueda de noticias de {ticker} respondió dentro del plazo")
+        return deduplicar(resultados)[: self.max_resultados], completo
+
+    def obtener(self, ticker: str) -> str:
+        """
+        Devuelve las noticias del ticker formateadas para el prompt, desde la caché si siguen vigentes.
+        """
+        clave = ticker.strip().upper()
+        with self._candado:
+            entrada = self._cache.get(clave)
+            if entrada is not None and time.time() <= entrada[1]:
+                self._cache.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0]
+            self.fallos += 1
+
+        try:
+            resultados, completo = self.buscar(clave)
+        except PlazoAgotado:
+            # Quien espera las noticias decide cómo seguir sin ellas (el grafo, con un reporte parcial)
+            raise
+        except Exception as e:
+            # Los errores no se guardan en caché
+            return f"Hubo un error al obtener las noticias de {ticker}: {str(e)}"
+
+        noticias = [
+            f"{r.get('title', 'Sin título')}\n{r.get('body', 'Sin descripción')}\n{r.get('href', '#')}"
+            for r in resultados
+        ]
+        texto = "\n\n".join(noticias) if noticias else "No se encontraron noticias relevantes."
+        if restante() == 0.0:
+            # Resultados recortados por el plazo de la petición: sirven para esta, pero no se guardan
+            return texto
+        # Si faltan consultas, lo que llegó sirve a las peticiones de los próximos segundos, pero no se
+        # reutiliza todo el TTL: la siguiente búsqueda puede traer las noticias completas
+        with self._candado:
+            self._cache[clave] = (texto, time.time() + (self.ttl if completo else self.ttl_parcial))
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+        return texto
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._candado:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "entradas": len(self._cache)}
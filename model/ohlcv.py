@@ -0,0 +1,128 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Esquema canónico de las barras: columnas en este orden (las que haya, 'Close' siempre) y su tipo.
+# Los precios van en float32, siete cifras significativas sobran para un informe; el volumen en
+# float64, porque en float32 perdería precisión por encima de 16 millones.
+ESQUEMA: Dict[str, np.dtype] = {
+    "Open": np.dtype(np.float32),
+    "High": np.dtype(np.float32),
+    "Low": np.dtype(np.float32),
+    "Close": np.dtype(np.float32),
+    "Adj Close": np.dtype(np.float32),
+    "Volume": np.dtype(np.float64),
+}
+
+# Nombres con los que pueden llegar las columnas (yfinance, Parquet antiguos, CSV...)
+_NOMBRES = {nombre.lower(): nombre for nombre in ESQUEMA}
+_NOMBRES.update({"adj_close": "Adj Close", "adjclose": "Adj Close"})
+_COLUMNAS_FECHA = {"date", "datetime", "fecha"}
+
+
+def es_ohlcv(df: Optional[pd.DataFrame]) -> bool:
+    """
+    Indica si unas barras ya tienen el esquema canónico: índice de fechas ordenado y sin repetidos,
+    solo columnas del esquema con su tipo, 'Close' presente y los datos de solo lectura. Las
+    porciones de filas de unas barras canónicas (como las de `iloc[a:b]`) lo siguen siendo.
+    """
+    if not isinstance(df, pd.DataFrame) or not isinstance(df.index, pd.DatetimeIndex):
+        return False
+    columnas = df.columns
+    if isinstance(columnas, pd.MultiIndex) or not columnas.is_unique or "Close" not in columnas:
+        return False
+    for columna in columnas:
+        if ESQUEMA.get(columna) != df[columna].dtype or df[columna].to_numpy().flags.writeable:
+            return False
+    return df.index.is_monotonic_increasing and df.index.is_unique
+
+
+def _congelar(valores: np.ndarray) -> np.ndarray:
+    valores.flags.writeable = False
+    return valores
+
+
+def _marco(columnas: Dict[str, np.ndarray], indice: pd.DatetimeIndex) -> pd.DataFrame:
+    # copy=False: cada columna queda en su propio bloque, sobre el array de solo lectura
+    return pd.DataFrame(columnas, index=indice, copy=False)
+
+
+def vacio() -> pd.DataFrame:
+    """
+    Barras canónicas sin filas.
+    """
+    indice = pd.DatetimeIndex([], name="Date")
+    return _marco({nombre: _congelar(np.empty(0, dtype=tipo)) for nombre, tipo in ESQUEMA.items()}, indice)
+
+
+def normalizar_ohlcv(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Convierte unas barras OHLCV en cualquiera de las formas en que llegan (columnas MultiIndex de
+    yfinance, fecha como columna, nombres en minúsculas, sin ordenar, tipos enteros o float64) al
+    esquema canónico, en una sola pasada y con una única copia de cada columna.
+
+    El resultado es de solo lectura: quien necesite columnas adicionales debe crear su propio marco.
+    Si las barras ya son canónicas se devuelven tal cual, sin copiarlas.
+
+    Args:
+        df (pd.DataFrame): Barras OHLCV. None o un DataFrame vacío dan barras canónicas vacías.
+
+    Returns:
+        pd.DataFrame: Barras con índice `Date` ordenado y sin fechas repetidas (se queda la última).
+
+    Raises:
+        ValueError: Si no hay columna 'Close' ni 'Adj Close', o las fechas no se pueden interpretar.
+    """
+    if es_ohlcv(df):
+        return df
+    if df is None or df.empty:
+        return vacio()
+
+    columnas = df.columns
+    if isinstance(columnas, pd.MultiIndex):
+        # yfinance pone los campos en el nivel 1 con group_by='ticker' y en el 0 sin él
+        nivel = next(
+            (n for n in range(columnas.nlevels) if "close" in {str(c).lower() for c in columnas.get_level_values(n)}),
+            columnas.nlevels - 1,
+        )
+        columnas = columnas.get_level_values(nivel)
+
+    posiciones: Dict[str, int] = {}
+    posicion_fecha = None
+    for i, columna in enumerate(columnas):
+        clave = str(columna).strip().lower()
+        if clave in _NOMBRES:
+            posiciones.setdefault(_NOMBRES[clave], i)
+        elif clave in _COLUMNAS_FECHA and posicion_fecha is None:
+            posicion_fecha = i
+    if "Close" not in posiciones and "Adj Close" not in posiciones:
+        raise ValueError(f"Las barras no tienen columna 'Close' ni 'Adj Close': {list(columnas)}")
+
+    if isinstance(df.index, pd.DatetimeIndex) or posicion_fecha is None:
+        indice = pd.DatetimeIndex(df.index)
+    else:
+        indice = pd.DatetimeIndex(df.iloc[:, posicion_fecha])
+
+    # Un solo reordenamiento para ordenar y quitar fechas repetidas; si ya lo están, ninguno
+    filas = None
+    if not indice.is_monotonic_increasing:
+        filas = np.argsort(indice.asi8, kind="stable")
+        indice = indice[filas]
+    if not indice.is_unique:
+        ultimas = np.flatnonzero(~indice.duplicated(keep="last"))
+        filas = ultimas if filas is None else filas[ultimas]
+        indice = indice[ultimas]
+
+    marco: Dict[str, np.ndarray] = {}
+    for nombre, tipo in ESQUEMA.items():
+        posicion = posiciones.get(nombre)
+        if posicion is None:
+            continue
+        valores = df.iloc[:, posicion].to_numpy(dtype=tipo, copy=filas is None, na_value=np.nan)
+        marco[nombre] = _congelar(valores[filas] if filas is not None else valores)
+    # El cierre ajustado solo sustituye al cierre cuando este falta
+    if "Close" not in marco:
+        marco = {"Close" if nombre == "Adj Close" else nombre: valores for nombre, valores in marco.items()}
+        marco = {nombre: marco[nombre] for nombre in ESQUEMA if nombre in marco}
+    return _marco(marco, indice.rename("Date"))
@@ -0,0 +1,342 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from model.clientes import obtener_llm
+from model.plazos import PlazoAgotado, acotar, restante
+from model.prompts import contar_tokens
+
+# Peticiones y tokens por minuto de cada modelo (límites del plan gratuito de Groq). LLM_LIMITES los
+# sustituye con el formato "modelo=rpm/tpm,modelo=rpm/tpm".
+LIMITES_POR_DEFECTO = {
+    "llama-3.3-70b-versatile": (30, 12000),
+    "meta-llama/llama-4-maverick-17b-128e-instruct": (30, 6000),
+    "llama-3.1-8b-instant": (30, 6000),
+}
+LIMITES_DESCONOCIDO = (30, 6000)
+
+# Códigos HTTP que merecen otro intento: límite de peticiones, conflictos y errores del proveedor
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _leer_limites() -> Dict[str, Tuple[int, int]]:
+    limites = dict(LIMITES_POR_DEFECTO)
+    for entrada in filter(None, os.getenv("LLM_LIMITES", "").split(",")):
+        modelo, _, valores = entrada.strip().rpartition("=")
+        rpm, _, tpm = valores.partition("/")
+        limites[modelo] = (int(rpm), int(tpm))
+    return limites
+
+
+def es_reintentable(error: BaseException) -> bool:
+    """
+    Indica si un error del proveedor es transitorio: 429, 5xx, timeouts y fallos de conexión.
+    """
+    estado = getattr(error, "status_code", None)
+    if estado is not None:
+        return estado in ESTADOS_REINTENTABLES
+    return type(error).__name__ in {"APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectError"}
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    respuesta = getattr(error, "response", None)
+    cabecera = getattr(respuesta, "headers", {}).get("retry-after") if respuesta is not None else None
+    try:
+        return float(cabecera) if cabecera is not None else None
+    except ValueError:
+        return None
+
+
+def _texto(entrada: Any) -> str:
+    if isinstance(entrada, str):
+        return entrada
+    if hasattr(entrada, "to_string"):
+        return entrada.to_string()
+    return "\n".join(str(getattr(mensaje, "content", mensaje)) for mensaje in entrada)
+
+
+class _Cubo:
+    """
+    Cubo de fichas que se rellena de forma continua hasta `por_minuto`. Las reservas pueden dejarlo en
+    negativo: cada petición espera a que se pague la deuda de las anteriores, así que se atienden en
+    orden de llegada y una petición grande no adelanta a las pequeñas que ya esperaban (ni al revés).
+    """
+
+    def __init__(self, por_minuto: int):
+        self.capacidad = float(por_minuto)
+        self.ritmo = por_minuto / 60.0
+        self.nivel = float(por_minuto)
+        self.actualizado = time.monotonic()
+
+    def _rellenar(self, ahora: float) -> None:
+        self.nivel = min(self.capacidad, self.nivel + (ahora - self.actualizado) * self.ritmo)
+        self.actualizado = ahora
+
+    def espera(self, cantidad: float, ahora: float) -> float:
+        self._rellenar(ahora)
+        return max(0.0, (cantidad - self.nivel) / self.ritmo)
+
+    def reservar(self, cantidad: float, ahora: float) -> float:
+        espera = self.espera(cantidad, ahora)
+        self.nivel -= cantidad
+        return espera
+
+    def devolver(self, cantidad: float) -> None:
+        # Con cantidad negativa cobra lo que la estimación se quedó corta
+        self.nivel = min(self.capacidad, self.nivel + cantidad)
+
+
+class _EstadoModelo:
+    """
+    Presupuestos, latencias recientes y contadores de un modelo, compartidos por todas las pasarelas.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.peticiones = _Cubo(rpm)
+        self.tokens = _Cubo(tpm)
+        self.latencias: deque = deque(maxlen=200)  # (instante, segundos) de las llamadas correctas
+        self.saturado_hasta = 0.0  # tras un 429, hasta cuándo se prefiere el modelo de respaldo
+        self.candado = threading.Lock()
+        self.contadores = {
+            "llamadas": 0, "reintentos": 0, "errores": 0, "espera_total_s": 0.0,
+            # Llamadas que, teniendo este modelo como principal, se enviaron al respaldo y por qué
+            "desvios_slo": 0, "desvios_limite": 0, "desvios_cola": 0,
+            # Llamadas descartadas porque su petición no tenía tiempo de esperar turno o reintentar
+            "sin_plazo": 0,
+        }
+
+    def espera(self, tokens: float) -> float:
+        ahora = time.monotonic()
+        with self.candado:
+            return max(self.peticiones.espera(1, ahora), self.tokens.espera(tokens, ahora))
+
+    def reservar(self, tokens: float) -> float:
+        ahora = time.monotonic()
+        with self.candado:
+            espera = max(self.peticiones.reservar(1, ahora), self.tokens.reservar(tokens, ahora))
+            self.contadores["espera_total_s"] += espera
+            return espera
+
+    def p95(self, ventana: float) -> Optional[float]:
+        limite = time.monotonic() - ventana
+        with self.candado:
+            recientes = sorted(segundos for instante, segundos in self.latencias if instante >= limite)
+        if len(recientes) < 5:
+            return None
+        return recientes[min(len(recientes) - 1, int(0.95 * len(recientes)))]
+
+
+_candado = threading.Lock()
+_estados: Dict[str, _EstadoModelo] = {}
+_pasarelas: Dict[Tuple[str, float], "PasarelaLLM"] = {}
+
+
+def _estado(modelo: str) -> _EstadoModelo:
+    with _candado:
+        if modelo not in _estados:
+            _estados[modelo] = _EstadoModelo(*_leer_limites().get(modelo, LIMITES_DESCONOCIDO))
+        return _estados[modelo]
+
+
+class PasarelaLLM(Runnable[LanguageModelInput, BaseMessage]):
+    """
+    Punto único de acceso al LLM para los agentes: se usa como el ChatModel al que sustituye.
+
+    - Respeta los presupuestos de peticiones y tokens por minuto de cada modelo, compartidos por todo
+      el proceso, atendiendo las peticiones en orden de llegada.
+    - Reintenta los errores transitorios (429, 5xx, timeouts) con espera exponencial con jitter, o la
+      que indique la cabecera Retry-After.
+    - Envía las llamadas al modelo de respaldo mientras el p95 de latencia del principal supera el SLO,
+      tras un 429 del principal o si su cola es más larga que `espera_maxima`.
+    - Dentro del plazo de la petición (model/plazos.py): no reserva turno ni reintenta si ya no llegaría
+      a tiempo, y una llamada cancelada devuelve al presupuesto lo que no ha gastado.
+    """
+
+    def __init__(
+        self,
+        modelo: str,
+        temperatura: float,
+        respaldo: Optional[str] = None,
+        slo_p95: Optional[float] = None,
+        max_intentos: Optional[int] = None,
+        espera_maxima: Optional[float] = None,
+        tokens_salida: Optional[int] = None,
+        ventana_latencia: float = 300.0,
+    ):
+        """
+        Args:
+            modelo (str): Modelo principal.
+            temperatura (float): Temperatura de muestreo, igual en el principal y en el respaldo.
+            respaldo (str): Modelo más rápido al que desviar las llamadas (LLM_RESPALDO, por defecto
+                llama-3.1-8b-instant; vacío lo desactiva).
+            slo_p95 (float): Segundos de p95 del principal a partir de los que se desvía (LLM_SLO_P95, por defecto 20).
+            max_intentos (int): Intentos por llamada, contando el primero (LLM_INTENTOS, por defecto 4).
+            espera_maxima (float): Segundos de cola en el principal a partir de los que se prefiere el
+                respaldo si su cola es más corta (LLM_ESPERA_MAXIMA, por defecto 10).
+            tokens_salida (int): Tokens de respuesta que se reservan por llamada antes de conocer los
+                reales (LLM_TOKENS_SALIDA, por defecto 600).
+            ventana_latencia (float): Segundos de historia con los que se calcula el p95.
+        """
+        self.modelo = modelo
+        self.temperatura = temperatura
+        respaldo = respaldo if respaldo is not None else os.getenv("LLM_RESPALDO", "llama-3.1-8b-instant")
+        self.respaldo = respaldo if respaldo and respaldo != modelo else None
+        self.slo_p95 = slo_p95 or float(os.getenv("LLM_SLO_P95", "20"))
+        self.max_intentos = max_intentos or int(os.getenv("LLM_INTENTOS", "4"))
+        self.espera_maxima = espera_maxima if espera_maxima is not None else float(os.getenv("LLM_ESPERA_MAXIMA", "10"))
+        self.tokens_salida = tokens_salida or int(os.getenv("LLM_TOKENS_SALIDA", "600"))
+        self.ventana_latencia = ventana_latencia
+
+    def _elegir(self, tokens: float, evitar: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Devuelve el modelo al que enviar la llamada y, si no es el principal, el motivo del desvío.
+        """
+        if self.respaldo is None:
+            return self.modelo, None
+        principal = _estado(self.modelo)
+        if evitar == self.modelo or principal.saturado_hasta > time.monotonic():
+            return self.respaldo, "limite"
+        p95 = principal.p95(self.ventana_latencia)
+        if p95 is not None and p95 > self.slo_p95:
+            return self.respaldo, "slo"
+        espera = principal.espera(tokens)
+        if espera > acotar(self.espera_maxima) and _estado(self.respaldo).espera(tokens) < espera:
+            return self.respaldo, "cola"
+        return self.modelo, None
+
+    def _preparar(self, entrada: Any, evitar: Optional[str]) -> Tuple[str, float, float]:
+        tokens = contar_tokens(_texto(entrada)) + self.tokens_salida
+        modelo, motivo = self._elegir(tokens, evitar)
+        queda = restante()
+        # Sin tiempo para esperar turno no se reserva nada: el presupuesto queda para quien sí lo tiene
+        if queda is not None and _estado(modelo).espera(tokens) >= queda:
+            _estado(self.modelo).contadores["sin_plazo"] += 1
+            raise PlazoAgotado(f"No queda plazo para esperar turno en {modelo}")
+        if motivo is not None:
+            _estado(self.modelo).contadores[f"desvios_{motivo}"] += 1
+        return modelo, tokens, _estado(modelo).reservar(tokens)
+
+    def _cancelada(self, modelo: str, tokens: float, enviada: bool) -> None:
+        # Una llamada cancelada devuelve lo que no ha llegado a gastar: todo si aún esperaba turno y,
+        # si ya se había enviado, los tokens de salida que el proveedor no llegará a generar
+        estado = _estado(modelo)
+        with estado.candado:
+            if enviada:
+                estado.tokens.devolver(min(tokens, self.tokens_salida))
+            else:
+                estado.peticiones.devolver(1)
+                estado.tokens.devolver(tokens)
+
+    def _registrar(self, modelo: str, tokens: float, inicio: float, respuesta: BaseMessage) -> None:
+        estado = _estado(modelo)
+        uso = getattr(respuesta, "usage_metadata", None) or {}
+        with estado.candado:
+            estado.contadores["llamadas"] += 1
+            if "total_tokens" not in uso:
+                # Respuesta servida desde la caché del LLM: no ha gastado presupuesto ni dice nada de la latencia
+                estado.peticiones.devolver(1)
+                estado.tokens.devolver(tokens)
+                return
+            estado.tokens.devolver(tokens - uso["total_tokens"])
+            estado.latencias.append((time.monotonic(), time.monotonic() - inicio))
+
+    def _fallo(self, modelo: str, tokens: float, intento: int, error: BaseException) -> Optional[float]:
+        """
+        Anota un error y devuelve cuánto esperar antes del siguiente intento, o None si no hay que reintentar.
+        """
+        estado = _estado(modelo)
+        reintentar = es_reintentable(error) and intento + 1 < self.max_intentos
+        espera = 0.0
+        if reintentar:
+            espera = min(30.0, 0.5 * 2 ** intento) * random.uniform(0.5, 1.0)
+            espera = max(espera, _retry_after(error) or 0.0)
+            if getattr(error, "status_code", None) == 429:
+                estado.saturado_hasta = time.monotonic() + espera
+            queda = restante()
+            if queda is not None and espera >= queda:
+                # El siguiente intento llegaría cuando la petición ya ha vencido: se devuelve el error ya
+                _estado(self.modelo).contadores["sin_plazo"] += 1
+                reintentar = False
+        with estado.candado:
+            # Una llamada rechazada no ha consumido tokens
+            estado.tokens.devolver(tokens)
+            estado.contadores["reintentos" if reintentar else "errores"] += 1
+        if not reintentar:
+            return None
+        print(f"Error transitorio de {modelo} ({error}); nuevo intento en {espera:.1f} s")
+        return espera
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        evitar = None
+        for intento in range(self.max_intentos):
+            modelo, tokens, espera = self._preparar(input, evitar)
+            if espera:
+                time.sleep(espera)
+            inicio = time.monotonic()
+            try:
+                respuesta = obtener_llm(modelo, self.temperatura).invoke(input, config, **kwargs)
+            except Exception as e:
+                pausa = self._fallo(modelo, tokens, intento, e)
+                if pausa is None:
+                    raise
+                evitar = modelo
+                time.sleep(pausa)
+                continue
+            self._registrar(modelo, tokens, inicio, respuesta)
+            return respuesta
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        evitar = None
+        for intento in range(self.max_intentos):
+            modelo, tokens, espera = self._preparar(input, evitar)
+            enviada = False
+            try:
+                if espera:
+                    await asyncio.sleep(espera)
+                inicio = time.monotonic()
+                enviada = True
+                respuesta = await obtener_llm(modelo, self.temperatura).ainvoke(input, config, **kwargs)
+            except asyncio.CancelledError:
+                self._cancelada(modelo, tokens, enviada)
+                raise
+            except Exception as e:
+                pausa = self._fallo(modelo, tokens, intento, e)
+                if pausa is None:
+                    raise
+                evitar = modelo
+                await asyncio.sleep(pausa)
+                continue
+            self._registrar(modelo, tokens, inicio, respuesta)
+            return respuesta
+
+
+def obtener_pasarela(modelo: str, temperatura: float) -> PasarelaLLM:
+    """
+    Devuelve la pasarela compartida del modelo y la temperatura indicados.
+    """
+    clave = (modelo, float(temperatura))
+    with _candado:
+        if clave not in _pasarelas:
+            _pasarelas[clave] = PasarelaLLM(modelo, temperatura)
+        return _pasarelas[clave]
+
+
+def estadisticas_pasarela() -> Dict[str, dict]:
+    """
+    Llamadas, reintentos, errores, desvíos al respaldo por motivo, espera acumulada en cola y p95 de cada modelo.
+    """
+    with _candado:
+        estados = dict(_estados)
+    return {
+        modelo: {**estado.contadores, "espera_total_s": round(estado.contadores["espera_total_s"], 2),
+                 "p95_s": estado.p95(300.0)}
+        for modelo, estado in estados.items()
+    }
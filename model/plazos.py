@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple, Union
+
+# Presupuesto por defecto (en segundos) de cada nodo del grafo, configurable con PLAZO_<NODO>. El
+# plazo efectivo de un nodo es el menor entre su presupuesto y lo que le quede a la petición.
+PLAZOS_POR_DEFECTO = {
+    "extraer_ticker": 10.0,
+    "obtener_datos_financieros": 15.0,
+    "analizar_datos": 25.0,
+    "obtener_noticias": 8.0,
+    "analista_financiero": 30.0,
+}
+
+class PlazoCompartido:
+    """
+    Plazo de un trabajo que esperan varias peticiones (ver model/coalescencia.py): vence con la última
+    de ellas, y no tiene plazo si alguna no lo tiene.
+    """
+
+    __slots__ = ("vencimiento",)
+
+    def __init__(self, vencimiento: Optional[float]):
+        self.vencimiento = vencimiento
+
+    def ampliar(self, vencimiento: Optional[float]) -> None:
+        if self.vencimiento is not None:
+            self.vencimiento = None if vencimiento is None else max(self.vencimiento, vencimiento)
+
+
+# Instante (time.monotonic) en que vence la petición en curso, o None si no tiene plazo. Pasa a las
+# tareas que crea la petición y a los hilos de model/concurrencia.py con el resto del contexto.
+_vencimiento: contextvars.ContextVar[Union[float, PlazoCompartido, None]] = contextvars.ContextVar("vencimiento", default=None)
+# Vencimiento de la petición entera (el del plazo más externo), sin el recorte de presupuesto de cada nodo
+_vencimiento_peticion: contextvars.ContextVar[Union[float, PlazoCompartido, None]] = contextvars.ContextVar(
+    "vencimiento_peticion", default=None
+)
+
+_candado = threading.Lock()
+_por_nodo: Dict[str, Dict[str, int]] = {}
+
+
+class PlazoAgotado(TimeoutError):
+    """
+    La petición se ha quedado sin tiempo antes de empezar (o de terminar) una operación.
+    """
+
+
+def vencimiento_actual() -> Optional[float]:
+    """
+    Instante (time.monotonic) en que vence la petición en curso, o None si no tiene plazo.
+    """
+    actual = _vencimiento.get()
+    return actual.vencimiento if isinstance(actual, PlazoCompartido) else actual
+
+
+def restante() -> Optional[float]:
+    """
+    Segundos que le quedan a la petición en curso (0 si ya ha vencido), o None si no tiene plazo.
+    """
+    vencimiento = vencimiento_actual()
+    if vencimiento is None:
+        return None
+    return max(0.0, vencimiento - time.monotonic())
+
+
+def acotar(segundos: float) -> float:
+    """
+    Devuelve `segundos` o lo que le quede a la petición, lo que sea menor.
+    """
+    queda = restante()
+    return segundos if queda is None else min(segundos, queda)
+
+
+def comprobar(operacion: str = "") -> None:
+    """
+    Lanza PlazoAgotado si la petición en curso ya ha vencido. Para llamarla antes de empezar un trabajo
+    bloqueante que ya nadie va a esperar.
+    """
+    if restante() == 0.0:
+        raise PlazoAgotado(f"Plazo agotado antes de {operacion or 'la operación'}")
+
+
+@contextmanager
+def plazo(segundos: float, peticion: bool = True):
+    """
+    Fija el plazo de la petición durante el bloque. Si ya había uno más corto, se mantiene ese. Con
+    `peticion=False` (el presupuesto de un nodo) no cuenta como plazo de la petición entera.
+    """
+    vencimiento = time.monotonic() + segundos
+    actual = vencimiento_actual()
+    token = _vencimiento.set(vencimiento if actual is None else min(actual, vencimiento))
+    token_peticion = None
+    if peticion and _vencimiento_peticion.get() is None:
+        token_peticion = _vencimiento_peticion.set(vencimiento)
+    try:
+        yield
+    finally:
+        if token_peticion is not None:
+            _vencimiento_peticion.reset(token_peticion)
+        _vencimiento.reset(token)
+
+
+@contextmanager
+def plazo_peticion():
+    """
+    Dentro del bloque rige el plazo de la petición entera en lugar del presupuesto del nodo en curso.
+    Para las tareas que un nodo lanza en beneficio de nodos posteriores, que heredan el contexto al crearse.
+    """
+    token = _vencimiento.set(_vencimiento_peticion.get())
+    try:
+        yield
+    finally:
+        _vencimiento.reset(token)
+
+
+def contexto_compartido() -> Tuple[contextvars.Context, PlazoCompartido]:
+    """
+    Contexto para una tarea que comparten varias peticiones: una copia del actual cuyo plazo empieza
+    siendo el de esta petición y se amplía con `PlazoCompartido.ampliar` al sumarse otras.
+    """
+    compartido = PlazoCompartido(vencimiento_actual())
+    contexto = contextvars.copy_context()
+    contexto.run(_vencimiento.set, compartido)
+    contexto.run(_vencimiento_peticion.set, compartido)
+    return contexto, compartido
+
+
+def presupuesto(nodo: str) -> float:
+    """
+    Presupuesto en segundos de un nodo del grafo, configurable con PLAZO_<NODO>.
+    """
+    return float(os.getenv(f"PLAZO_{nodo.upper()}", str(PLAZOS_POR_DEFECTO.get(nodo, 30.0))))
+
+
+def plazo_reporte() -> float:
+    """
+    Plazo total de un reporte en segundos (PLAZO_REPORTE, por defecto 45).
+    """
+    return float(os.getenv("PLAZO_REPORTE", "45"))
+
+
+def _contar(nodo: str, resultado: str) -> None:
+    with _candado:
+        contadores = _por_nodo.setdefault(nodo, {"agotados": 0, "parciales": 0})
+        contadores[resultado] += 1
+
+
+def limitar_nodo(nombre: str, funcion: Callable, respaldo: Optional[Callable[[dict], dict]] = None) -> Callable:
+    """
+    Envuelve un nodo asíncrono del grafo para que se cancele al agotar su presupuesto o el plazo de la
+    petición. Si el nodo no es imprescindible, `respaldo(estado)` da la actualización con la que sigue
+    el grafo (un reporte parcial); si no, el TimeoutError llega a quien ejecuta el grafo. Los nodos
+    síncronos no se pueden cancelar y se devuelven sin cambios.
+    """
+    if not inspect.iscoroutinefunction(funcion):
+        return funcion
+
+    @functools.wraps(funcion)
+    async def nodo(estado, *args, **kwargs):
+        segundos = acotar(presupuesto(nombre))
+        try:
+            with plazo(segundos, peticion=False):
+                async with asyncio.timeout(segundos):
+                    return await funcion(estado, *args, **kwargs)
+        except TimeoutError:
+            _contar(nombre, "agotados")
+            # Si lo que ha vencido es la petición entera, no tiene sentido seguir con un reporte parcial
+            if respaldo is None or restante() == 0.0:
+                raise
+            print(f"{nombre} superó su plazo de {segundos:.1f} s; se continúa sin su resultado")
+            _contar(nombre, "parciales")
+            return respaldo(estado)
+    return nodo
+
+
+def estadisticas() -> dict:
+    """
+    Veces que cada nodo ha agotado su plazo y cuántas de ellas el reporte siguió como parcial.
+    """
+    with _candado:
+        return {nodo: dict(contadores) for nodo, contadores in _por_nodo.items()}
@@ -0,0 +1,146 @@
+import base64
+import math
+import os
+import re
+import threading
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+# tiktoken carga el tokenizador de Llama 3 desde un fichero local; si falta, se estiman los tokens
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Caracteres por token en la estimación sin tokenizador (texto en español e inglés mezclado)
+CARACTERES_POR_TOKEN = 3.5
+
+# Vocabulario BPE de Llama 3 (el `original/tokenizer.model` de los pesos), el de los modelos que sirve Groq
+RUTA_TOKENIZADOR = os.getenv(
+    "PROMPT_TOKENIZADOR", os.path.join(os.path.dirname(__file__), "datos", "llama3_tokenizer.model")
+)
+
+# Expresión con la que Llama 3 trocea el texto antes de aplicar el BPE
+PATRON_LLAMA3 = (
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+
+_candado = threading.Lock()
+_codificador = None
+_codificador_cargado = False
+
+
+def _cargar_codificador(ruta: str):
+    # Cada línea del fichero es "<token en base64> <rango>", el formato de tiktoken
+    with open(ruta, "rb") as f:
+        rangos = {
+            base64.b64decode(token): int(rango)
+            for token, rango in (linea.split() for linea in f if linea.strip())
+        }
+    return tiktoken.Encoding(name="llama3", pat_str=PATRON_LLAMA3, mergeable_ranks=rangos, special_tokens={})
+
+
+def _obtener_codificador():
+    global _codificador, _codificador_cargado
+    if not _codificador_cargado:
+        with _candado:
+            if not _codificador_cargado:
+                if tiktoken is None:
+                    print("tiktoken no está instalado: los tokens de los prompts se estimarán por caracteres")
+                else:
+                    try:
+                        _codificador = _cargar_codificador(RUTA_TOKENIZADOR)
+                    except Exception as e:
+                        print(f"No se pudo cargar el tokenizador de {RUTA_TOKENIZADOR}, se estimarán los tokens: {e}")
+                _codificador_cargado = True
+    return _codificador
+
+
+def contar_tokens(texto: str) -> int:
+    """
+    Cuenta los tokens de un texto con el tokenizador de Llama 3 o, si no está disponible, los estima.
+    """
+    codificador = _obtener_codificador()
+    if codificador is not None:
+        return len(codificador.encode(texto, disallowed_special=()))
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def compactar(texto: str) -> str:
+    """
+    Quita la sangría y los espacios repetidos de un texto, y deja como mucho una línea en blanco seguida.
+    """
+    lineas = [re.sub(r"[ \t]+", " ", linea).strip() for linea in texto.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lineas))
+
+
+def _recortar(texto: str, max_tokens: int) -> str:
+    # Búsqueda binaria del prefijo, cortado en un espacio, que cabe en el presupuesto
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    bajo, alto = 0, len(texto)
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if contar_tokens(texto[:medio]) + 1 <= max_tokens:
+            bajo = medio
+        else:
+            alto = medio - 1
+    corte = texto[:bajo].rsplit(" ", 1)[0] if " " in texto[:bajo] else texto[:bajo]
+    return corte.rstrip(" ,.;:") + "…"
+
+
+def _puntuar(noticia: List[str], terminos: List[str]) -> int:
+    titulo = noticia[0].lower()
+    cuerpo = " ".join(noticia[1:2]).lower()
+    return sum(2 * (t in titulo) + (t in cuerpo) for t in terminos)
+
+
+def ajustar_noticias(noticias: str, max_tokens: int, terminos: Optional[List[str]] = None) -> str:
+    """
+    Reduce las noticias de `ServicioNoticias` a un presupuesto de tokens.
+
+    Cada noticia queda en una línea con su título, su resumen y el dominio de la fuente (sin la URL
+    completa). Si no caben todas, entran primero las que mencionan más veces los `terminos` (ticker,
+    nombre de la empresa) en el título o el resumen, sin cambiar el orden de relevancia entre las
+    empatadas, y la última que entra se recorta.
+    """
+    bloques = [b.strip().splitlines() for b in noticias.strip().split("\n\n") if b.strip()]
+    # Mensajes sueltos ("No se encontraron noticias...", errores) pasan tal cual
+    if not bloques or any(len(b) < 2 for b in bloques):
+        return _recortar(compactar(noticias), max_tokens)
+
+    terminos = [t.lower() for t in (terminos or []) if t]
+    orden = sorted(range(len(bloques)), key=lambda i: -_puntuar(bloques[i], terminos))
+    elegidas, usados = {}, 0
+    for i in orden:
+        titulo, cuerpo = bloques[i][0], " ".join(bloques[i][1:-1]) or bloques[i][1]
+        fuente = urlsplit(bloques[i][-1]).netloc.removeprefix("www.") if len(bloques[i]) > 2 else ""
+        linea = f"- {titulo}: {cuerpo}" + (f" ({fuente})" if fuente else "")
+        tokens = contar_tokens(linea) + 1
+        if usados + tokens > max_tokens:
+            restantes = max_tokens - usados
+            # Una noticia recortada solo merece la pena si aún cabe algo más que el título
+            if restantes > contar_tokens(titulo) + 20:
+                elegidas[i] = _recortar(linea, restantes - 1)
+            break
+        elegidas[i] = linea
+        usados += tokens
+    # En el prompt vuelven a su orden original
+    return "\n".join(elegidas[i] for i in sorted(elegidas))
+
+
+def rellenar_con_presupuesto(plantilla: str, max_tokens: int, noticias: str, terminos: List[str], **valores: str) -> str:
+    """
+    Rellena la parte variable de un prompt sin pasar de `max_tokens`: los demás valores entran
+    compactados y enteros, y las noticias se ajustan a los tokens que queden.
+
+    Args:
+        plantilla (str): Texto con las variables entre llaves, entre ellas `{noticias}`.
+        max_tokens (int): Presupuesto de tokens del texto relleno.
+        noticias (str): Noticias tal y como las devuelve `ServicioNoticias`.
+        terminos (list): Ticker y nombre de la empresa, para priorizar las noticias que los mencionan.
+        **valores: Resto de variables de la plantilla.
+    """
+    valores = {clave: compactar(str(valor)) for clave, valor in valores.items()}
+    disponibles = max(0, max_tokens - contar_tokens(plantilla.format(noticias="", **valores)))
+    return plantilla.format(noticias=ajustar_noticias(noticias, disponibles, terminos), **valores)
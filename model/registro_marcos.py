@@ -0,0 +1,103 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from model.ohlcv import normalizar_ohlcv
+
+
+class RegistroMarcos:
+    """
+    Guarda fuera del estado del grafo los DataFrame de precios de cada reporte. El estado solo lleva
+    una referencia (una cadena corta), así los nodos no copian ni imprimen las barras.
+
+    Las mismas barras de un ticker (mismo tamaño, mismas fechas extremas y misma última barra) comparten
+    referencia, y las referencias más antiguas se olvidan al superar `max_entradas`; si un reporte en
+    curso pide una de ellas, sus barras se vuelven a cargar con `recargar`.
+    """
+
+    def __init__(self, max_entradas: Optional[int] = None, recargar: Optional[Callable[[str], pd.DataFrame]] = None):
+        """
+        Args:
+            max_entradas (int): Marcos que se conservan (MARCOS_MAX_ENTRADAS, por defecto 256).
+            recargar (Callable): Devuelve las barras de un ticker (p. ej. `AlmacenPrecios.obtener`), para
+                las referencias ya olvidadas.
+        """
+        self.max_entradas = max_entradas or int(os.getenv("MARCOS_MAX_ENTRADAS", "256"))
+        self.recargar = recargar
+        self._marcos: "OrderedDict[str, tuple]" = OrderedDict()  # referencia -> (firma, marco)
+        self._por_contenido: Dict[tuple, str] = {}  # (ticker, filas, fechas, última barra) -> referencia
+        self._candado = threading.Lock()
+
+    def guardar(self, ticker: str, df: pd.DataFrame) -> str:
+        """
+        Registra las barras de un ticker y devuelve su referencia.
+        """
+        # La última barra entra en la firma: durante la sesión cambia sin que cambien las fechas
+        firma = (
+            ticker.strip().upper(),
+            len(df),
+            df.index[0] if len(df) else None,
+            df.index[-1] if len(df) else None,
+            df.iloc[-1].to_numpy().tobytes() if len(df) else None,
+        )
+        with self._candado:
+            referencia = self._por_contenido.get(firma)
+            if referencia is not None and referencia in self._marcos:
+                self._marcos.move_to_end(referencia)
+                return referencia
+
+        # Barras canónicas (precios en float32, de solo lectura): si ya lo son, no se copian
+        marco = normalizar_ohlcv(df)
+        referencia = f"{firma[0]}:{uuid.uuid4().hex[:12]}"
+        self._registrar(referencia, firma, marco)
+        return referencia
+
+    def _registrar(self, referencia: str, firma: tuple, marco: pd.DataFrame) -> None:
+        with self._candado:
+            self._marcos[referencia] = (firma, marco)
+            self._por_contenido[firma] = referencia
+            while len(self._marcos) > self.max_entradas:
+                expulsada, (firma_expulsada, _) = self._marcos.popitem(last=False)
+                if self._por_contenido.get(firma_expulsada) == expulsada:
+                    del self._por_contenido[firma_expulsada]
+
+    def obtener(self, referencia: Optional[str]) -> pd.DataFrame:
+        """
+        Devuelve las barras de una referencia, o un DataFrame vacío si no hay referencia (el reporte no
+        llegó a tener barras). Si la referencia ya se olvidó, las vuelve a cargar con `recargar`.
+
+        Raises:
+            KeyError: Si la referencia se olvidó y no se pueden volver a cargar sus barras.
+        """
+        if not referencia:
+            return pd.DataFrame()
+        with self._candado:
+            entrada = self._marcos.get(referencia)
+            if entrada is not None:
+                self._marcos.move_to_end(referencia)
+                return entrada[1]
+
+        ticker = referencia.split(":", 1)[0]
+        if self.recargar is None:
+            raise KeyError(f"Las barras de {referencia} ya no están en el registro")
+        print(f"Las barras de {referencia} ya no estaban en el registro; se vuelven a cargar")
+        try:
+            marco = normalizar_ohlcv(self.recargar(ticker))
+        except Exception as e:
+            raise KeyError(f"Las barras de {referencia} ya no están en el registro y no se pudieron recargar: {e}") from e
+        if marco.empty:
+            raise KeyError(f"Las barras de {referencia} ya no están en el registro y {ticker} no tiene datos")
+        # Con la misma referencia, para que los demás nodos del reporte no vuelvan a cargarlas
+        self._registrar(referencia, (ticker, None, None, None, referencia), marco)
+        return marco
+
+    def estadisticas(self) -> dict:
+        with self._candado:
+            return {
+                "entradas": len(self._marcos),
+                "bytes": int(sum(m.memory_usage(index=True).sum() for _, m in self._marcos.values())),
+            }
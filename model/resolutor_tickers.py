@@ -0,0 +1,302 @@
+import csv
+import os
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+RUTA_LISTADO = os.path.join(os.path.dirname(__file__), "datos", "tickers.csv")
+
+# Confianza mínima para responder sin consultar al LLM
+UMBRAL_CONFIANZA = float(os.getenv("RESOLUTOR_UMBRAL", "0.8"))
+
+# Símbolos tal y como los usa Yahoo Finance: AAPL, BRK-B, SAN.MC, ^GSPC, BTC-USD, EURUSD=X
+PATRON_TICKER = re.compile(r"\^?[A-Z0-9]{1,6}(?:[.-][A-Z0-9]{1,4})?(?:=[XF])?")
+
+# Sufijos societarios que no forman parte del nombre con el que se busca una empresa
+SUFIJOS_SOCIETARIOS = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "plc", "p.l.c",
+    "s.a", "sa", "n.v", "nv", "ag", "se", "a/s", "holdings", "holding", "group", "the",
+}
+
+# Palabras de relleno de las consultas (ya normalizadas, sin tildes)
+PALABRAS_VACIAS = {
+    "de", "del", "la", "las", "el", "los", "un", "una", "unos", "unas", "y", "o", "en", "para", "por",
+    "con", "sobre", "que", "como", "cual", "cuales", "me", "mi", "dame", "quiero", "hazme", "haz",
+    "genera", "generar", "reporte", "informe", "analisis", "analiza", "analizar", "accion", "acciones",
+    "fondo", "fondos", "empresa", "compania", "precio", "precios", "cotizacion", "invertir", "inversion",
+    "comprar", "vender", "deberia", "es", "esta", "va", "hoy", "ahora", "noticias", "al", "lo", "se",
+    "su", "sus", "mercado", "bolsa", "bueno", "buena", "opinion", "tendencia", "the", "of", "and", "a",
+    "an", "for", "on", "in", "stock", "stocks", "share", "shares", "report", "analysis", "price",
+    "about", "is", "should", "i", "buy", "sell", "fund", "news", "what", "how", "today",
+}
+
+# Nombres y alias del listado que también son palabras corrientes ("mi meta es...", "la visa de
+# estudiante"). Solo se resuelven sin el LLM si la consulta los escribe como nombre propio o símbolo.
+PALABRAS_COMUNES = {
+    "meta", "target", "visa", "nu", "shell", "chase", "zoom", "ups", "sap", "dow", "oracle", "plata",
+    "ether", "coke",
+}
+
+# Confianza de una palabra corriente sin contexto de empresa: por debajo del umbral, para que decida el LLM
+CONFIANZA_AMBIGUA = 0.6
+
+# Palabras tras las que un símbolo corto o corriente ("de T", "acciones de GE", "analiza O") es un ticker
+PALABRAS_ANTES_DE_TICKER = {
+    "de", "del", "sobre", "ticker", "simbolo", "accion", "acciones", "analiza", "analizar", "reporte",
+    "informe", "cotizacion", "precio", "of", "on", "for", "about", "stock",
+}
+
+
+class Resolucion(NamedTuple):
+    ticker: str
+    nombre: str
+    confianza: float
+    metodo: str  # "ticker", "exacto", "prefijo" o "difuso"
+
+
+def normalizar(texto: str) -> str:
+    """
+    Pasa a minúsculas, quita tildes y deja solo los caracteres que aparecen en nombres de empresas.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace("'", "").replace("’", "")
+    texto = re.sub(r"[^a-z0-9&.^/-]+", " ", texto)
+    return " ".join(t.strip(".-") for t in texto.split() if t.strip(".-"))
+
+
+def _trigramas(texto: str) -> Counter:
+    relleno = f"  {texto} "
+    return Counter(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+class _NodoTrie:
+    __slots__ = ("hijos", "tickers")
+
+    def __init__(self):
+        self.hijos: Dict[str, "_NodoTrie"] = {}
+        self.tickers: Set[str] = set()
+
+
+class IndiceSimbolos:
+    """
+    Índice local de símbolos bursátiles con búsqueda exacta, por prefijo (trie) y difusa (trigramas)
+    sobre nombres, tickers y alias.
+    """
+
+    def __init__(self, filas: Iterable[Tuple[str, str, List[str]]]):
+        """
+        Args:
+            filas: Tuplas (ticker, nombre, alias) del listado.
+        """
+        self._nombres: Dict[str, str] = {}
+        self._exactos: Dict[str, str] = {}
+        self._raiz = _NodoTrie()
+        self._claves: List[Tuple[str, str, Counter]] = []
+        self._por_trigrama: Dict[str, List[int]] = {}
+
+        for ticker, nombre, alias in filas:
+            ticker = ticker.strip().upper()
+            self._nombres[ticker] = nombre
+            nombre_norm = normalizar(nombre)
+            sin_sufijos = " ".join(t for t in nombre_norm.split() if t not in SUFIJOS_SOCIETARIOS)
+            for clave in {nombre_norm, sin_sufijos, *(normalizar(a) for a in alias)}:
+                if clave:
+                    self._agregar_clave(clave, ticker)
+
+    @classmethod
+    def desde_csv(cls, ruta: str = RUTA_LISTADO) -> "IndiceSimbolos":
+        """
+        Carga el índice desde un CSV con columnas ticker, nombre y alias (separados por '|').
+        """
+        with open(ruta, encoding="utf-8", newline="") as f:
+            filas = [
+                (fila["ticker"], fila["nombre"], [a for a in (fila.get("alias") or "").split("|") if a])
+                for fila in csv.DictReader(f)
+            ]
+        return cls(filas)
+
+    def _agregar_clave(self, clave: str, ticker: str) -> None:
+        self._exactos.setdefault(clave, ticker)
+
+        nodo = self._raiz
+        for caracter in clave:
+            nodo = nodo.hijos.setdefault(caracter, _NodoTrie())
+            nodo.tickers.add(ticker)
+
+        indice = len(self._claves)
+        trigramas = _trigramas(clave)
+        self._claves.append((clave, ticker, trigramas))
+        for trigrama in trigramas:
+            self._por_trigrama.setdefault(trigrama, []).append(indice)
+
+    def es_ticker(self, simbolo: str) -> bool:
+        return simbolo.upper() in self._nombres
+
+    def nombre(self, ticker: str) -> Optional[str]:
+        return self._nombres.get(ticker.upper())
+
+    def buscar_exacto(self, texto: str) -> Optional[str]:
+        return self._exactos.get(normalizar(texto))
+
+    def buscar_prefijo(self, prefijo: str) -> Set[str]:
+        nodo = self._raiz
+        for caracter in normalizar(prefijo):
+            nodo = nodo.hijos.get(caracter)
+            if nodo is None:
+                return set()
+        return nodo.tickers
+
+    def buscar_difuso(self, texto: str) -> Optional[Tuple[str, float]]:
+        """
+        Devuelve el ticker cuya clave es más parecida al texto y su coeficiente de Dice sobre trigramas.
+        """
+        trigramas = _trigramas(normalizar(texto))
+        comunes: Counter = Counter()
+        for trigrama, veces in trigramas.items():
+            for indice in self._por_trigrama.get(trigrama, ()):
+                comunes[indice] += min(veces, self._claves[indice][2][trigrama])
+        if not comunes:
+            return None
+        total = sum(trigramas.values())
+        mejor_indice, mejor_puntuacion = None, 0.0
+        for indice, compartidos in comunes.items():
+            puntuacion = 2 * compartidos / (total + sum(self._claves[indice][2].values()))
+            if puntuacion > mejor_puntuacion:
+                mejor_indice, mejor_puntuacion = indice, puntuacion
+        return self._claves[mejor_indice][1], mejor_puntuacion
+
+    def resolver(self, consulta: str) -> Optional[Resolucion]:
+        """
+        Busca la empresa o el símbolo mencionado en una consulta en lenguaje natural.
+
+        Args:
+            consulta (str): Consulta del usuario, por ejemplo "Dame un reporte de Google".
+
+        Returns:
+            Resolucion | None: Mejor candidato con su confianza (entre 0 y 1), o None si no hay ninguno.
+        """
+        # 1. Un ticker escrito tal cual: en mayúsculas dentro de una frase, o como consulta única. Los
+        # símbolos de una o dos letras o que son palabras ("O", "T", "DE", "MA") necesitan además contexto
+        originales = [f.strip(".,;:!?¿¡()\"'") for f in consulta.split()]
+        originales = [f for f in originales if f.lstrip("$")]
+        fichas = [f.lstrip("$") for f in originales]
+        mejor: Optional[Resolucion] = None
+        for posicion, ficha in enumerate(fichas):
+            if not (ficha.isupper() or len(fichas) == 1) or ficha.upper() not in self._nombres:
+                continue
+            simbolo = ficha.upper()
+            if not self._simbolo_ambiguo(simbolo) or self._como_simbolo(posicion, originales):
+                return Resolucion(simbolo, self._nombres[simbolo], 1.0, "ticker")
+            if mejor is None:
+                mejor = Resolucion(simbolo, self._nombres[simbolo], CONFIANZA_AMBIGUA, "ticker")
+
+        palabras = normalizar(consulta).split()
+        tramos = [
+            (i, n, " ".join(palabras[i:i + n]))
+            for n in range(min(5, len(palabras)), 0, -1)
+            for i in range(len(palabras) - n + 1)
+        ]
+
+        # 2. Nombre o alias exacto, empezando por los tramos más largos. Una palabra corriente sin
+        # contexto de empresa queda como candidata de baja confianza y se sigue buscando
+        for _, _, tramo in tramos:
+            ticker = self._exactos.get(tramo)
+            if ticker is None:
+                continue
+            if tramo not in PALABRAS_COMUNES or self._como_nombre_propio(tramo, originales):
+                return Resolucion(ticker, self._nombres[ticker], 1.0, "exacto")
+            if mejor is None:
+                mejor = Resolucion(ticker, self._nombres[ticker], CONFIANZA_AMBIGUA, "exacto")
+
+        # 3. Prefijo inequívoco y 4. coincidencia difusa, ignorando tramos con palabras vacías o
+        # corrientes en los bordes (la búsqueda difusa de "meta" daría la clave "meta" con 1.0)
+        for i, n, tramo in tramos:
+            if palabras[i] in PALABRAS_VACIAS or palabras[i + n - 1] in PALABRAS_VACIAS or len(tramo) < 4:
+                continue
+            if n == 1 and tramo in PALABRAS_COMUNES:
+                continue
+            candidatos = self.buscar_prefijo(tramo)
+            if len(candidatos) == 1:
+                ticker = next(iter(candidatos))
+                confianza = 0.85 if len(tramo) >= 5 else 0.75
+                if mejor is None or confianza > mejor.confianza:
+                    mejor = Resolucion(ticker, self._nombres[ticker], confianza, "prefijo")
+            difuso = self.buscar_difuso(tramo)
+            if difuso is not None and (mejor is None or difuso[1] > mejor.confianza):
+                mejor = Resolucion(difuso[0], self._nombres[difuso[0]], difuso[1], "difuso")
+        return mejor
+
+    @staticmethod
+    def _simbolo_ambiguo(simbolo: str) -> bool:
+        clave = simbolo.lower()
+        return len(simbolo) <= 2 or clave in PALABRAS_VACIAS or clave in PALABRAS_COMUNES
+
+    @staticmethod
+    def _como_simbolo(posicion: int, originales: List[str]) -> bool:
+        """
+        Indica si un símbolo corto o corriente se usa como ticker: es la consulta entera, lleva '$'
+        delante o lo precede una palabra como "de", "acciones" o "analiza".
+        """
+        if len(originales) == 1 or originales[posicion].startswith("$"):
+            return True
+        return posicion > 0 and normalizar(originales[posicion - 1]) in PALABRAS_ANTES_DE_TICKER
+
+    @staticmethod
+    def _como_nombre_propio(palabra: str, originales: List[str]) -> bool:
+        """
+        Indica si la consulta escribe una palabra corriente como empresa: es la consulta entera, lleva
+        '$' delante, va toda en mayúsculas o empieza por mayúscula sin estar al principio de la frase.
+        """
+        if len(originales) == 1:
+            return True
+        for posicion, original in enumerate(originales):
+            ficha = original.lstrip("$")
+            if normalizar(ficha) != palabra:
+                continue
+            if original.startswith("$") or ficha.isupper() or (posicion > 0 and ficha[0].isupper()):
+                return True
+        return False
+
+    def validar(self, salida_llm: str, respaldo: Optional[Resolucion] = None) -> str:
+        """
+        Comprueba que la respuesta del LLM sea un ticker y la normaliza.
+
+        Args:
+            salida_llm (str): Texto devuelto por el LLM.
+            respaldo (Resolucion): Candidato local de baja confianza, usado si la respuesta no es válida.
+
+        Returns:
+            str: Ticker validado.
+
+        Raises:
+            ValueError: Si la respuesta no es un ticker y no hay candidato de respaldo.
+        """
+        lineas = salida_llm.strip().strip("`'\" ").splitlines()
+        fichas = lineas[0].split() if lineas else []
+        candidato = fichas[0].strip(".,;:'\"`").lstrip("$").upper() if fichas else ""
+
+        if candidato in self._nombres:
+            return candidato
+        # El LLM a veces responde con el nombre de la empresa en lugar del símbolo
+        resolucion = self.resolver(salida_llm)
+        if resolucion is not None and resolucion.confianza >= UMBRAL_CONFIANZA:
+            return resolucion.ticker
+        # Un símbolo desconocido solo se acepta si el LLM respondió únicamente con él
+        if len(fichas) == 1 and PATRON_TICKER.fullmatch(candidato):
+            print(f"Ticker {candidato} fuera del listado local, se acepta por formato")
+            return candidato
+        if respaldo is not None:
+            return respaldo.ticker
+        raise ValueError(f"La respuesta del LLM no es un ticker válido: {salida_llm!r}")
+
+
+@lru_cache(maxsize=1)
+def obtener_indice() -> IndiceSimbolos:
+    """
+    Devuelve el índice de símbolos del proceso, cargado una sola vez desde el listado incluido
+    (o desde la ruta de la variable de entorno TICKERS_CSV).
+    """
+    return IndiceSimbolos.desde_csv(os.getenv("TICKERS_CSV", RUTA_LISTADO))
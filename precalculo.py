@@ -0,0 +1,176 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class ContadorPopularidad:
+    """
+    Cuenta las peticiones por ticker con decaimiento exponencial: una petición pesa la mitad cada
+    `vida_media` segundos, así el ranking sigue a los tickers que se piden ahora.
+    """
+
+    def __init__(self, vida_media: float = 3600.0, max_tickers: int = 5000):
+        self.vida_media = vida_media
+        self.max_tickers = max_tickers
+        self._puntos: Dict[str, tuple] = {}  # ticker -> (puntuación, instante de la puntuación)
+        self._candado = threading.Lock()
+
+    def _decaer(self, puntos: float, desde: float, ahora: float) -> float:
+        return puntos * math.pow(0.5, (ahora - desde) / self.vida_media)
+
+    def registrar(self, ticker: str) -> None:
+        ahora = time.time()
+        with self._candado:
+            puntos, desde = self._puntos.get(ticker, (0.0, ahora))
+            self._puntos[ticker] = (self._decaer(puntos, desde, ahora) + 1.0, ahora)
+            if len(self._puntos) > self.max_tickers:
+                # Se olvidan los tickers con menos peso
+                for olvidado in self.top(len(self._puntos), _bloqueado=True)[self.max_tickers // 2:]:
+                    del self._puntos[olvidado]
+
+    def top(self, n: int, _bloqueado: bool = False) -> List[str]:
+        """
+        Los `n` tickers con más peso en este momento.
+        """
+        ahora = time.time()
+        if _bloqueado:
+            puntos = dict(self._puntos)
+        else:
+            with self._candado:
+                puntos = dict(self._puntos)
+        ordenados = sorted(puntos, key=lambda t: self._decaer(*puntos[t], ahora), reverse=True)
+        return ordenados[:n]
+
+
+class PresupuestoLLM:
+    """
+    Límite de llamadas al LLM en una ventana deslizante de una hora.
+    """
+
+    def __init__(self, llamadas_por_hora: int):
+        self.llamadas_por_hora = llamadas_por_hora
+        self._llamadas: deque = deque()
+        self._candado = threading.Lock()
+
+    def _limpiar(self, ahora: float) -> None:
+        while self._llamadas and self._llamadas[0] <= ahora - 3600:
+            self._llamadas.popleft()
+
+    def reservar(self, llamadas: int = 1) -> bool:
+        """
+        Reserva `llamadas` si caben en la última hora; si no, no reserva nada.
+        """
+        ahora = time.time()
+        with self._candado:
+            self._limpiar(ahora)
+            if len(self._llamadas) + llamadas > self.llamadas_por_hora:
+                return False
+            self._llamadas.extend([ahora] * llamadas)
+            return True
+
+    def usadas(self) -> int:
+        with self._candado:
+            self._limpiar(time.time())
+            return len(self._llamadas)
+
+
+class Planificador:
+    """
+    Recalcula en segundo plano los reportes de los tickers más pedidos, para servirlos desde caché.
+
+    En cada ciclo toma los `top_n` tickers del contador y, escalonados con un retardo aleatorio,
+    regenera su reporte completo si queda presupuesto de LLM o, si no, solo precalienta sus precios
+    y noticias.
+    """
+
+    def __init__(
+        self,
+        contador: ContadorPopularidad,
+        regenerar: Callable[[str], Awaitable[None]],
+        precalentar: Callable[[str], Awaitable[None]],
+        presupuesto: PresupuestoLLM,
+        llamadas_por_reporte: int = 1,
+        top_n: Optional[int] = None,
+        intervalo: Optional[float] = None,
+        jitter: Optional[float] = None,
+    ):
+        """
+        Args:
+            contador (ContadorPopularidad): Peticiones por ticker.
+            regenerar (Callable): Corrutina que calcula y guarda el reporte completo de un ticker.
+            precalentar (Callable): Corrutina que solo refresca precios y noticias (sin LLM).
+            presupuesto (PresupuestoLLM): Llamadas al LLM por hora que puede gastar el planificador.
+            llamadas_por_reporte (int): Llamadas al LLM que cuesta un reporte.
+            top_n (int): Tickers que se recalculan en cada ciclo (PRECALCULO_TOP_N, por defecto 20).
+            intervalo (float): Segundos entre ciclos (PRECALCULO_INTERVALO, por defecto 600).
+            jitter (float): Retardo aleatorio máximo de cada ticker dentro del ciclo, y variación del
+                intervalo (PRECALCULO_JITTER, por defecto 60).
+        """
+        self.contador = contador
+        self.regenerar = regenerar
+        self.precalentar = precalentar
+        self.presupuesto = presupuesto
+        self.llamadas_por_reporte = llamadas_por_reporte
+        self.top_n = top_n if top_n is not None else int(os.getenv("PRECALCULO_TOP_N", "20"))
+        self.intervalo = intervalo or float(os.getenv("PRECALCULO_INTERVALO", "600"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("PRECALCULO_JITTER", "60"))
+        self._tarea: Optional[asyncio.Task] = None
+        self._contadores = {"ciclos": 0, "reportes": 0, "solo_datos": 0, "errores": 0, "servidos": 0}
+
+    async def _refrescar(self, ticker: str, retardo: float) -> None:
+        await asyncio.sleep(retardo)
+        try:
+            if self.presupuesto.reservar(self.llamadas_por_reporte):
+                await self.regenerar(ticker)
+                self._contadores["reportes"] += 1
+            else:
+                # Sin presupuesto de LLM: al menos la siguiente petición no espera a la red
+                await self.precalentar(ticker)
+                self._contadores["solo_datos"] += 1
+        except Exception as e:
+            self._contadores["errores"] += 1
+            print(f"Error recalculando el reporte de {ticker}: {e}")
+
+    async def ciclo(self) -> None:
+        """
+        Recalcula una vez los tickers más pedidos, escalonados dentro de la ventana de jitter.
+        """
+        tickers = self.contador.top(self.top_n)
+        self._contadores["ciclos"] += 1
+        if tickers:
+            # Los más pedidos, primero: si el presupuesto se agota, se quedan sin reporte los de la cola
+            retardos = sorted(random.uniform(0, self.jitter) for _ in tickers)
+            await asyncio.gather(*(self._refrescar(t, r) for t, r in zip(tickers, retardos)))
+
+    async def _bucle(self) -> None:
+        # El primer ciclo espera también: al arrancar todavía no hay peticiones que contar
+        while True:
+            await asyncio.sleep(max(1.0, self.intervalo + random.uniform(-self.jitter, self.jitter)))
+            await self.ciclo()
+
+    def arrancar(self) -> None:
+        if self.top_n > 0 and self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    def parar(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    def servido(self) -> None:
+        """
+        Anota una petición atendida con un reporte precalculado.
+        """
+        self._contadores["servidos"] += 1
+
+    def estadisticas(self) -> dict:
+        return {
+            **self._contadores,
+            "llamadas_llm_ultima_hora": self.presupuesto.usadas(),
+            "presupuesto_llm_por_hora": self.presupuesto.llamadas_por_hora,
+        }
@@ -0,0 +1,118 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Puntos que se envían al navegador por serie: más de los que caben en el ancho de la gráfica no se ven
+MAX_PUNTOS = int(os.getenv("GRAFICOS_MAX_PUNTOS", "1000"))
+
+# Velas candidatas, de la más fina a la más gruesa: minutos para series intradía y periodos de pandas
+MINUTOS_INTRADIA = [5, 15, 30, 60, 120, 240]
+PERIODOS = ["D", "W", "M", "Q", "Y"]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, objetivo: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: elige `objetivo` puntos de la serie que conservan su forma visual.
+
+    Args:
+        x (np.ndarray): Abscisas crecientes (por ejemplo, milisegundos desde epoch).
+        y (np.ndarray): Valores de la serie, sin NaN.
+        objetivo (int): Número de puntos a conservar (al menos 3).
+
+    Returns:
+        np.ndarray: Índices de los puntos elegidos, en orden creciente; incluye el primero y el último.
+    """
+    n = len(y)
+    if objetivo >= n or objetivo < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # Cubos entre el primer y el último punto, que siempre se conservan
+    bordes = np.linspace(1, n - 1, objetivo - 1).astype(np.int64)
+    elegidos = np.empty(objetivo, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+
+    anterior = 0
+    for i in range(objetivo - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Vértice C del triángulo: la media del cubo siguiente (o el último punto)
+        siguiente_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        cx = x[fin:siguiente_fin].mean() if siguiente_fin > fin else x[-1]
+        cy = y[fin:siguiente_fin].mean() if siguiente_fin > fin else y[-1]
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs((ax - cx) * (y[inicio:fin] - ay) - (ax - x[inicio:fin]) * (cy - ay))
+        anterior = inicio + int(areas.argmax())
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+def _cubos(indice: pd.DatetimeIndex, objetivo: int) -> Optional[np.ndarray]:
+    """
+    Etiqueta cada barra con la vela agregada a la que pertenece, usando la vela más fina que no supere
+    `objetivo` velas en total.
+    """
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    intradia = len(indice) > 1 and (np.diff(indice.asi8[:1000]).min() < pd.Timedelta(days=1).value)
+
+    candidatos: List[Tuple[str, object]] = []
+    if intradia:
+        candidatos += [("minutos", m) for m in MINUTOS_INTRADIA]
+    candidatos += [("periodo", p) for p in (PERIODOS if intradia else PERIODOS[1:])]
+
+    for tipo, paso in candidatos:
+        if tipo == "minutos":
+            etiquetas = indice.floor(f"{paso}min").asi8
+        else:
+            etiquetas = indice.to_period(paso).asi8
+        if len(np.unique(etiquetas)) <= objetivo:
+            return etiquetas
+    return None
+
+
+def remuestrear_ohlc(df: pd.DataFrame, objetivo: int = MAX_PUNTOS, columnas_ultimo: Tuple[str, ...] = ()) -> pd.DataFrame:
+    """
+    Agrupa las barras OHLCV en velas semanales, mensuales, etc. (o de N minutos en series intradía)
+    hasta no superar `objetivo` velas.
+
+    Args:
+        df (pd.DataFrame): Columnas Open, High, Low, Close y Volume, con índice de fechas ordenado.
+        objetivo (int): Número máximo de velas.
+        columnas_ultimo (tuple): Columnas calculadas sobre los datos completos (medias móviles) de
+            las que se conserva el último valor de cada vela, en paso con el cierre.
+
+    Returns:
+        pd.DataFrame: Las velas agregadas, indexadas por la fecha de su primera barra. Si la serie ya
+        cabe en el objetivo se devuelve sin cambios.
+    """
+    if len(df) <= objetivo:
+        return df
+    etiquetas = _cubos(pd.DatetimeIndex(df.index), objetivo)
+    if etiquetas is None:
+        return df
+
+    agregado = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+    agregado.update({columna: "last" for columna in columnas_ultimo})
+    velas = df.groupby(etiquetas, sort=True).agg(agregado)
+    # Las etiquetas no decrecen (índice ordenado): la primera aparición de cada una abre su vela
+    _, primeras = np.unique(etiquetas, return_index=True)
+    velas.index = df.index[primeras]
+    return velas
+
+
+def reducir_linea(df: pd.DataFrame, columna: str, objetivo: int = MAX_PUNTOS) -> pd.DataFrame:
+    """
+    Reduce una serie de líneas con LTTB sobre `columna` y toma las mismas filas de las demás columnas
+    (medias móviles, volumen), para que todas las trazas sigan alineadas.
+    """
+    if len(df) <= objetivo:
+        return df
+    validos = df[df[columna].notna()]
+    indice = pd.DatetimeIndex(validos.index)
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    elegidos = lttb(indice.asi8.astype("float64"), validos[columna].to_numpy(dtype="float64"), objetivo)
+    return validos.iloc[elegidos]
@@ -0,0 +1,51 @@
+import uuid
+
+from almacen_graficos import crear_almacen_graficos
+from almacen_resultados import crear_almacen
+from model.ai_model import registro_marcos
+from utils import generar_graficos
+
+# Almacén de resultados con expulsión LRU/TTL, compartido entre workers (SQLite en modo WAL)
+cache = crear_almacen()
+# Figuras direccionadas por el hash de sus datos, con expulsión por antigüedad y tamaño en disco
+graficos = crear_almacen_graficos()
+
+
+def registrar_reporte(estado_final: dict, consulta: str) -> dict:
+    """
+    Genera la gráfica de un estado final, guarda el reporte en caché y devuelve los datos de respuesta.
+    Lo usan tanto el servidor como los procesos trabajadores de la cola.
+    """
+    # Preparar datos para la gráfica
+    try:
+        grafico_id = generar_graficos(
+            registro_marcos.obtener(estado_final["datos_financieros"]),
+            estado_final["ticker"],
+            graficos
+        )
+    except Exception as e:
+        print(f"Error generando gráficos: {e}")
+        grafico_id = None
+
+    reporte_texto = estado_final["respuesta_final"]
+
+    # Generar un ID único para esta consulta
+    reporte_id = str(uuid.uuid4())
+
+    # Guardar los datos en caché
+    cache.guardar(reporte_id, {
+        "reporte_texto": reporte_texto,
+        "ticker": estado_final.get("ticker") or "N/A",
+        "grafico_id": grafico_id,
+        "consulta": consulta
+    })
+
+    return {
+        "reporte_texto": reporte_texto,
+        "grafico_id": grafico_id,
+        "url_grafico": f"/graficos/{grafico_id}.html" if grafico_id else None,
+        "reporte_id": reporte_id,
+        "tiempos": estado_final.get("tiempos"),
+        # Partes que faltan porque su nodo agotó el plazo (p. ej. ["noticias"])
+        "parcial": estado_final.get("parcial") or [],
+    }
@@ -1,13 +1,16 @@
-import markdown
+import numpy as np
 import pandas as pd
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from bs4 import BeautifulSoup
-from textwrap import wrap
+from pathlib import Path
+from typing import Optional
 import os
 
+from almacen_graficos import AlmacenGraficos, crear_almacen_graficos
+from model.ohlcv import normalizar_ohlcv
+from maquetador_pdf import maquetar_markdown
+from remuestreo import MAX_PUNTOS, reducir_linea, remuestrear_ohlc
+
 def obtener_ruta_descargas(nombre_archivo):
     """
     Obtiene la ruta a la carpeta de descargas del sistema operativo y construye la ruta del archivo.
@@ -23,228 +26,134 @@ def obtener_ruta_descargas(nombre_archivo):
         descargas = str(Path.home() / "Downloads")
     
     return os.path.join(descargas, nombre_archivo)
+def renderizar_pdf(contenido_markdown: str) -> bytes:
+    """
+    Convierte contenido Markdown a un PDF en memoria respetando el formato básico de Markdown
+    (títulos, párrafos, listas, negritas, cursivas y código).
+
+    :param contenido_markdown: Texto en formato Markdown.
+    :return: Bytes del PDF.
+    """
+    return maquetar_markdown(contenido_markdown)
+
 def guardar_pdf(contenido_markdown, nombre_archivo="archivo.pdf"):
     """
-    Convierte contenido Markdown a un archivo PDF respetando el formato básico de Markdown.
+    Convierte contenido Markdown a un archivo PDF en la carpeta de descargas.
     
     :param contenido_markdown: Texto en formato Markdown.
     :param nombre_archivo: Nombre del archivo PDF de salida.
     """
     try:
-        # Convertir Markdown a HTML
-        contenido_html = markdown(contenido_markdown)
-        soup = BeautifulSoup(contenido_html, "html.parser")
-        
-        # Configurar el PDF con tamaño A4
         archivo_pdf = obtener_ruta_descargas(nombre_archivo)
-        pdf = canvas.Canvas(archivo_pdf, pagesize=A4)
-        ancho_pagina, alto_pagina = A4
-        
-        # Configurar márgenes
-        margen_izquierdo = 60
-        margen_derecho = ancho_pagina + 60
-        margen_superior = alto_pagina - 60
-        margen_inferior = 60
-        y = margen_superior
-
-        pdf.setFont("Helvetica", 10)
-
-        # Ancho del texto
-        ancho_texto = margen_derecho - margen_izquierdo
-
-        # Procesar cada elemento del HTML
-        for tag in soup.contents:
-            if y < margen_inferior:  # Si alcanza el margen inferior, crear nueva página
-                pdf.showPage()
-                pdf.setFont("Helvetica", 10)
-                y = margen_superior
-
-            if isinstance(tag, str):  # Si es solo texto, lo procesamos directamente
-                y = escribir_parrafo(pdf, tag, margen_izquierdo, ancho_texto, y, margen_inferior, tipo="p")
-            elif tag.name == "h1":
-                pdf.setFont("Helvetica-Bold", 14)
-                y = escribir_parrafo(pdf, tag, margen_izquierdo, ancho_texto, y, margen_inferior, tipo="h1")
-            elif tag.name == "h2":
-                pdf.setFont("Helvetica-Bold", 12)
-                y = escribir_parrafo(pdf, tag, margen_izquierdo, ancho_texto, y, margen_inferior, tipo="h2")
-            elif tag.name == "p":
-                pdf.setFont("Helvetica", 10)
-                y = escribir_parrafo(pdf, tag, margen_izquierdo, ancho_texto, y, margen_inferior, tipo="p")
-            elif tag.name == "ul":
-                for li in tag.find_all("li"):
-                    texto_lista = f"• {li.text}"
-                    y = escribir_parrafo(pdf, texto_lista, margen_izquierdo + 20, ancho_texto - 20, y, margen_inferior, tipo="li")
-        
-        pdf.save()
+        with open(archivo_pdf, "wb") as f:
+            f.write(renderizar_pdf(contenido_markdown))
         print(f"PDF generado correctamente: {archivo_pdf}")
     
     except Exception as e:
         print(f"Error al convertir el archivo: {e}")
 
-def escribir_parrafo(pdf, tag, x_inicial, ancho_texto, y, y_minimo, tipo="p", espacio_entre_lineas=14):
+def _fechas_binarias(indice: pd.Index) -> np.ndarray:
     """
-    Escribe un párrafo en el PDF respetando los márgenes y saltos de línea según el tipo de contenido Markdown,
-    incluyendo negritas y otros estilos.
-    
-    :param pdf: Objeto Canvas de ReportLab.
-    :param tag: Tag HTML a procesar (puede ser un párrafo, lista, etc.).
-    :param x_inicial: Coordenada x inicial (margen izquierdo).
-    :param ancho_texto: Ancho disponible para el texto.
-    :param y: Coordenada y actual.
-    :param y_minimo: Coordenada y mínima antes de un salto de página.
-    :param tipo: Tipo de elemento Markdown (párrafo, lista, etc.).
-    :param espacio_entre_lineas: Espaciado entre líneas.
-    :return: Nueva coordenada y.
+    Convierte el índice de fechas a milisegundos desde epoch (float64), que Plotly serializa como array
+    binario y dibuja en un eje de tipo fecha.
     """
-    # Si el tag es un objeto BeautifulSoup (un elemento HTML)
-    if isinstance(tag, str):
-        texto = tag
-    else:
-        # Manejar texto en negrita (strong, b)
-        if tag.name in ['strong', 'b']:
-            texto = f"**{tag.get_text()}**"
-            estilo = "Helvetica-Bold"
-        else:
-            texto = tag.get_text()
-            estilo = "Helvetica"
-    
-    lineas = wrap(texto, width=int(ancho_texto / 6))  # Aproximadamente 6 puntos por carácter
-    
-    for linea in lineas:
-        if y < y_minimo:  # Si no hay espacio suficiente, crear nueva página
-            pdf.showPage()
-            pdf.setFont("Helvetica", 10)
-            y = A4[1] - 100  # Reiniciar coordenada y en la nueva página
-        
-        # Ajustar el tipo de formato basado en el tipo de tag Markdown
-        if tipo == "h1":
-            x_inicial = (A4[0] - pdf.stringWidth(linea, "Helvetica-Bold", 14)) / 2  # Centrar título h1
-            pdf.setFont("Helvetica-Bold", 14)
-            pdf.drawString(x_inicial, y, linea)
-        elif tipo == "h2":
-            x_inicial = (A4[0] - pdf.stringWidth(linea, "Helvetica-Bold", 12)) / 2  # Centrar título h2
-            pdf.setFont("Helvetica-Bold", 12)
-            pdf.drawString(x_inicial, y, linea)
-        elif tipo == "li":
-            pdf.setFont("Helvetica", 10)
-            pdf.drawString(x_inicial, y, linea)  # Para las listas, ajustamos el margen izquierdo
-        else:
-            pdf.setFont(estilo, 10)
-            pdf.drawString(x_inicial, y, linea)
-
-        y -= espacio_entre_lineas  # Moverse a la siguiente línea
-
-    return y
-def generar_graficos(datos_financieros: pd.DataFrame, ticker: str) -> str:
-    import os
-    import plotly.graph_objects as go
-    from plotly.subplots import make_subplots
-
-    # Debug: Print column information
-    print(f"Columnas disponibles: {list(datos_financieros.columns)}")
-    print(f"Tipo de columnas: {type(datos_financieros.columns)}")
-
-    # Manejar MultiIndex columns correctamente
-    if isinstance(datos_financieros.columns, pd.MultiIndex):
-        print(f"MultiIndex detectado. Niveles: {datos_financieros.columns.nlevels}")
-        print(f"Nivel 0: {datos_financieros.columns.get_level_values(0).tolist()}")
-        print(f"Nivel 1: {datos_financieros.columns.get_level_values(1).tolist()}")
-
-        # Para yfinance, el primer nivel es el ticker y el segundo nivel son los nombres de las columnas
-        # Usar el segundo nivel (nivel 1) que contiene los nombres reales de las columnas
-        datos_financieros.columns = datos_financieros.columns.get_level_values(1)
-        print(f"Columnas después de MultiIndex: {list(datos_financieros.columns)}")
-
-    # Mapear nombres de columnas comunes que puede devolver yfinance
-    column_mapping = {
-        'Adj Close': 'Close',
-        'adj close': 'Close',
-        'open': 'Open',
-        'high': 'High',
-        'low': 'Low',
-        'close': 'Close',
-        'volume': 'Volume'
-    }
-
-    # Renombrar columnas si es necesario
-    datos_financieros = datos_financieros.rename(columns=column_mapping)
-
-    # Verificar columnas requeridas con más flexibilidad
-    columnas_requeridas = ['Open', 'High', 'Low', 'Close', 'Volume']
-    columnas_faltantes = []
+    indice = pd.DatetimeIndex(indice)
+    if indice.tz is not None:
+        indice = indice.tz_localize(None)
+    return indice.asi8.astype("float64") / 1e6
 
-    for columna in columnas_requeridas:
-        if columna not in datos_financieros.columns:
-            columnas_faltantes.append(columna)
 
-    if columnas_faltantes:
-        print(f"Columnas disponibles después del mapeo: {list(datos_financieros.columns)}")
-        print(f"Columnas faltantes: {columnas_faltantes}")
+def _clave_grafico(df: pd.DataFrame, ticker: str, columnas: list, tipo: str) -> str:
+    """
+    Clave de contenido de una figura: tipo, ticker, fechas y valores de las columnas dibujadas.
+    """
+    # Cada columna con su tipo y sin convertir: los arrays de las barras canónicas se leen sin copiarlos
+    valores = [np.ascontiguousarray(df[columna].to_numpy()) for columna in columnas]
+    return AlmacenGraficos.clave(
+        tipo.encode(), ticker.encode(), pd.DatetimeIndex(df.index).asi8, *valores
+    )
 
-        # Intentar usar solo las columnas disponibles para un gráfico más simple
-        if 'Close' in datos_financieros.columns or 'Adj Close' in datos_financieros.columns:
-            return generar_grafico_simple(datos_financieros, ticker)
-        else:
-            raise ValueError(f"No se pueden generar gráficos. Columnas faltantes: {columnas_faltantes}. Columnas disponibles: {list(datos_financieros.columns)}")
 
-    os.makedirs("./grafico", exist_ok=True)
+def generar_graficos(datos_financieros: pd.DataFrame, ticker: str, almacen: Optional[AlmacenGraficos] = None,
+                     max_puntos: int = MAX_PUNTOS) -> str:
+    """
+    Genera la figura de velas, medias móviles y volumen del ticker y la guarda en el almacén de gráficos.
+
+    :param datos_financieros: Barras OHLCV, preferiblemente ya canónicas (model/ohlcv.py); si no, se normalizan.
+    :param ticker: Símbolo bursátil.
+    :param almacen: Almacén de figuras (por defecto el configurado con las variables GRAFICOS_*).
+    :param max_puntos: Velas como máximo; las series más largas se agrupan en velas semanales,
+        mensuales, etc. (o de N minutos si son intradía).
+    :return: Clave de la figura en el almacén.
+    """
+    almacen = almacen or crear_almacen_graficos()
 
-    # Create a copy to avoid modifying the original DataFrame
-    df_copy = datos_financieros.copy()
+    # Barras en el esquema canónico (model/ohlcv.py): las que ya lo tienen se usan tal cual, sin
+    # copiarlas ni modificarlas; 'Close' está garantizada
+    datos_financieros = normalizar_ohlcv(datos_financieros)
 
-    # Calculate moving averages safely
-    try:
-        df_copy['MA20'] = df_copy['Close'].rolling(window=20).mean()
-        df_copy['MA50'] = df_copy['Close'].rolling(window=50).mean()
-    except Exception as e:
-        print(f"Error calculando medias móviles: {e}")
-        # If there's an error, create the moving averages as separate series
-        ma20 = df_copy['Close'].rolling(window=20).mean()
-        ma50 = df_copy['Close'].rolling(window=50).mean()
-    else:
-        ma20 = df_copy['MA20']
-        ma50 = df_copy['MA50']
+    columnas_requeridas = ['Open', 'High', 'Low', 'Close', 'Volume']
+    columnas_faltantes = [columna for columna in columnas_requeridas if columna not in datos_financieros.columns]
+    if columnas_faltantes:
+        print(f"Columnas faltantes: {columnas_faltantes}; se genera un gráfico simple")
+        return generar_grafico_simple(datos_financieros, ticker, almacen, max_puntos)
+
+    # Misma ventana de datos, misma figura: se reutiliza sin volver a construirla
+    clave = _clave_grafico(datos_financieros, ticker, columnas_requeridas, f"velas:{max_puntos}")
+    if almacen.existe(clave):
+        return clave
+
+    # Medias móviles sobre todas las barras (en float64); después se agrupan en paso con las velas.
+    # Las barras no se tocan: las medias van en un marco nuevo junto a las columnas que se dibujan
+    cierre = datos_financieros['Close'].astype("float64")
+    df_grafico = datos_financieros[columnas_requeridas].assign(
+        MA20=cierre.rolling(window=20).mean(),
+        MA50=cierre.rolling(window=50).mean(),
+    )
+    df_grafico = remuestrear_ohlc(df_grafico, max_puntos, columnas_ultimo=('MA20', 'MA50'))
+
+    fechas = _fechas_binarias(df_grafico.index)
 
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
                         vertical_spacing=0.02,
                         subplot_titles=(f'Gráfico de Velas de {ticker}', 'Volumen'),
                         row_heights=[0.7, 0.3])
 
+    # Precios y volumen en float32: la mitad de bytes y precisión de sobra para dibujar
     fig.add_trace(go.Candlestick(
-        x=df_copy.index,
-        open=df_copy['Open'],
-        high=df_copy['High'],
-        low=df_copy['Low'],
-        close=df_copy['Close'],
+        x=fechas,
+        open=df_grafico['Open'].to_numpy(dtype="float32"),
+        high=df_grafico['High'].to_numpy(dtype="float32"),
+        low=df_grafico['Low'].to_numpy(dtype="float32"),
+        close=df_grafico['Close'].to_numpy(dtype="float32"),
         name='Velas'), row=1, col=1)
 
-    fig.add_trace(go.Scatter(x=df_copy.index,
-                             y=ma20,
+    fig.add_trace(go.Scatter(x=fechas,
+                             y=df_grafico['MA20'].to_numpy(dtype="float32"),
                              mode='lines', name='MA 20 días'), row=1, col=1)
 
-    fig.add_trace(go.Scatter(x=df_copy.index,
-                             y=ma50,
+    fig.add_trace(go.Scatter(x=fechas,
+                             y=df_grafico['MA50'].to_numpy(dtype="float32"),
                              mode='lines', name='MA 50 días'), row=1, col=1)
 
-    fig.add_trace(go.Bar(x=df_copy.index,
-                         y=df_copy['Volume'],
+    fig.add_trace(go.Bar(x=fechas,
+                         y=df_grafico['Volume'].to_numpy(dtype="float32"),
                          showlegend=False), row=2, col=1)
 
     fig.update_layout(title=f'Análisis Financiero de {ticker}',
                       xaxis_rangeslider_visible=False)
+    fig.update_xaxes(type='date')
 
-    ruta_html = f"./grafico/{ticker}_analisis_financiero.html"
-    fig.write_html(ruta_html)
-    return ruta_html
+    almacen.guardar(clave, fig.to_json())
+    return clave
 
-def generar_grafico_simple(datos_financieros: pd.DataFrame, ticker: str) -> str:
+def generar_grafico_simple(datos_financieros: pd.DataFrame, ticker: str, almacen: Optional[AlmacenGraficos] = None,
+                           max_puntos: int = MAX_PUNTOS) -> str:
     """
-    Genera un gráfico simple cuando no están disponibles todas las columnas OHLCV.
+    Genera un gráfico simple cuando no están disponibles todas las columnas OHLCV. Las series de más
+    de `max_puntos` puntos se reducen con LTTB.
     """
-    import os
-    import plotly.graph_objects as go
-
-    os.makedirs("./grafico", exist_ok=True)
+    almacen = almacen or crear_almacen_graficos()
 
     fig = go.Figure()
 
@@ -256,37 +165,52 @@ def generar_grafico_simple(datos_financieros: pd.DataFrame, ticker: str) -> str:
         price_column = 'Adj Close'
 
     if price_column:
-        # Create a copy to avoid modifying the original DataFrame
-        df_copy = datos_financieros.copy()
-
-        # Calculate moving averages safely
-        ma20 = df_copy[price_column].rolling(window=20).mean()
-        ma50 = df_copy[price_column].rolling(window=50).mean()
+        clave = _clave_grafico(datos_financieros, ticker, [price_column], f"simple:{max_puntos}")
+        if almacen.existe(clave):
+            return clave
+
+        # Medias móviles sobre toda la serie; LTTB elige los puntos del precio y las medias toman los mismos
+        precio = datos_financieros[price_column].astype("float64")
+        df_grafico = pd.DataFrame({
+            price_column: precio,
+            'MA20': precio.rolling(window=20).mean(),
+            'MA50': precio.rolling(window=50).mean(),
+        })
+        df_grafico = reducir_linea(df_grafico, price_column, max_puntos)
+
+        fechas = _fechas_binarias(df_grafico.index)
+        precio = df_grafico[price_column]
+        ma20 = df_grafico['MA20']
+        ma50 = df_grafico['MA50']
 
         fig.add_trace(go.Scatter(
-            x=df_copy.index,
-            y=df_copy[price_column],
+            x=fechas,
+            y=precio.to_numpy(dtype="float32"),
             mode='lines',
             name=f'Precio de {price_column}',
             line=dict(color='blue')
         ))
 
         fig.add_trace(go.Scatter(
-            x=df_copy.index,
-            y=ma20,
+            x=fechas,
+            y=ma20.to_numpy(dtype="float32"),
             mode='lines',
             name='MA 20 días',
             line=dict(color='orange')
         ))
 
         fig.add_trace(go.Scatter(
-            x=df_copy.index,
-            y=ma50,
+            x=fechas,
+            y=ma50.to_numpy(dtype="float32"),
             mode='lines',
             name='MA 50 días',
             line=dict(color='red')
         ))
     else:
+        clave = AlmacenGraficos.clave(b"vacio", ticker.encode())
+        if almacen.existe(clave):
+            return clave
+
         # Si no hay columnas de precio, crear un gráfico vacío con mensaje
         fig.add_annotation(
             text=f"No hay datos de precio disponibles para {ticker}",
@@ -300,9 +224,9 @@ def generar_grafico_simple(datos_financieros: pd.DataFrame, ticker: str) -> str:
         title=f'Análisis de Precio de {ticker}',
         xaxis_title='Fecha',
         yaxis_title='Precio ($)',
-        hovermode='x unified'
+        hovermode='x unified',
+        xaxis_type='date'
     )
 
-    ruta_html = f"./grafico/{ticker}_analisis_financiero.html"
-    fig.write_html(ruta_html)
-    return ruta_html
\ No newline at end of file
+    almacen.guardar(clave, fig.to_json())
+    return clave